@@ -0,0 +1,212 @@
+"""Columnar analytics across all users and years with NumPy.
+
+The report functions aggregate one user's month or year in SQL. For
+whole-ledger questions, such as trends across years, rolling averages or
+the spread of amounts per category, load_ledger() pulls the transactions
+into NumPy arrays once, a chunk at a time, and the functions here
+aggregate those arrays with vectorized grouping:
+
+    ledger = load_ledger('finance.db')
+    trends = yearly_trends(ledger)
+    spending = rolling_average(ledger, window=3)
+    spread = category_percentiles(ledger)
+
+Amounts stay integer cents throughout, so totals are exact.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+
+from database import connection, transaction_source
+from models import CategoryPercentiles, CategoryTrend, RollingTotal
+from money import Money
+
+DEFAULT_CHUNK_SIZE = 100_000
+
+# Whole days since 1970-01-01 of a stored 'YYYY-MM-DD HH:MM:SS' date
+DAYS_SQL = "CAST(julianday(substr(date, 1, 10)) - 2440587.5 AS INTEGER)"
+
+
+@dataclass
+class Ledger:
+    """Transactions as parallel column arrays, one element per transaction"""
+    days: np.ndarray
+    user_ids: np.ndarray
+    category_ids: np.ndarray
+    amounts: np.ndarray
+    category_names: dict
+    category_types: dict
+
+    def __len__(self):
+        return len(self.amounts)
+
+    def months(self):
+        """Months since 1970-01 of each transaction"""
+        return self.days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+
+    def years(self):
+        """Calendar year of each transaction"""
+        return self.days.astype('datetime64[D]').astype('datetime64[Y]').astype(np.int64) + 1970
+
+    def of_type(self, kind):
+        """Mask of the transactions whose category has the given type"""
+        ids = [category_id for category_id, type_ in self.category_types.items() if type_ == kind]
+        return np.isin(self.category_ids, ids)
+
+    def select(self, mask):
+        """Return a Ledger of the transactions where mask is True"""
+        return Ledger(self.days[mask], self.user_ids[mask], self.category_ids[mask],
+                      self.amounts[mask], self.category_names, self.category_types)
+
+
+def load_ledger(db_file=None, user_ids=None, start_date=None, end_date=None,
+                chunk_size=DEFAULT_CHUNK_SIZE):
+    """Load transactions into a Ledger, fetching chunk_size rows at a time.
+
+    Dates become int64 days since 1970-01-01, user and category ids int32
+    and amounts int64 cents. Optionally limited to some users and to the
+    half-open date range [start_date, end_date).
+    """
+    conditions = []
+    params = []
+    if user_ids is not None:
+        conditions.append(f"user_id IN ({', '.join('?' * len(user_ids))})")
+        params.extend(user_ids)
+    if start_date is not None:
+        conditions.append("date >= ?")
+        params.append(start_date)
+    if end_date is not None:
+        conditions.append("date < ?")
+        params.append(end_date)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+
+    with connection(db_file) as conn:
+        # One read transaction, so the count and the rows agree
+        conn.execute('BEGIN')
+        try:
+            categories = conn.execute('SELECT id, name, type FROM categories').fetchall()
+            # Archived years in range are read from their own tables
+            source = transaction_source(conn, start_date, end_date)
+            total = conn.execute(f'SELECT COUNT(*) FROM {source}{where}', params).fetchone()[0]
+            days = np.empty(total, np.int64)
+            users = np.empty(total, np.int32)
+            category_ids = np.empty(total, np.int32)
+            amounts = np.empty(total, np.int64)
+
+            cursor = conn.execute(
+                f'SELECT {DAYS_SQL}, user_id, category_id, amount FROM {source}{where}', params)
+            filled = 0
+            while filled < total:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                block = np.array(rows, dtype=np.int64)
+                end = filled + len(block)
+                days[filled:end] = block[:, 0]
+                users[filled:end] = block[:, 1]
+                category_ids[filled:end] = block[:, 2]
+                amounts[filled:end] = block[:, 3]
+                filled = end
+        finally:
+            conn.rollback()
+
+    return Ledger(days[:filled], users[:filled], category_ids[:filled], amounts[:filled],
+                  {row[0]: row[1] for row in categories}, {row[0]: row[2] for row in categories})
+
+
+def _group_sums(keys, values, size):
+    """Sum int64 values per integer key in [0, size) without going through floats"""
+    totals = np.zeros(size, np.int64)
+    np.add.at(totals, keys, values)
+    return totals
+
+
+def yearly_trends(ledger, kind=None):
+    """Total per category per year, with the change from the previous year.
+
+    Covers every year from the first to the last transaction for each
+    category that has any, so gaps show up as zero totals. change is the
+    fractional change from the year before, or None for the first year or
+    after a zero year. kind limits it to 'income' or 'expense' categories.
+    """
+    if kind is not None:
+        ledger = ledger.select(ledger.of_type(kind))
+    if not len(ledger):
+        return []
+
+    years = ledger.years()
+    first_year = int(years.min())
+    span = int(years.max()) - first_year + 1
+    keys = ledger.category_ids.astype(np.int64) * span + (years - first_year)
+    size = (int(ledger.category_ids.max()) + 1) * span
+    totals = _group_sums(keys, ledger.amounts, size).reshape(-1, span)
+    counts = np.bincount(keys, minlength=size).reshape(-1, span)
+
+    trends = []
+    for category_id in np.flatnonzero(counts.sum(axis=1)):
+        name = ledger.category_names.get(int(category_id), str(category_id))
+        previous = None
+        for offset in range(span):
+            total = int(totals[category_id, offset])
+            change = (total - previous) / previous if previous else None
+            trends.append(CategoryTrend(name, first_year + offset, Money(total),
+                                        int(counts[category_id, offset]), change))
+            previous = total
+    trends.sort(key=lambda trend: (trend.category, trend.year))
+    return trends
+
+
+def rolling_average(ledger, window=3, kind='expense'):
+    """Monthly totals with the average of the last `window` months.
+
+    Months run from the first to the last transaction with no gaps. The
+    first window - 1 months average over the months available so far.
+    """
+    if kind is not None:
+        ledger = ledger.select(ledger.of_type(kind))
+    if not len(ledger):
+        return []
+
+    months = ledger.months()
+    first_month = int(months.min())
+    totals = _group_sums(months - first_month, ledger.amounts, int(months.max()) - first_month + 1)
+
+    running = np.concatenate(([0], np.cumsum(totals)))
+    index = np.arange(len(totals))
+    start = np.maximum(index + 1 - window, 0)
+    averages = np.rint((running[index + 1] - running[start]) / (index + 1 - start)).astype(np.int64)
+
+    return [RollingTotal(1970 + month // 12, month % 12 + 1, Money(int(total)), Money(int(average)))
+            for month, total, average in zip(range(first_month, first_month + len(totals)),
+                                             totals.tolist(), averages.tolist())]
+
+
+def category_percentiles(ledger, percentiles=(50, 90, 99), kind=None):
+    """Percentiles of transaction amounts per category.
+
+    Uses linear interpolation between the closest ranks, as
+    numpy.percentile does, rounded to whole cents.
+    """
+    if kind is not None:
+        ledger = ledger.select(ledger.of_type(kind))
+    if not len(ledger):
+        return []
+
+    order = np.lexsort((ledger.amounts, ledger.category_ids))
+    amounts = ledger.amounts[order]
+    category_ids, starts, counts = np.unique(ledger.category_ids[order], return_index=True,
+                                             return_counts=True)
+
+    fractions = np.asarray(percentiles, dtype=np.float64) / 100
+    positions = starts[:, None] + fractions[None, :] * (counts[:, None] - 1)
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.ceil(positions).astype(np.int64)
+    values = amounts[lower] + (amounts[upper] - amounts[lower]) * (positions - lower)
+    values = np.rint(values).astype(np.int64)
+
+    results = [CategoryPercentiles(ledger.category_names.get(int(category_id), str(category_id)),
+                                   int(count),
+                                   {p: Money(int(value)) for p, value in zip(percentiles, row)})
+               for category_id, count, row in zip(category_ids, counts, values)]
+    results.sort(key=lambda result: result.category)
+    return results
\ No newline at end of file
@@ -0,0 +1,161 @@
+"""Move the transactions of closed years out of the ledger into per-year tables.
+
+Usage:
+
+    python archive.py compact YEAR [--db finance.db] [--batch 1000] [--pause 0.05]
+    python archive.py status [--db finance.db]
+
+Reports mostly read recent months, but the ledger, its indexes and its
+search index grow with every year recorded. compact moves one closed year
+into transactions_<year> in the same database file, in batches of
+`batch` transactions, each in one short transaction, sleeping `pause`
+seconds in between so the app keeps writing while it runs. It is safe to
+interrupt and run again, which carries on where it stopped.
+
+Once a year's move starts, the year is closed: adding a transaction dated
+in it, or changing a transaction's date to it, fails, and transactions
+already moved can no longer be edited or deleted; recurring rules cannot
+start in it and skip their occurrences that fall in it. Moved
+transactions keep their ids. Reads route by date (see database.transaction_partitions):
+get_transactions_page() and list_transactions() read the ledger and only
+the archived years their dates reach, analytics and backups count every
+year, and reports read monthly_rollups, which keep the totals of archived
+years. Transaction search covers the ledger only.
+
+Archive a year only once every sync peer has its changes, as a change
+that arrives for an archived year fails the pull. Sharded deployments
+cannot be rebalanced once a shard has archived a year, as rebalance moves
+the ledger alone; rebalance first.
+"""
+import argparse
+import sys
+import time
+from datetime import datetime
+from sqlite3 import Error
+
+from database import TRANSACTION_COLUMNS, connection, create_archive_table, migrate, year_range
+
+DEFAULT_BATCH = 1000
+DEFAULT_PAUSE = 0.05
+
+COLUMNS = ', '.join(TRANSACTION_COLUMNS)
+
+
+def _move_batch(cursor, table, start, end, after, batch_size):
+    """Move up to batch_size transactions dated in [start, end) with ids above after.
+
+    Returns (moved, highest id moved). The ledger has no index on date
+    alone, so batches walk it in id order from where the last one stopped
+    and the whole move reads the ledger once.
+    """
+    cursor.execute('''
+    CREATE TEMP TABLE IF NOT EXISTS archive_batch (
+        id INTEGER PRIMARY KEY, user_id INTEGER, category_id INTEGER, amount INTEGER,
+        description TEXT, date TEXT
+    )
+    ''')
+    cursor.execute(f'''
+    INSERT INTO archive_batch ({COLUMNS})
+    SELECT {COLUMNS} FROM transactions
+    WHERE id > ? AND date >= ? AND date < ?
+    ORDER BY id
+    LIMIT ?
+    ''', (after, start, end, batch_size))
+    moved = cursor.rowcount
+    if moved:
+        cursor.execute(f'INSERT INTO {table} ({COLUMNS}) SELECT {COLUMNS} FROM archive_batch')
+        # Moved, not deleted: the change log triggers stay silent, as they
+        # do while sync applies changes
+        cursor.execute('UPDATE sync_node SET applying = 1')
+        cursor.execute('DELETE FROM transactions WHERE id IN (SELECT id FROM archive_batch)')
+        cursor.execute('UPDATE sync_node SET applying = 0')
+        # The rollup triggers took the rows out of monthly_rollups; put
+        # them back, so reports still cover the year
+        cursor.execute('''
+        INSERT INTO monthly_rollups (user_id, year, month, category_id, total, count)
+        SELECT user_id, CAST(substr(date, 1, 4) AS INTEGER), CAST(substr(date, 6, 2) AS INTEGER),
+               category_id, SUM(amount), COUNT(*)
+        FROM archive_batch
+        WHERE true
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT (user_id, year, month, category_id)
+        DO UPDATE SET total = total + excluded.total, count = count + excluded.count
+        ''')
+        after = cursor.execute('SELECT MAX(id) FROM archive_batch').fetchone()[0]
+        cursor.execute('DELETE FROM archive_batch')
+    return moved, after
+
+
+def compact_year(year, batch_size=DEFAULT_BATCH, pause=DEFAULT_PAUSE, progress=None, db_file=None):
+    """Move a closed year's transactions to its archive table; returns the number moved.
+
+    progress, if given, is called with the number moved so far after each
+    batch. Raises ValueError for the current year or a later one.
+    """
+    if year >= datetime.now().year:
+        raise ValueError(f"{year} is not over yet; only closed years can be archived")
+    start, end = year_range(year)
+
+    with connection(db_file) as conn:
+        # Older databases get the archive, rollups and change log first
+        migrate(conn)
+        table = create_archive_table(conn, year)
+        conn.execute('INSERT OR IGNORE INTO archived_years (year) VALUES (?)', (year,))
+
+    moved = 0
+    after = 0
+    while True:
+        with connection(db_file) as conn:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            count, after = _move_batch(cursor, table, start, end, after, batch_size)
+            cursor.execute('UPDATE archived_years SET moved = moved + ? WHERE year = ?', (count, year))
+            # No transaction can enter the year any more, so a short batch
+            # means the ledger has none of them left
+            if count < batch_size:
+                cursor.execute('UPDATE archived_years SET complete = 1 WHERE year = ?', (year,))
+        moved += count
+        if progress:
+            progress(moved)
+        if count < batch_size:
+            return moved
+        time.sleep(pause)
+
+
+def archive_status(db_file=None):
+    """Return (year, complete, transactions moved) for each archived year, oldest first"""
+    try:
+        with connection(db_file) as conn:
+            migrate(conn)
+            return conn.execute('SELECT year, complete, moved FROM archived_years ORDER BY year').fetchall()
+    except Error as e:
+        print(f"Error reading the archive: {e}")
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['compact', 'status'])
+    parser.add_argument('year', nargs='?', type=int, help="year to archive, for compact")
+    parser.add_argument('--db', dest='db_file', default=None)
+    parser.add_argument('--batch', type=int, default=DEFAULT_BATCH)
+    parser.add_argument('--pause', type=float, default=DEFAULT_PAUSE)
+    args = parser.parse_args()
+
+    if args.command == 'status':
+        for year, complete, moved in archive_status(args.db_file):
+            print(f"{year}  {'archived' if complete else 'in progress':12} {moved} transactions")
+        return
+    if args.year is None:
+        parser.error("compact needs a year")
+    try:
+        moved = compact_year(args.year, args.batch, args.pause,
+                             lambda n: print(f"\r{n} transactions moved", end='', flush=True), args.db_file)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    print(f"\r{args.year} archived; {moved} transactions moved.")
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -1,69 +1,176 @@
 import sqlite3
 import hashlib
-from database import create_connection
+import hmac
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from sqlite3 import Error
+from database import connection
 
-def hash_password(password):
-    """Hash a password for storing."""
-    return hashlib.sha256(password.encode()).hexdigest()
+# PBKDF2 cost. Raising it makes each login slower; stored hashes with a
+# different cost are upgraded the next time their owner logs in.
+PBKDF2_ITERATIONS = 200_000
+HASH_ALGORITHM = 'pbkdf2_sha256'
 
-def register_user(username, password):
+SESSION_TTL = 30 * 60
+MAX_SESSIONS = 10_000
+
+def hash_password(password, iterations=None):
+    """Hash a password with a random salt for storing."""
+    iterations = iterations or PBKDF2_ITERATIONS
+    salt = secrets.token_hex(16)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), iterations)
+    return f"{HASH_ALGORITHM}${iterations}${salt}${digest.hex()}"
+
+def _is_legacy_hash(stored):
+    """Unsalted SHA-256 hex digests written before PBKDF2 was used"""
+    return '$' not in stored
+
+def verify_password(password, stored):
+    """Check a password against a stored hash in either format."""
+    if _is_legacy_hash(stored):
+        candidate = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(candidate, stored)
+
+    parts = stored.split('$')
+    if len(parts) != 4 or parts[0] != HASH_ALGORITHM:
+        return False
+    _, iterations, salt, expected = parts
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), int(iterations))
+    return hmac.compare_digest(digest.hex(), expected)
+
+def needs_rehash(stored):
+    """True when a stored hash is legacy or uses a different cost."""
+    if _is_legacy_hash(stored):
+        return True
+    return int(stored.split('$')[1]) != PBKDF2_ITERATIONS
+
+
+class SessionCache:
+    """Maps session tokens to user ids until they expire.
+
+    Validating a token is a dictionary lookup, so authenticated operations
+    after login never pay for the password KDF again.
+    """
+
+    def __init__(self, ttl=SESSION_TTL, max_size=MAX_SESSIONS, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, user_id):
+        token = secrets.token_urlsafe(32)
+        with self._lock:
+            self._evict_expired()
+            while len(self._sessions) >= self.max_size:
+                self._sessions.popitem(last=False)
+            self._sessions[token] = (user_id, self.clock() + self.ttl)
+        return token
+
+    def get(self, token):
+        """Return the user id for a live token, or None"""
+        with self._lock:
+            entry = self._sessions.get(token)
+            if entry is None or entry[1] <= self.clock():
+                self._sessions.pop(token, None)
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def revoke(self, token):
+        with self._lock:
+            self._sessions.pop(token, None)
+
+    def revoke_user(self, user_id):
+        with self._lock:
+            for token in [t for t, (uid, _) in self._sessions.items() if uid == user_id]:
+                del self._sessions[token]
+
+    def _evict_expired(self):
+        # Entries are kept in creation order, so expired ones sit at the front
+        now = self.clock()
+        while self._sessions:
+            token, (_, expires) = next(iter(self._sessions.items()))
+            if expires > now:
+                break
+            del self._sessions[token]
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+sessions = SessionCache()
+
+def register_user(username, password, db_file=None):
     """Register a new user"""
-    conn = create_connection()
-    if conn is not None:
-        try:
+    try:
+        with connection(db_file) as conn:
             cursor = conn.cursor()
             hashed_pw = hash_password(password)
             cursor.execute('INSERT INTO users (username, password) VALUES (?, ?)', (username, hashed_pw))
-            conn.commit()
-            print("User registered successfully!")
-            return True
-        except sqlite3.IntegrityError:
-            print("Username already exists. Please choose another.")
-        except Error as e:
-            print(f"Error registering user: {e}")
-        finally:
-            conn.close()
+        print("User registered successfully!")
+        return True
+    except sqlite3.IntegrityError:
+        print("Username already exists. Please choose another.")
+    except Error as e:
+        print(f"Error registering user: {e}")
     return False
 
-def login_user(username, password):
+def login_user(username, password, db_file=None):
     """Authenticate a user"""
-    conn = create_connection()
-    if conn is not None:
-        try:
+    try:
+        with connection(db_file) as conn:
             cursor = conn.cursor()
-            hashed_pw = hash_password(password)
-            cursor.execute('SELECT id FROM users WHERE username=? AND password=?', (username, hashed_pw))
+            cursor.execute('SELECT id, password FROM users WHERE username=?', (username,))
             user = cursor.fetchone()
-            if user:
+            if user and verify_password(password, user[1]):
+                if needs_rehash(user[1]):
+                    cursor.execute('UPDATE users SET password=? WHERE id=?',
+                                   (hash_password(password), user[0]))
                 print("Login successful!")
                 return user[0]  # Return user ID
             else:
                 print("Invalid username or password.")
-        except Error as e:
-            print(f"Error logging in: {e}")
-        finally:
-            conn.close()
+    except Error as e:
+        print(f"Error logging in: {e}")
     return None
 
-def change_password(user_id, old_password, new_password):
+def start_session(username, password, db_file=None):
+    """Log a user in and return a session token, or None"""
+    user_id = login_user(username, password, db_file=db_file)
+    if user_id is None:
+        return None
+    return sessions.create(user_id)
+
+def authenticate(token):
+    """Return the user id of a live session token, or None"""
+    return sessions.get(token)
+
+def end_session(token):
+    sessions.revoke(token)
+
+def change_password(user_id, old_password, new_password, db_file=None):
     """Change user password"""
-    conn = create_connection()
-    if conn is not None:
-        try:
+    try:
+        with connection(db_file) as conn:
             cursor = conn.cursor()
             # Verify old password first
-            cursor.execute('SELECT id FROM users WHERE id=? AND password=?',
-                          (user_id, hash_password(old_password)))
-            if cursor.fetchone():
+            cursor.execute('SELECT password FROM users WHERE id=?', (user_id,))
+            user = cursor.fetchone()
+            if user and verify_password(old_password, user[0]):
                 new_hashed_pw = hash_password(new_password)
                 cursor.execute('UPDATE users SET password=? WHERE id=?', (new_hashed_pw, user_id))
-                conn.commit()
+                sessions.revoke_user(user_id)
                 print("Password changed successfully!")
                 return True
             else:
                 print("Old password is incorrect.")
-        except Error as e:
-            print(f"Error changing password: {e}")
-        finally:
-            conn.close()
+    except Error as e:
+        print(f"Error changing password: {e}")
     return False
\ No newline at end of file
@@ -0,0 +1,347 @@
+"""Online backups of the finance database.
+
+Usage:
+
+    python backup.py full [--db finance.db] [--dir backups] [--keep 7]
+    python backup.py incremental [--db finance.db] [--dir backups]
+    python backup.py verify BACKUP [--dir backups]
+    python backup.py restore BACKUP TARGET [--dir backups]
+
+A full backup copies the live database with SQLite's online backup API a
+few pages at a time, all from one read snapshot, and streams the copy
+through gzip. With the app's WAL journal it keeps writing while the copy
+runs; checkpoints wait until it ends. An incremental backup exports only the
+transactions inserted, updated or deleted since the previous backup, as
+gzipped JSON lines. Every backup is recorded in DIR/manifest.json with the
+transaction count and total it captured, which restores are checked
+against. Restoring an incremental backup restores the full backup it
+builds on and replays the incremental files up to it. Incremental backups
+cover transactions only; users and budgets come from the full backup.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime
+
+from database import DEFAULT_DB_FILE, TRANSACTION_COLUMNS, connection, migrate, transaction_source
+
+DEFAULT_BACKUP_DIR = 'backups'
+DEFAULT_KEEP = 7
+MANIFEST = 'manifest.json'
+
+# Pages copied per step of the online backup, sleeping BACKUP_SLEEP
+# seconds in between
+BACKUP_PAGES = 256
+BACKUP_SLEEP = 0.005
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def load_manifest(backup_dir=DEFAULT_BACKUP_DIR):
+    """Return the recorded backups, oldest first"""
+    try:
+        with open(os.path.join(backup_dir, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def _save_manifest(backup_dir, entries):
+    path = os.path.join(backup_dir, MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(entries, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def _backup_path(backup_dir, db_file, suffix):
+    stem = os.path.splitext(os.path.basename(db_file or DEFAULT_DB_FILE))[0]
+    base = os.path.join(backup_dir, f"{stem}_{datetime.now():%Y%m%d_%H%M%S}")
+    path, n = base + suffix, 1
+    while os.path.exists(path):
+        path, n = f"{base}_{n}{suffix}", n + 1
+    return path
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _snapshot(conn):
+    """Return (last change seq, transaction count, total cents) as seen by conn"""
+    seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+    # Archived years count too, so moving them leaves the figures unchanged
+    count, total = conn.execute(
+        f'SELECT COUNT(*), COALESCE(SUM(amount), 0) FROM {transaction_source(conn)}').fetchone()
+    return (seq[0] if seq else 0), count, total
+
+
+def _record(backup_dir, path, kind, seq, count, total):
+    entry = {
+        'file': os.path.basename(path),
+        'kind': kind,
+        'created': datetime.now().isoformat(' ', 'seconds'),
+        'seq': seq,
+        'transactions': count,
+        'total': total,
+        'sha256': _sha256(path),
+    }
+    entries = load_manifest(backup_dir)
+    entries.append(entry)
+    _save_manifest(backup_dir, entries)
+    return entry
+
+
+def backup_database(db_file=None, backup_dir=DEFAULT_BACKUP_DIR, pages=BACKUP_PAGES, sleep=BACKUP_SLEEP):
+    """Take a full online backup; returns its manifest entry"""
+    os.makedirs(backup_dir, exist_ok=True)
+    # Older databases are migrated first, so the change log exists and the
+    # recorded total is in cents
+    with connection(db_file) as conn:
+        migrate(conn)
+
+    fd, copy_path = tempfile.mkstemp(suffix='.db', dir=backup_dir)
+    os.close(fd)
+    try:
+        source = sqlite3.connect(db_file or DEFAULT_DB_FILE, isolation_level=None)
+        copy = sqlite3.connect(copy_path)
+        try:
+            # Without a snapshot, a write from another connection between
+            # steps restarts the copy, which under steady writes may never
+            # finish. A read transaction held across every step pins one.
+            source.execute('BEGIN')
+            source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+            source.backup(copy, pages=pages, sleep=sleep)
+            source.execute('COMMIT')
+            seq, count, total = _snapshot(copy)
+        finally:
+            copy.close()
+            source.close()
+
+        path = _backup_path(backup_dir, db_file, '.db.gz')
+        with open(copy_path, 'rb') as src, gzip.open(path + '.partial', 'wb') as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        os.replace(path + '.partial', path)
+    finally:
+        os.remove(copy_path)
+
+    return _record(backup_dir, path, 'full', seq, count, total)
+
+
+def export_changes(db_file=None, backup_dir=DEFAULT_BACKUP_DIR):
+    """Export transactions changed since the last backup; returns its manifest entry.
+
+    Each line holds a changed transaction's current row, or just its id
+    and "deleted": true if it no longer exists.
+    """
+    entries = load_manifest(backup_dir)
+    if not any(entry['kind'] == 'full' for entry in entries):
+        raise ValueError("No full backup to build on; take a full backup first")
+    since = entries[-1]['seq']
+
+    path = _backup_path(backup_dir, db_file, '.changes.jsonl.gz')
+    with connection(db_file) as conn:
+        # One read transaction, so the rows, seq and totals agree
+        conn.execute('BEGIN')
+        try:
+            seq, count, total = _snapshot(conn)
+            rows = conn.execute(f'''
+            SELECT c.transaction_id, {', '.join('t.' + column for column in TRANSACTION_COLUMNS[1:])}
+            FROM (SELECT DISTINCT row_id AS transaction_id FROM change_log
+                  WHERE seq > ? AND table_name = 'transactions') c
+            LEFT JOIN transactions t ON t.id = c.transaction_id
+            ORDER BY c.transaction_id
+            ''', (since,))
+            # A row changed since the last backup may have moved to an
+            # archive table since, rather than been deleted
+            source = transaction_source(conn)
+            with gzip.open(path + '.partial', 'wt', encoding='utf-8') as f:
+                for row in rows.fetchall():
+                    if row[1] is None and source != 'transactions':
+                        row = conn.execute(f'SELECT {", ".join(TRANSACTION_COLUMNS)} FROM {source} WHERE id=?',
+                                           (row[0],)).fetchone() or row
+                    if row[1] is None:
+                        record = {'id': row[0], 'deleted': True}
+                    else:
+                        record = dict(zip(TRANSACTION_COLUMNS, row))
+                    f.write(json.dumps(record, separators=(',', ':')) + '\n')
+        finally:
+            conn.rollback()
+    os.replace(path + '.partial', path)
+
+    return _record(backup_dir, path, 'incremental', seq, count, total)
+
+
+def rotate_backups(backup_dir=DEFAULT_BACKUP_DIR, keep=DEFAULT_KEEP, db_file=None):
+    """Keep the newest `keep` full backups and the incrementals built on them.
+
+    Returns the removed file names. With db_file, change log entries that
+    no kept backup needs are deleted too. Only entries superseded by a
+    later change to the same row go, as the latest one is the row's
+    version for sync.
+    """
+    entries = load_manifest(backup_dir)
+    fulls = [i for i, entry in enumerate(entries) if entry['kind'] == 'full']
+    if len(fulls) <= keep:
+        return []
+    first_kept = fulls[-keep] if keep else len(entries)
+    removed, kept = entries[:first_kept], entries[first_kept:]
+    _save_manifest(backup_dir, kept)
+    for entry in removed:
+        try:
+            os.remove(os.path.join(backup_dir, entry['file']))
+        except FileNotFoundError:
+            pass
+
+    if db_file is not None and kept:
+        with connection(db_file) as conn:
+            conn.execute('''
+            DELETE FROM change_log
+            WHERE seq <= ? AND seq < (SELECT MAX(seq) FROM change_log later
+                                      WHERE later.table_name = change_log.table_name
+                                        AND later.row_id = change_log.row_id)
+            ''', (kept[0]['seq'],))
+    return [entry['file'] for entry in removed]
+
+
+def _chain(backup_dir, name):
+    """Return the manifest entries needed to restore `name`, full backup first"""
+    entries = load_manifest(backup_dir)
+    names = [entry['file'] for entry in entries]
+    if name not in names:
+        raise ValueError(f"{name} is not in the backup manifest")
+    end = names.index(name)
+    start = end
+    while entries[start]['kind'] != 'full':
+        start -= 1
+        if start < 0:
+            raise ValueError(f"No full backup precedes {name}")
+    return entries[start:end + 1]
+
+
+def _apply_changes(conn, path):
+    columns = ', '.join(TRANSACTION_COLUMNS)
+    updates = ', '.join(f'{column} = excluded.{column}' for column in TRANSACTION_COLUMNS[1:])
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            if record.get('deleted'):
+                conn.execute('DELETE FROM transactions WHERE id = ?', (record['id'],))
+            else:
+                # An upsert, not INSERT OR REPLACE, so the rollup triggers see an update
+                conn.execute(f'''
+                INSERT INTO transactions ({columns}) VALUES ({', '.join('?' * len(TRANSACTION_COLUMNS))})
+                ON CONFLICT (id) DO UPDATE SET {updates}
+                ''', [record[column] for column in TRANSACTION_COLUMNS])
+
+
+def check_database(db_file, entry):
+    """Return a list of problems found comparing db_file with a manifest entry"""
+    conn = sqlite3.connect(db_file)
+    try:
+        problems = [row[0] for row in conn.execute('PRAGMA integrity_check') if row[0] != 'ok']
+        _, count, total = _snapshot(conn)
+    finally:
+        conn.close()
+    if count != entry['transactions']:
+        problems.append(f"expected {entry['transactions']} transactions, found {count}")
+    if total != entry['total']:
+        problems.append(f"expected a total of {entry['total']} cents, found {total}")
+    return problems
+
+
+def restore_backup(name, target, backup_dir=DEFAULT_BACKUP_DIR):
+    """Restore backup `name` into a new database at target and verify it.
+
+    Raises ValueError if a file's checksum or the restored data do not
+    match the manifest; the target is removed in that case.
+    """
+    if os.path.exists(target):
+        raise ValueError(f"{target} already exists")
+    chain = _chain(backup_dir, name)
+    for entry in chain:
+        path = os.path.join(backup_dir, entry['file'])
+        if _sha256(path) != entry['sha256']:
+            raise ValueError(f"{entry['file']} is corrupt: checksum mismatch")
+
+    try:
+        with gzip.open(os.path.join(backup_dir, chain[0]['file']), 'rb') as src, open(target, 'wb') as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        conn = sqlite3.connect(target)
+        try:
+            for entry in chain[1:]:
+                _apply_changes(conn, os.path.join(backup_dir, entry['file']))
+            conn.commit()
+        finally:
+            conn.close()
+        problems = check_database(target, chain[-1])
+        if problems:
+            raise ValueError(f"Restore of {name} failed verification: {'; '.join(problems)}")
+    except BaseException:
+        os.remove(target)
+        raise
+
+
+def verify_backup(name, backup_dir=DEFAULT_BACKUP_DIR):
+    """Restore a backup into a scratch file and check it; returns the problems found"""
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            restore_backup(name, os.path.join(tmp, 'restore.db'), backup_dir)
+        except ValueError as e:
+            return [str(e)]
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['full', 'incremental', 'verify', 'restore'])
+    parser.add_argument('backup', nargs='?', help="backup file name, for verify and restore")
+    parser.add_argument('target', nargs='?', help="database to create, for restore")
+    parser.add_argument('--db', dest='db_file', default=None)
+    parser.add_argument('--dir', dest='backup_dir', default=DEFAULT_BACKUP_DIR)
+    parser.add_argument('--keep', type=int, default=DEFAULT_KEEP)
+    args = parser.parse_args()
+
+    if args.command == 'full':
+        entry = backup_database(args.db_file, args.backup_dir)
+        print(f"Wrote {entry['file']} ({entry['transactions']} transactions).")
+        for name in rotate_backups(args.backup_dir, args.keep, args.db_file or DEFAULT_DB_FILE):
+            print(f"Removed {name}.")
+    elif args.command == 'incremental':
+        try:
+            entry = export_changes(args.db_file, args.backup_dir)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+        print(f"Wrote {entry['file']}.")
+    elif not args.backup:
+        parser.error(f"{args.command} needs a backup name")
+    elif args.command == 'verify':
+        problems = verify_backup(args.backup, args.backup_dir)
+        for problem in problems:
+            print(problem)
+        if problems:
+            sys.exit(1)
+        print(f"{args.backup} restores cleanly.")
+    elif not args.target:
+        parser.error("restore needs a target database")
+    else:
+        try:
+            restore_backup(args.backup, args.target, args.backup_dir)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+        print(f"Restored {args.backup} to {args.target}.")
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
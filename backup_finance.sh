@@ -0,0 +1,12 @@
+#!/bin/sh
+# Nightly backup of finance.db, meant to run from cron while the app is up.
+# Sundays take a full online backup and rotate old ones; other nights
+# export only the transactions changed since the previous backup.
+set -e
+cd "$(dirname "$0")"
+
+if [ "$(date +%u)" = 7 ] || [ ! -f backups/manifest.json ]; then
+    python3 backup.py full --keep "${KEEP_FULL_BACKUPS:-4}"
+else
+    python3 backup.py incremental
+fi
@@ -0,0 +1,214 @@
+"""Month-end reports for every user, computed by a pool of processes.
+
+Usage:
+
+    python batch_reports.py MONTH YEAR --out reports.jsonl [--format jsonl|csv]
+                            [--db finance.db] [--workers N] [--chunk-size 200]
+                            [--checkpoint FILE]
+
+Users are split into chunks of consecutive ids, and worker processes each
+open the database read-only and run get_monthly_summary and
+get_budget_status for a chunk at a time. Workers render their output
+lines themselves, so the parent only writes them, as each chunk finishes.
+JSON Lines output has one object per user with the per-category totals
+and budget rows; CSV output has one row of totals per user.
+
+Progress is checkpointed to FILE, by default the output path plus
+.checkpoint. It starts with the length of the CSV header, as chunk -1,
+and after a chunk is written and synced, its index and the output's
+length are appended there. Running again with the same arguments
+resumes the job: the output is cut back to the last checkpointed length,
+which drops a chunk that was only partly written but keeps the header,
+and finished chunks are skipped. Users registered after the job started
+are left out of it. The checkpoint is removed when the job completes. If
+the output was deleted, the checkpoint is discarded and the job starts
+over.
+"""
+import argparse
+import csv
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import database
+import report_cache
+from budget import get_budget_status
+from reports import get_monthly_summary
+
+DEFAULT_CHUNK_SIZE = 200
+
+CSV_FIELDS = ['user_id', 'month', 'year', 'income', 'expenses', 'savings', 'budgets', 'over_budget']
+
+_db_file = None
+
+
+def _init_worker(db_file):
+    global _db_file
+    _db_file = db_file
+    database.READ_ONLY = True
+    # Every report is computed once, so caching them only costs memory
+    report_cache.configure(0)
+
+
+def _json_record(user_id, summary, statuses):
+    return {
+        'user_id': user_id,
+        'month': summary.month,
+        'year': summary.year,
+        'income': str(summary.total_income),
+        'expenses': str(summary.total_expenses),
+        'savings': str(summary.savings),
+        'income_by_category': {row.category: str(row.amount) for row in summary.income_by_category},
+        'expenses_by_category': {row.category: str(row.amount) for row in summary.expenses_by_category},
+        'budgets': [{'category': status.category_name, 'budget': str(status.budget),
+                     'spent': str(status.spent), 'remaining': str(status.remaining),
+                     'percentage': round(status.percentage, 1)}
+                    for status in statuses],
+    }
+
+
+def report_chunk(user_ids, month, year, output_format):
+    """Render the reports of user_ids as output lines; runs in a worker"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if output_format == 'csv' else None
+    for user_id in user_ids:
+        summary = get_monthly_summary(user_id, month, year, db_file=_db_file)
+        statuses = get_budget_status(user_id, month, year, db_file=_db_file)
+        if summary is None or statuses is None:
+            raise RuntimeError(f"Could not report on user {user_id}")
+        if writer is None:
+            buffer.write(json.dumps(_json_record(user_id, summary, statuses)))
+            buffer.write('\n')
+        else:
+            writer.writerow([user_id, month, year, summary.total_income, summary.total_expenses,
+                             summary.savings, len(statuses),
+                             sum(status.remaining < 0 for status in statuses)])
+    return buffer.getvalue()
+
+
+def _read_checkpoint(path, header):
+    """Return (finished chunk indexes, output length) recorded at path"""
+    with open(path) as f:
+        recorded = json.loads(f.readline())
+        if recorded != header:
+            raise ValueError(f"{path} is for a different job: {recorded}")
+        done = set()
+        length = 0
+        for line in f:
+            fields = line.split()
+            # A line cut short by a crash is ignored
+            if len(fields) == 2:
+                index, length = int(fields[0]), int(fields[1])
+                # -1 records the header, which belongs to no chunk
+                if index >= 0:
+                    done.add(index)
+    return done, length
+
+
+def run_batch(month, year, out, output_format=None, db_file=None, workers=None,
+              chunk_size=DEFAULT_CHUNK_SIZE, checkpoint=None, progress=None):
+    """Write the month's reports for every user to out; returns the users written by this run.
+
+    output_format is 'jsonl' or 'csv', by default taken from out's
+    extension. progress, if given, is called with (users done, users in
+    the job) after each chunk.
+    """
+    db_file = db_file or database.DEFAULT_DB_FILE
+    output_format = output_format or ('csv' if out.endswith('.csv') else 'jsonl')
+    checkpoint = checkpoint or out + '.checkpoint'
+
+    if os.path.exists(checkpoint) and not os.path.exists(out):
+        # Nothing is left to resume, so the job starts over
+        os.remove(checkpoint)
+    if os.path.exists(checkpoint):
+        with open(checkpoint) as f:
+            last_user = json.loads(f.readline()).get('last_user')
+    else:
+        with database.connection(db_file) as conn:
+            last_user = conn.execute('SELECT COALESCE(MAX(id), 0) FROM users').fetchone()[0]
+    header = {'db': os.path.abspath(db_file), 'month': month, 'year': year, 'format': output_format,
+              'chunk_size': chunk_size, 'last_user': last_user}
+
+    with database.connection(db_file) as conn:
+        user_ids = [row[0] for row in conn.execute('SELECT id FROM users WHERE id <= ? ORDER BY id',
+                                                   (last_user,))]
+    chunks = [user_ids[start:start + chunk_size] for start in range(0, len(user_ids), chunk_size)]
+
+    if os.path.exists(checkpoint):
+        done, length = _read_checkpoint(checkpoint, header)
+        if os.path.getsize(out) < length:
+            raise ValueError(f"{out} is shorter than {checkpoint} records")
+        output = open(out, 'r+', newline='')
+        output.truncate(length)
+        output.seek(length)
+    else:
+        done = set()
+        output = open(out, 'w', newline='')
+        if output_format == 'csv':
+            csv.writer(output).writerow(CSV_FIELDS)
+        output.flush()
+        os.fsync(output.fileno())
+        with open(checkpoint, 'w') as f:
+            f.write(json.dumps(header) + '\n')
+            f.write(f"-1 {output.tell()}\n")
+
+    resumed = written = sum(len(chunks[index]) for index in done)
+    # Spawned rather than forked, so no worker inherits the parent's
+    # open SQLite connections
+    pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=_init_worker, initargs=(db_file,))
+    try:
+        with output, open(checkpoint, 'a') as log:
+            futures = {pool.submit(report_chunk, chunk, month, year, output_format): index
+                       for index, chunk in enumerate(chunks) if index not in done}
+            for future in as_completed(futures):
+                index = futures[future]
+                output.write(future.result())
+                output.flush()
+                os.fsync(output.fileno())
+                log.write(f"{index} {output.tell()}\n")
+                log.flush()
+                written += len(chunks[index])
+                if progress:
+                    progress(written, len(user_ids))
+    finally:
+        # On an error, drop the chunks not started; the checkpoint has the rest
+        pool.shutdown(cancel_futures=True)
+    os.remove(checkpoint)
+    return written - resumed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('month', type=int)
+    parser.add_argument('year', type=int)
+    parser.add_argument('--out', required=True)
+    parser.add_argument('--format', dest='output_format', choices=['jsonl', 'csv'], default=None)
+    parser.add_argument('--db', dest='db_file', default=None)
+    parser.add_argument('--workers', type=int, default=None, help="default: one per CPU")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--checkpoint', default=None)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+
+    def progress(done, total):
+        print(f"\rReported {done:,} of {total:,} users", end='', file=sys.stderr, flush=True)
+
+    try:
+        count = run_batch(args.month, args.year, args.out, args.output_format, args.db_file,
+                          args.workers, args.chunk_size, args.checkpoint, progress)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    elapsed = time.perf_counter() - started
+    print(f"\nWrote {count:,} users to {args.out} in {elapsed:.1f}s "
+          f"({count / elapsed if elapsed else 0:,.0f} users/s).")
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,75 @@
+"""Compare the NumPy analytics with the equivalent SQL.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_analytics [--rows 10000000] [--users 1000]
+
+Seeds a synthetic ledger, then times each analysis three ways: the SQL
+query that answers it, the NumPy computation on an already loaded
+Ledger, and the one-off cost of load_ledger(). Seeding 10M rows takes a
+few minutes; pass a smaller --rows for a quick run.
+"""
+import argparse
+import time
+
+import analytics
+import database
+from benchmarks.common import best_of, seed_ledger, temporary_database
+
+TRENDS_SQL = '''
+SELECT category_id, CAST(substr(date, 1, 4) AS INTEGER) AS year, SUM(amount), COUNT(*)
+FROM transactions
+GROUP BY category_id, year
+'''
+
+ROLLING_SQL = '''
+SELECT month, total,
+       AVG(total) OVER (ORDER BY month ROWS BETWEEN 2 PRECEDING AND CURRENT ROW)
+FROM (SELECT substr(t.date, 1, 7) AS month, SUM(t.amount) AS total
+      FROM transactions t JOIN categories c ON c.id = t.category_id
+      WHERE c.type = 'expense'
+      GROUP BY month)
+'''
+
+PERCENTILES_SQL = '''
+SELECT category_id, amount
+FROM (SELECT category_id, amount,
+             ROW_NUMBER() OVER (PARTITION BY category_id ORDER BY amount) - 1 AS rank,
+             COUNT(*) OVER (PARTITION BY category_id) AS n
+      FROM transactions)
+WHERE rank IN (CAST(0.5 * (n - 1) AS INTEGER), CAST(0.9 * (n - 1) AS INTEGER),
+               CAST(0.99 * (n - 1) AS INTEGER))
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with temporary_database() as db_file:
+        start = time.perf_counter()
+        seed_ledger(db_file, args.rows, users=args.users, years=10)
+        print(f"Seeded {args.rows:,} rows in {time.perf_counter() - start:.1f}s")
+
+        conn = database.get_connection(db_file)
+        load = best_of(lambda: analytics.load_ledger(db_file), 1)
+        ledger = analytics.load_ledger(db_file)
+        print(f"load_ledger: {load:.2f}s ({args.rows / load:,.0f} rows/s)")
+
+        cases = [
+            ('yearly trends', TRENDS_SQL, lambda: analytics.yearly_trends(ledger)),
+            ('3-month rolling average', ROLLING_SQL, lambda: analytics.rolling_average(ledger, 3)),
+            ('category percentiles', PERCENTILES_SQL, lambda: analytics.category_percentiles(ledger)),
+        ]
+        for name, sql, compute in cases:
+            sql_time = best_of(lambda: conn.execute(sql).fetchall(), args.repeat)
+            numpy_time = best_of(compute, args.repeat)
+            print(f"{name:24}  SQL {sql_time:7.3f}s   NumPy {numpy_time:7.3f}s"
+                  f"   {sql_time / numpy_time:6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
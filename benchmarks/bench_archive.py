@@ -0,0 +1,114 @@
+"""Measure archiving closed years and reads across the archive.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_archive [--transactions 1000000] [--users 1000] [--batch 1000]
+
+Seeds a ledger over 2019-2024 and times, before and after archiving
+2019-2023:
+
+  recent page      list_transactions() for one user, all from the ledger
+  archived range   one page of a user's 2021 transactions
+  full history     iter_transactions() over a user's whole history
+  yearly summary   get_yearly_summary() for 2021, uncached
+
+and, while compacting each year, the rows moved per second and the
+longest batch, which is the longest a writer waits for the move. A writer
+thread adds transactions throughout and reports its slowest commit.
+"""
+import argparse
+import threading
+import time
+
+import archive
+import database
+import report_cache
+from benchmarks.common import best_of, seed_ledger, temporary_database
+from reports import get_yearly_summary
+from transactions import get_transactions_page, insert_transaction_row, iter_transactions, list_transactions
+
+USER = 7
+YEARS = range(2019, 2024)
+
+
+def time_reads(db_file):
+    def yearly():
+        report_cache.clear()
+        get_yearly_summary(USER, 2021, db_file=db_file)
+
+    return {
+        'recent page': best_of(lambda: list_transactions(USER, 20, db_file=db_file)),
+        'archived range': best_of(lambda: get_transactions_page(
+            USER, 20, start_date='2021-01-01', end_date='2022-01-01', db_file=db_file)),
+        'full history': best_of(lambda: sum(1 for _ in iter_transactions(USER, db_file=db_file)), repeat=3),
+        'yearly summary': best_of(yearly),
+    }
+
+
+def ledger_pages(db_file):
+    """Pages of the ledger table and its indexes"""
+    conn = database.get_connection(db_file)
+    return conn.execute('''
+    SELECT COUNT(*) FROM dbstat
+    WHERE name = 'transactions' OR name IN (SELECT name FROM sqlite_master WHERE tbl_name = 'transactions'
+                                                                           AND type = 'index')
+    ''').fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--transactions', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--batch', type=int, default=archive.DEFAULT_BATCH)
+    args = parser.parse_args()
+
+    with temporary_database() as db_file:
+        started = time.perf_counter()
+        seed_ledger(db_file, args.transactions, users=args.users, start_year=2019, years=6)
+        print(f"{args.transactions} transactions, {args.users} users, "
+              f"seeded in {time.perf_counter() - started:.1f}s; ledger {ledger_pages(db_file)} pages")
+        before = time_reads(db_file)
+
+        stop = threading.Event()
+        slowest = []
+
+        def writer():
+            # Not add_transaction(), whose messages redirect_stdout would
+            # swallow together with the main thread's output
+            worst = 0.0
+            while not stop.is_set():
+                start = time.perf_counter()
+                with database.connection(db_file) as conn:
+                    insert_transaction_row(conn.cursor(), USER, 4, '9.99', 'during compaction')
+                worst = max(worst, time.perf_counter() - start)
+                time.sleep(0.01)
+            slowest.append(worst)
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        for year in YEARS:
+            batches = []
+
+            def progress(moved, last=[time.perf_counter()]):
+                now = time.perf_counter()
+                batches.append(now - last[0])
+                last[0] = now
+
+            started = time.perf_counter()
+            moved = archive.compact_year(year, args.batch, pause=0, progress=progress, db_file=db_file)
+            elapsed = time.perf_counter() - started
+            print(f"compact {year}  {moved:8} moved  {moved / elapsed:9.0f} rows/s  "
+                  f"longest batch {max(batches) * 1000:7.1f} ms")
+        stop.set()
+        thread.join()
+        print(f"slowest concurrent add_transaction {slowest[0] * 1000:.1f} ms; "
+              f"ledger {ledger_pages(db_file)} pages")
+
+        after = time_reads(db_file)
+        print(f"{'':16} {'before':>10} {'after':>10}  (ms)")
+        for name, elapsed in before.items():
+            print(f"{name:16} {elapsed * 1000:10.2f} {after[name] * 1000:10.2f}")
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
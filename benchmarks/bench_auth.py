@@ -0,0 +1,83 @@
+"""Login latency with PBKDF2 and the effect of the session cache.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_auth [--logins N] [--operations N]
+
+Reports p50/p99 login latency for legacy SHA-256 rows (which are rehashed
+on their first login), for PBKDF2 rows, and for validating a session
+token. The session run replays authenticated operations across users
+whose tokens expire, and prints the cache hit rate.
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import random
+import statistics
+import time
+
+import auth
+import database
+from benchmarks.common import temporary_database
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    return statistics.median(ordered) * 1000, p99 * 1000
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=100)
+    parser.add_argument('--operations', type=int, default=100_000)
+    parser.add_argument('--users', type=int, default=50)
+    args = parser.parse_args()
+
+    with temporary_database() as db_file, contextlib.redirect_stdout(io.StringIO()):
+        conn = database.get_connection(db_file)
+        conn.executemany('INSERT INTO users (username, password) VALUES (?, ?)',
+                         [(f'legacy{i}', hashlib.sha256(b'secret').hexdigest())
+                          for i in range(args.logins)])
+        conn.commit()
+
+        legacy = [timed(auth.login_user, f'legacy{i}', 'secret', db_file)
+                  for i in range(args.logins)]
+        pbkdf2 = [timed(auth.login_user, f'legacy{i}', 'secret', db_file)
+                  for i in range(args.logins)]
+
+        # Tokens live for a tenth of the run, so some operations must log in again
+        now = [0.0]
+        auth.sessions = auth.SessionCache(ttl=args.operations / 10, clock=lambda: now[0])
+        tokens = {}
+        rng = random.Random(1)
+        validate, relogins = [], 0
+        for step in range(args.operations):
+            now[0] = step
+            user = rng.randrange(args.users)
+            start = time.perf_counter()
+            if auth.authenticate(tokens.get(user)) is None:
+                tokens[user] = auth.start_session(f'legacy{user}', 'secret', db_file)
+                relogins += 1
+            validate.append(time.perf_counter() - start)
+
+    cache = auth.sessions
+    print(f"{'login, legacy SHA-256 + rehash':32}p50 {percentiles(legacy)[0]:8.3f} ms"
+          f"   p99 {percentiles(legacy)[1]:8.3f} ms")
+    print(f"{f'login, PBKDF2 {auth.PBKDF2_ITERATIONS} rounds':32}p50 {percentiles(pbkdf2)[0]:8.3f} ms"
+          f"   p99 {percentiles(pbkdf2)[1]:8.3f} ms")
+    print(f"{'authenticated operation':32}p50 {percentiles(validate)[0]:8.3f} ms"
+          f"   p99 {percentiles(validate)[1]:8.3f} ms")
+    print(f"session cache: {cache.hits} hits, {cache.misses} misses "
+          f"({cache.hits / (cache.hits + cache.misses):.1%} hit rate), {relogins} KDF logins")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Measure batch report throughput against the number of worker processes.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_batch_reports [--users 5000] [--transactions 500000]
+                                             [--workers 1,2,4,8] [--format jsonl]
+
+Builds one ledger with benchmarks.generator, then runs the month-end job
+of batch_reports over every user with each worker count and reports
+users/sec and the speedup over one worker. Times include starting the
+worker processes, as a real run pays for them too. A sequential run in
+this process, with the report cache off, is the baseline.
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import database
+import report_cache
+from batch_reports import run_batch
+from benchmarks.generator import generate
+from budget import get_budget_status
+from reports import get_monthly_summary
+
+
+def sequential(db_file, month, year):
+    report_cache.configure(0)
+    try:
+        with database.connection(db_file) as conn:
+            user_ids = [row[0] for row in conn.execute('SELECT id FROM users')]
+        with contextlib.redirect_stdout(io.StringIO()):
+            for user_id in user_ids:
+                get_monthly_summary(user_id, month, year, db_file=db_file)
+                get_budget_status(user_id, month, year, db_file=db_file)
+    finally:
+        report_cache.configure()
+    return len(user_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--transactions', type=int, default=500_000)
+    parser.add_argument('--workers', default='1,2,4,8')
+    parser.add_argument('--format', dest='output_format', choices=['jsonl', 'csv'], default='jsonl')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, 'batch.db')
+        generate(db_file, args.users, args.transactions, years=1)
+        year = int(database.get_connection(db_file).execute(
+            'SELECT substr(MIN(date), 1, 4) FROM transactions').fetchone()[0])
+        database.close_connections()
+        print(f"{args.users} users, {args.transactions} transactions, {os.cpu_count()} CPUs")
+
+        start = time.perf_counter()
+        count = sequential(db_file, 6, year)
+        baseline = count / (time.perf_counter() - start)
+        print(f"{'sequential':>10}  {baseline:9.0f} users/s")
+
+        single = None
+        for workers in map(int, args.workers.split(',')):
+            out = os.path.join(tmp, f'reports-{workers}.{args.output_format}')
+            start = time.perf_counter()
+            count = run_batch(6, year, out, args.output_format, db_file, workers)
+            rate = count / (time.perf_counter() - start)
+            single = single or rate
+            print(f"{workers:3} workers  {rate:9.0f} users/s  {rate / single:5.2f}x")
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
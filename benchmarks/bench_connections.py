@@ -0,0 +1,71 @@
+"""Compare per-call connections with the pooled connection manager.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_connections [--ops N]
+
+The "before" run swaps the modules back to opening and closing a plain
+sqlite3 connection on every call, which is what create_connection() did
+for every function before the pool existed. The workload reads and
+writes transactions only: a login now runs the PBKDF2 key derivation,
+which would swamp the connection cost being measured.
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import database
+import transactions
+
+
+@contextlib.contextmanager
+def per_call_connection(db_file=None):
+    conn = database.create_connection(db_file)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def run_workload(db_file, ops):
+    """Alternate reads of recent transactions and inserts, returning operations per second"""
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(ops):
+            if i % 2:
+                transactions.list_transactions(1, db_file=db_file)
+            else:
+                transactions.add_transaction(1, 4, 12.5, 'bench', db_file=db_file)
+    return ops / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ops', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, 'bench.db')
+        database.initialize_database(db_file)
+
+        pooled = database.connection
+        transactions.connection = per_call_connection
+        try:
+            before = run_workload(db_file, args.ops)
+        finally:
+            transactions.connection = pooled
+
+        after = run_workload(db_file, args.ops)
+        database.close_connections()
+
+    print(f"per-call connections: {before:10.0f} ops/sec")
+    print(f"pooled connections:   {after:10.0f} ops/sec")
+    print(f"speedup:              {after / before:10.2f}x")
+
+
+if __name__ == '__main__':
+    main()
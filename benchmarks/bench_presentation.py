@@ -0,0 +1,63 @@
+"""Measure what rendering used to add to every report call.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_presentation [--rows N]
+
+"headless" calls the data functions alone, as services and batch jobs now
+do. "rendered" also builds the PrettyTable output, which the data
+functions used to do on every call.
+"""
+import argparse
+import contextlib
+import io
+
+import budget
+import presentation
+import reports
+import transactions
+from benchmarks.common import best_of, seed_ledger, temporary_database
+
+
+def rendered(fetch, render):
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            render(fetch())
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--calls', type=int, default=200)
+    args = parser.parse_args()
+
+    with temporary_database() as db_file:
+        seed_ledger(db_file, args.rows)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for category_id in range(4, 12):
+                budget.set_budget(1, category_id, 1000.0, 6, 2023, db_file=db_file)
+
+        cases = [
+            ('monthly summary', lambda: reports.get_monthly_summary(1, 6, 2023, db_file=db_file),
+             presentation.print_monthly_summary),
+            ('yearly summary', lambda: reports.get_yearly_summary(1, 2023, db_file=db_file),
+             presentation.print_yearly_summary),
+            ('budget status', lambda: budget.get_budget_status(1, 6, 2023, db_file=db_file),
+             lambda statuses: presentation.print_budget_status(statuses, 6, 2023)),
+            ('list transactions', lambda: transactions.list_transactions(1, 50, db_file=db_file),
+             presentation.print_transactions),
+            ('list categories', lambda: transactions.list_categories(db_file=db_file),
+             presentation.print_categories),
+        ]
+
+        print(f"{args.calls} calls each, microseconds per call")
+        for name, fetch, render in cases:
+            headless = best_of(lambda: [fetch() for _ in range(args.calls)]) / args.calls
+            full = best_of(lambda: [rendered(fetch, render)() for _ in range(args.calls)]) / args.calls
+            print(f"{name:18} headless {headless * 1e6:8.1f}   rendered {full * 1e6:8.1f}"
+                  f"   formatting share {1 - headless / full:6.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Measure recurring transaction posting.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_recurring [--rules 200000] [--due 10000]
+
+Creates `rules` monthly rules spread over the days of the month, then
+times:
+
+  idle tick   post_due() when nothing is due, which reads only the
+              next_due index, however many rules there are
+  due tick    post_due() when `due` rules have fallen due, posted in one
+              batch and one commit
+  one by one  posting the same number of transactions with
+              add_transaction(), which commits each one
+"""
+import argparse
+import contextlib
+import io
+import random
+import time
+from datetime import datetime
+
+import database
+import recurring
+from benchmarks.common import temporary_database
+from transactions import add_transaction
+
+
+def seed_rules(db_file, count, due, seed=42):
+    """Insert count monthly rules, of which the first `due` are due on 2025-06-01"""
+    rng = random.Random(seed)
+    rows = []
+    for n in range(count):
+        start = datetime(2025, 6, 1) if n < due else datetime(2025, 6, rng.randint(2, 28))
+        rows.append((n % 1000 + 1, rng.choice((5, 6, 8)), rng.randint(1000, 200000), 'bench', 'monthly',
+                     1, start.strftime(recurring.DATE_FORMAT), start.strftime(recurring.DATE_FORMAT)))
+    conn = database.get_connection(db_file)
+    conn.executemany('''
+    INSERT INTO recurring_rules (user_id, category_id, amount, description, frequency, interval,
+                                 start_date, next_due)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rules', type=int, default=200_000)
+    parser.add_argument('--due', type=int, default=10_000)
+    args = parser.parse_args()
+
+    with temporary_database() as db_file:
+        seed_rules(db_file, args.rules, args.due)
+        print(f"{args.rules} rules, {args.due} due")
+
+        posted, elapsed = timed(lambda: recurring.post_due(datetime(2025, 5, 31), db_file=db_file))
+        print(f"idle tick   {elapsed * 1000:10.2f} ms  {posted} posted")
+
+        posted, elapsed = timed(lambda: recurring.post_due(datetime(2025, 6, 1), db_file=db_file))
+        print(f"due tick    {elapsed * 1000:10.2f} ms  {posted} posted  {posted / elapsed:9.0f} rows/s")
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            _, elapsed = timed(lambda: [add_transaction(n % 1000 + 1, 5, '12.50', 'bench', db_file=db_file)
+                                        for n in range(args.due)])
+        print(f"one by one  {elapsed * 1000:10.2f} ms  {args.due} posted  {args.due / elapsed:9.0f} rows/s")
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
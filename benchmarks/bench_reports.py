@@ -0,0 +1,86 @@
+"""Compare report latency with the original raw-transaction queries.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_reports [--rows N]
+
+The "before" numbers replay the queries get_monthly_summary and
+get_yearly_summary used to run: two totals plus two per-type groupings
+for a month, and two totals plus the monthly breakdown for a year. The
+reports themselves now read the monthly_rollups table; they are timed
+with the report cache off, and "cached" is a repeat call served from it.
+"""
+import argparse
+
+import database
+import report_cache
+import reports
+from benchmarks.common import best_of, seed_ledger, temporary_database
+
+MONTH_QUERIES = [
+    '''SELECT COALESCE(SUM(t.amount), 0) FROM transactions t
+    JOIN categories c ON t.category_id = c.id
+    WHERE t.user_id=? AND c.type='income' AND t.date >= ? AND t.date < ?''',
+    '''SELECT COALESCE(SUM(t.amount), 0) FROM transactions t
+    JOIN categories c ON t.category_id = c.id
+    WHERE t.user_id=? AND c.type='expense' AND t.date >= ? AND t.date < ?''',
+    '''SELECT c.name, COALESCE(SUM(t.amount), 0) FROM transactions t
+    JOIN categories c ON t.category_id = c.id
+    WHERE t.user_id=? AND c.type='income' AND t.date >= ? AND t.date < ?
+    GROUP BY c.name''',
+    '''SELECT c.name, COALESCE(SUM(t.amount), 0) FROM transactions t
+    JOIN categories c ON t.category_id = c.id
+    WHERE t.user_id=? AND c.type='expense' AND t.date >= ? AND t.date < ?
+    GROUP BY c.name''',
+]
+
+YEAR_QUERIES = MONTH_QUERIES[:2] + [
+    '''SELECT strftime('%m', t.date) as month,
+           SUM(CASE WHEN c.type='income' THEN t.amount ELSE 0 END),
+           SUM(CASE WHEN c.type='expense' THEN t.amount ELSE 0 END)
+    FROM transactions t
+    JOIN categories c ON t.category_id = c.id
+    WHERE t.user_id=? AND t.date >= ? AND t.date < ?
+    GROUP BY month ORDER BY month''',
+]
+
+
+def replay(db_file, queries, params):
+    with database.connection(db_file) as conn:
+        for query in queries:
+            conn.execute(query, params).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with temporary_database() as db_file:
+        seed_ledger(db_file, args.rows)
+        month = (1,) + database.month_range(6, 2023)
+        year = (1,) + database.year_range(2023)
+
+        cases = [
+            ('monthly summary',
+             lambda: replay(db_file, MONTH_QUERIES, month),
+             lambda: reports.get_monthly_summary(1, 6, 2023, db_file=db_file)),
+            ('yearly summary',
+             lambda: replay(db_file, YEAR_QUERIES, year),
+             lambda: reports.get_yearly_summary(1, 2023, db_file=db_file)),
+        ]
+        print(f"{args.rows} transactions, best of {args.repeat}")
+        for name, before, after in cases:
+            old = best_of(before, args.repeat)
+            report_cache.configure(0)
+            new = best_of(after, args.repeat)
+            report_cache.configure()
+            after()
+            cached = best_of(after, args.repeat)
+            print(f"{name:16} before {old * 1000:8.1f} ms   after {new * 1000:8.1f} ms"
+                  f"   speedup {old / new:5.2f}x   cached {cached * 1000:8.4f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Measure transaction search with the FTS5 index against LIKE scans.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_search [--transactions 5000000] [--users 1000]
+
+Seeds a ledger whose descriptions are three words drawn from a Zipf
+distributed vocabulary of 5000 made-up words, so some words are in a
+large share of rows and most are rare. For a common, a mid-frequency and
+a rare word, each matched as a whole word, and for the common word as a
+prefix, once cut to three letters and once whole, it times:
+
+  search     search_transactions() for one user, ranked by bm25()
+  newest     the same query ordered newest first instead, which is what
+             ranking costs: bm25() weighs each word by the number of rows
+             across all users that contain it, which it counts by reading
+             the word's whole index
+  like       fetching the same user's rows with description LIKE
+             '%word%', which scans every row of the user
+  all fts    counting the matches across all users through the index
+  all like   the same count with LIKE, a full scan of the ledger
+"""
+import argparse
+import itertools
+import random
+import time
+
+import database
+from benchmarks.common import best_of, temporary_database
+from transactions import _match_expression, search_transactions
+
+VOCABULARY = 5000
+USER = 7
+
+FTS_TRIGGERS = ('trg_fts_insert', 'trg_fts_update', 'trg_fts_delete')
+
+
+def seed(db_file, transactions, users, chunk_size=100_000, seed=42):
+    """Insert random transactions; returns the vocabulary, most frequent word first"""
+    rng = random.Random(seed)
+    words = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(4, 9)))
+             for _ in range(VOCABULARY)]
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, VOCABULARY + 1)))
+    conn = database.create_connection(db_file)
+    conn.executemany('INSERT INTO users (id, username, password) VALUES (?, ?, ?)',
+                     [(u, f'user{u}', '') for u in range(1, users + 1)])
+    # Indexing in one pass afterwards is much faster than row by row
+    for trigger in FTS_TRIGGERS:
+        conn.execute(f'DROP TRIGGER {trigger}')
+    rows = ((rng.randint(1, users), rng.randint(1, 11), rng.randint(100, 50000),
+             ' '.join(rng.choices(words, cum_weights=cum_weights, k=3)),
+             f'20{rng.randint(20, 24)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} 12:00:00')
+            for _ in range(transactions))
+    while chunk := list(itertools.islice(rows, chunk_size)):
+        conn.executemany('''
+        INSERT INTO transactions (user_id, category_id, amount, description, date)
+        VALUES (?, ?, ?, ?, ?)
+        ''', chunk)
+        conn.commit()
+    database.create_full_text_search(conn)
+    database.rebuild_full_text_search(conn)
+    conn.execute('ANALYZE')
+    conn.commit()
+    conn.close()
+    return words
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--transactions', type=int, default=5_000_000)
+    parser.add_argument('--users', type=int, default=1000)
+    args = parser.parse_args()
+
+    with temporary_database() as db_file:
+        started = time.perf_counter()
+        words = seed(db_file, args.transactions, args.users)
+        print(f"{args.transactions} transactions, {args.users} users, "
+              f"seeded and indexed in {time.perf_counter() - started:.1f}s")
+        conn = database.get_connection(db_file)
+
+        def like(pattern):
+            return conn.execute('''
+            SELECT id, category_id, amount, description, date
+            FROM transactions WHERE user_id = ? AND description LIKE ?
+            ''', (USER, pattern)).fetchall()
+
+        def newest(query, prefix):
+            return conn.execute('''
+            SELECT t.id, t.category_id, t.amount, t.description, t.date
+            FROM transactions_fts CROSS JOIN transactions t ON t.id = transactions_fts.rowid
+            WHERE transactions_fts MATCH ? AND t.user_id = ?
+            ORDER BY t.date DESC, t.id DESC
+            LIMIT 20
+            ''', (_match_expression(USER, query, prefix), USER)).fetchall()
+
+        queries = [('common', words[0], False), ('mid', words[100], False),
+                   ('rare', words[4000], False), ('common', words[0][:3], True),
+                   ('common', words[0], True)]
+        print(f"{'':18} {'search':>10} {'newest':>10} {'like':>10} {'all fts':>10} {'all like':>10}  (ms)")
+        for label, query, prefix in queries:
+            star = '*' if prefix else ''
+            search = best_of(lambda: search_transactions(USER, query, prefix=prefix, db_file=db_file))
+            unranked = best_of(lambda: newest(query, prefix))
+            scan = best_of(lambda: like(f'%{query}%'))
+            everyone = best_of(lambda: conn.execute(
+                'SELECT COUNT(*) FROM transactions_fts WHERE transactions_fts MATCH ?',
+                (f'description:"{query}"{star}',)).fetchone(), repeat=3)
+            full = best_of(lambda: conn.execute(
+                'SELECT COUNT(*) FROM transactions WHERE description LIKE ?',
+                (f'%{query}%',)).fetchone(), repeat=1)
+            print(f"{label:7} {query + star:10} {search * 1000:10.2f} {unranked * 1000:10.2f} "
+                  f"{scan * 1000:10.2f} {everyone * 1000:10.2f} {full * 1000:10.2f}")
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
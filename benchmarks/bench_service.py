@@ -0,0 +1,74 @@
+"""Load-test FinanceService at several concurrency levels.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_service [--requests N] [--levels 1,8,32,128]
+
+Each virtual client loops over a mix of 80% reads (monthly summary,
+recent transactions, budget status) and 20% transaction inserts until the
+shared request budget is spent. Throughput and p50/p99 latency are
+reported per concurrency level.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+import time
+
+import auth
+from benchmarks.bench_auth import percentiles
+from benchmarks.common import seed_ledger, temporary_database
+from service import FinanceService
+
+
+async def client(service, remaining, latencies, rng, tokens):
+    while remaining[0] > 0:
+        remaining[0] -= 1
+        token = rng.choice(tokens)
+        roll = rng.random()
+        start = time.perf_counter()
+        if roll < 0.2:
+            await service.add_transaction(token, rng.randint(4, 11), rng.randint(1, 500))
+        elif roll < 0.5:
+            await service.monthly_summary(token, rng.randint(1, 12), 2023)
+        elif roll < 0.8:
+            await service.list_transactions(token, 20)
+        else:
+            await service.budget_status(token, rng.randint(1, 12), 2023)
+        latencies.append(time.perf_counter() - start)
+
+
+async def run_level(db_file, concurrency, requests, users):
+    latencies = []
+    remaining = [requests]
+    # The seeded users have no passwords, so open their sessions directly
+    tokens = [auth.sessions.create(user_id) for user_id in range(1, users + 1)]
+    async with FinanceService(db_file, readers=4, max_pending=concurrency * 2) as service:
+        start = time.perf_counter()
+        await asyncio.gather(*[client(service, remaining, latencies, random.Random(i), tokens)
+                               for i in range(concurrency)])
+        elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, percentiles(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--levels', default='1,8,32,128')
+    parser.add_argument('--users', type=int, default=100)
+    args = parser.parse_args()
+
+    with temporary_database() as db_file:
+        seed_ledger(db_file, 200_000, users=args.users)
+        results = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for level in map(int, args.levels.split(',')):
+                results.append((level, *asyncio.run(run_level(db_file, level, args.requests, args.users))))
+
+    for level, throughput, (p50, p99) in results:
+        print(f"concurrency {level:4}   {throughput:8.0f} req/s   p50 {p50:7.2f} ms   p99 {p99:7.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""Measure the CLI's cold start: imports and schema setup.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_startup [--runs 20] [--baseline REV]
+
+Each run is a fresh interpreter, so nothing is cached between them. It
+times, best of `runs`:
+
+  imports      importing finance_app, from python -X importtime
+  schema       database.initialize_database() on a database that is
+               already current, as on every launch after the first
+  migrate      the same on a new, empty database
+  process      the whole process for both imports and schema, including
+               interpreter start
+  post due     recurring.post_due() on a current database with nothing
+               due; launches run it on the scheduler thread, off the
+               startup path, so it is not part of process
+
+and lists the modules whose import took longest, own time only.
+
+With --baseline, the same runs are made against a copy of the tree at
+git revision REV, exported with git archive, and shown alongside.
+"""
+import argparse
+import io
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+STARTUP = '''
+import time
+start = time.perf_counter()
+import finance_app
+from database import initialize_database
+imported = time.perf_counter()
+initialize_database({db_file!r})
+print(imported - start, time.perf_counter() - imported)
+'''
+
+POST_DUE = '''
+import time
+from recurring import post_due
+start = time.perf_counter()
+post_due(db_file={db_file!r})
+print(time.perf_counter() - start)
+'''
+
+
+def run(code, cwd):
+    return subprocess.run([sys.executable, *code], capture_output=True, text=True, check=True, cwd=cwd)
+
+
+def import_times(cwd):
+    """Return {module: (own, cumulative) microseconds} for importing finance_app"""
+    times = {}
+    for line in run(['-X', 'importtime', '-c', 'import finance_app'], cwd).stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[0].split(':')[-1].strip().isdigit():
+            times[parts[2].strip()] = (int(parts[0].split(':')[-1]), int(parts[1]))
+    return times
+
+
+def export_tree(rev, path):
+    """Write the files of git revision rev into path"""
+    archive = subprocess.run(['git', 'archive', rev], capture_output=True, check=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(path)
+
+
+def measure(tree, tmp, runs):
+    """Return ({column: best seconds}, import times of the fastest run) for the tree at path tree"""
+    current = os.path.join(tmp, 'current.db')
+    run(['-c', STARTUP.format(db_file=current)], tree)
+    # Older trees have no recurring transactions
+    has_recurring = os.path.exists(os.path.join(tree, 'recurring.py'))
+
+    imports, schema, migrate, process, post = [], [], [], [], []
+    for n in range(runs):
+        started = time.perf_counter()
+        output = run(['-c', STARTUP.format(db_file=current)], tree).stdout.split()
+        process.append(time.perf_counter() - started)
+        schema.append(float(output[1]))
+        fresh = os.path.join(tmp, f'new{n}.db')
+        migrate.append(float(run(['-c', STARTUP.format(db_file=fresh)], tree).stdout.split()[1]))
+        if has_recurring:
+            post.append(float(run(['-c', POST_DUE.format(db_file=current)], tree).stdout))
+        imports.append(import_times(tree))
+
+    best = min(imports, key=lambda times: times['finance_app'][1])
+    results = {
+        'imports': best['finance_app'][1] / 1e6,
+        'schema': min(schema),
+        'migrate': min(migrate),
+        'process': min(process),
+        'post due': min(post) if post else None,
+    }
+    return results, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--baseline', metavar='REV', help="git revision to compare against")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.mkdir(os.path.join(tmp, 'current'))
+        results, best = measure(os.getcwd(), os.path.join(tmp, 'current'), args.runs)
+        baseline = None
+        if args.baseline:
+            tree = os.path.join(tmp, 'baseline')
+            export_tree(args.baseline, tree)
+            baseline, _ = measure(tree, tree, args.runs)
+
+    def ms(seconds):
+        return '       -' if seconds is None else f"{seconds * 1000:8.2f}"
+
+    if baseline:
+        print(f"{'':10}{'baseline':>8}  {'current':>8}  (ms)")
+        for column, seconds in results.items():
+            print(f"{column:10}{ms(baseline[column])}  {ms(seconds)}")
+    else:
+        for column, seconds in results.items():
+            print(f"{column:10}{ms(seconds)} ms")
+    print("\nslowest imports (own ms)")
+    for module, (own, _) in sorted(best.items(), key=lambda item: -item[1][0])[:10]:
+        print(f"  {module:24} {own / 1000:6.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Compare per-call commits with WriteQueue group commits.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_write_queue [--seconds 3] [--producers 1,8,64]
+                                           [--synchronous FULL]
+
+Each producer thread inserts transactions back to back for the given
+number of seconds, either through add_transaction(), which commits every
+write on the thread's own connection, or through a shared WriteQueue,
+waiting for each write's future before sending the next. Sustained
+writes/sec, failed writes and, for the queue, the mean batch size are
+reported per producer count. The pooled connections use synchronous=NORMAL,
+which in WAL mode skips the fsync on commit; pass --synchronous FULL to
+measure the fsync-per-commit case that group commit is meant for.
+"""
+import argparse
+import contextlib
+import io
+import threading
+import time
+
+import database
+from benchmarks.common import temporary_database
+from transactions import add_transaction
+from write_queue import DEFAULT_MAX_LATENCY, WriteQueue
+
+
+def run_producers(count, seconds, write):
+    """Run `count` threads calling write(n) until time is up; returns (ok, failed)"""
+    results = [[0, 0] for _ in range(count)]
+    deadline = time.perf_counter() + seconds
+
+    def produce(n):
+        tally = results[n]
+        while time.perf_counter() < deadline:
+            tally[0 if write(n) else 1] += 1
+
+    threads = [threading.Thread(target=produce, args=(n,)) for n in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(ok for ok, _ in results), sum(failed for _, failed in results)
+
+
+def direct(db_file, count, seconds):
+    def write(n):
+        return add_transaction(n + 1, 4, '9.99', 'bench', db_file=db_file)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        return (*run_producers(count, seconds, write), None)
+
+
+def queued(db_file, count, seconds, max_batch, max_latency):
+    with WriteQueue(db_file, max_batch=max_batch, max_latency=max_latency) as writes:
+        def write(n):
+            try:
+                return writes.add_transaction(n + 1, 4, '9.99', 'bench').result()
+            except Exception:
+                return False
+
+        ok, failed = run_producers(count, seconds, write)
+    return ok, failed, writes.writes / max(writes.batches, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--producers', default='1,8,64')
+    parser.add_argument('--max-batch', type=int, default=256)
+    parser.add_argument('--max-latency', type=float, default=DEFAULT_MAX_LATENCY)
+    parser.add_argument('--synchronous', default=database.PRAGMAS['synchronous'])
+    args = parser.parse_args()
+    database.configure(synchronous=args.synchronous)
+
+    for count in map(int, args.producers.split(',')):
+        for name, run in (('direct', direct), ('queued', queued)):
+            with temporary_database() as db_file:
+                extra = (args.max_batch, args.max_latency) if run is queued else ()
+                ok, failed, batch = run(db_file, count, args.seconds, *extra)
+            line = (f"{count:3} producers  {name:6}  {ok / args.seconds:9.0f} writes/s"
+                    f"  {failed:6} failed")
+            if batch is not None:
+                line += f"  {batch:6.1f} writes/batch"
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
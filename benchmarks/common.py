@@ -0,0 +1,59 @@
+"""Shared helpers for the benchmark scripts"""
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import database
+
+
+@contextlib.contextmanager
+def temporary_database(name='bench.db'):
+    """Yield the path of a freshly initialized database in a temp dir"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, name)
+        database.initialize_database(db_file)
+        try:
+            yield db_file
+        finally:
+            database.close_connections()
+
+
+def seed_ledger(db_file, rows, users=1, start_year=2020, years=5, seed=42):
+    """Insert `rows` random transactions spread over users and years"""
+    rng = random.Random(seed)
+    conn = database.create_connection(db_file)
+    conn.executemany('INSERT OR IGNORE INTO users (id, username, password) VALUES (?, ?, ?)',
+                     [(u, f'user{u}', '') for u in range(1, users + 1)])
+    category_ids = [row[0] for row in conn.execute('SELECT id FROM categories')]
+    origin = datetime(start_year, 1, 1)
+    span = int(timedelta(days=365 * years).total_seconds())
+
+    def generate():
+        for _ in range(rows):
+            date = origin + timedelta(seconds=rng.randrange(span))
+            yield (rng.randint(1, users), rng.choice(category_ids),
+                   rng.randint(100, 50000), 'seed',
+                   date.strftime('%Y-%m-%d %H:%M:%S'))
+
+    conn.executemany('''
+    INSERT INTO transactions (user_id, category_id, amount, description, date)
+    VALUES (?, ?, ?, ?, ?)
+    ''', generate())
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+
+
+def best_of(func, repeat=5):
+    """Return the fastest wall-clock time of `repeat` calls to func"""
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+    return min(timings)
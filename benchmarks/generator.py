@@ -0,0 +1,153 @@
+"""Seeded synthetic ledgers for benchmarks.
+
+    python -m benchmarks.generator OUT.db [--users 1000] [--transactions 1000000]
+                                          [--years 3] [--seed 42]
+
+generate() fills a database with users, monthly budgets and transactions
+spread over whole years. Category mix and amounts follow a simple
+household profile: a salary a month, rent, utilities, many small food and
+transport purchases, occasional larger ones. Each user has an income
+scale, so users differ in the size of their ledgers' amounts. The same
+seed always produces the same data.
+
+The rollup, change-log and search index triggers are dropped while
+transactions are bulk inserted, and the rollups and search index are
+rebuilt afterwards, which makes tens of millions of rows practical.
+"""
+import argparse
+import itertools
+import math
+import random
+import time
+from datetime import datetime, timedelta
+
+import database
+from auth import hash_password
+
+# Category: (share of transactions, median amount in dollars, descriptions)
+PROFILE = {
+    'Salary': (0.06, 3500, ('Monthly salary', 'Payroll')),
+    'Bonus': (0.01, 1000, ('Performance bonus', 'Holiday bonus')),
+    'Investment': (0.03, 250, ('Dividend', 'Interest')),
+    'Food': (0.40, 25, ('Groceries', 'Restaurant', 'Coffee', 'Takeaway')),
+    'Rent': (0.04, 1500, ('Rent',)),
+    'Transportation': (0.15, 15, ('Fuel', 'Bus pass', 'Taxi', 'Parking')),
+    'Entertainment': (0.10, 40, ('Cinema', 'Concert', 'Streaming', 'Games')),
+    'Utilities': (0.06, 120, ('Electricity', 'Water', 'Internet', 'Phone')),
+    'Healthcare': (0.04, 80, ('Pharmacy', 'Doctor', 'Dentist')),
+    'Education': (0.02, 200, ('Course', 'Books')),
+    'Other': (0.09, 30, ('Gift', 'Household', 'Clothing')),
+}
+
+# Expense categories given a monthly budget, with the budget in dollars
+BUDGETED = {'Food': 600, 'Transportation': 200, 'Entertainment': 150, 'Utilities': 250}
+
+AMOUNT_SIGMA = 0.6
+DEFAULT_PASSWORD = 'password'
+
+TRIGGERS = ('trg_rollup_insert', 'trg_rollup_delete', 'trg_rollup_update',
+            'trg_changes_transactions_insert', 'trg_changes_transactions_update',
+            'trg_changes_transactions_delete',
+            'trg_fts_insert', 'trg_fts_update', 'trg_fts_delete')
+
+
+def _transactions(rng, categories, scales, count, start, span_seconds):
+    names = list(PROFILE)
+    cum_weights = list(itertools.accumulate(PROFILE[name][0] for name in names))
+    for _ in range(count):
+        user_id = rng.randrange(len(scales)) + 1
+        name = rng.choices(names, cum_weights=cum_weights)[0]
+        _, median, descriptions = PROFILE[name]
+        cents = round(median * 100 * scales[user_id - 1] * rng.lognormvariate(0, AMOUNT_SIGMA))
+        date = start + timedelta(seconds=rng.randrange(span_seconds))
+        yield (user_id, categories[name], max(cents, 1), rng.choice(descriptions),
+               date.strftime('%Y-%m-%d %H:%M:%S'))
+
+
+def generate(db_file, users=1000, transactions=1_000_000, years=3, start_year=None, seed=42,
+             chunk_size=50_000, progress=None):
+    """Fill db_file with a synthetic ledger; returns the number of rows per table.
+
+    Users are named user1, user2, ... and all share DEFAULT_PASSWORD.
+    Transactions and budgets cover `years` whole calendar years from
+    start_year, which defaults to ending with last year.
+    progress, if given, is called with the number of transactions inserted
+    so far after each chunk.
+    """
+    rng = random.Random(seed)
+    start_year = start_year or datetime.now().year - years
+    database.initialize_database(db_file)
+    conn = database.create_connection(db_file)
+    try:
+        categories = dict(conn.execute('SELECT name, id FROM categories'))
+        # A single hash keeps seeding fast; login still runs the full KDF
+        password = hash_password(DEFAULT_PASSWORD)
+        first_user = conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM users').fetchone()[0]
+        if first_user != 1:
+            raise ValueError(f"{db_file} already has users; generate into a fresh database")
+        conn.executemany('INSERT INTO users (id, username, password) VALUES (?, ?, ?)',
+                         [(u, f'user{u}', password) for u in range(1, users + 1)])
+        scales = [math.exp(rng.gauss(0, 0.3)) for _ in range(users)]
+
+        conn.executemany('''
+        INSERT INTO budgets (user_id, category_id, amount, month, year) VALUES (?, ?, ?, ?, ?)
+        ''', ((u, categories[name], round(dollars * scales[u - 1] / 10) * 1000, month, year)
+              for u in range(1, users + 1)
+              for year in range(start_year, start_year + years)
+              for month in range(1, 13)
+              for name, dollars in BUDGETED.items()))
+        conn.commit()
+
+        for trigger in TRIGGERS:
+            conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        start = datetime(start_year, 1, 1)
+        span = int((datetime(start_year + years, 1, 1) - start).total_seconds())
+        rows = _transactions(rng, categories, scales, transactions, start, span)
+        inserted = 0
+        while inserted < transactions:
+            chunk = [row for _, row in zip(range(chunk_size), rows)]
+            conn.executemany('''
+            INSERT INTO transactions (user_id, category_id, amount, description, date)
+            VALUES (?, ?, ?, ?, ?)
+            ''', chunk)
+            conn.commit()
+            inserted += len(chunk)
+            if progress:
+                progress(inserted)
+
+        database.create_rollups(conn)
+        database.rebuild_rollups(conn)
+        database.create_change_tracking(conn)
+        database.create_full_text_search(conn)
+        database.rebuild_full_text_search(conn)
+        conn.execute('ANALYZE')
+        conn.commit()
+        return {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                for table in ('users', 'categories', 'budgets', 'transactions')}
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('db_file')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--transactions', type=int, default=1_000_000)
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--start-year', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+
+    def progress(inserted):
+        print(f"\rInserted {inserted:,} transactions", end='', flush=True)
+
+    counts = generate(args.db_file, args.users, args.transactions, args.years, args.start_year,
+                      args.seed, progress=progress)
+    print(f"\nGenerated {', '.join(f'{n:,} {table}' for table, n in counts.items())} "
+          f"in {time.perf_counter() - started:.1f}s.")
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,291 @@
+"""Benchmark every public data function and compare runs.
+
+Run from the repository root:
+
+    python -m benchmarks.suite run [--out results.json] [--users 200]
+                                   [--transactions 200000] [--years 3] [--seed 42]
+                                   [--db ledger.db] [--repeat 20]
+    python -m benchmarks.suite compare BASELINE.json CURRENT.json [--threshold 0.25]
+
+run builds a ledger with benchmarks.generator, or copies the one given
+with --db, so write cases never touch it. It then calls each function
+`repeat` times with seeded arguments and records wall-clock min, median
+and p95 time, SQL statements per call and peak traced memory of one call.
+Results go to --out as JSON.
+
+compare reads two result files and flags a function as a regression when
+both its fastest and median time, or its peak memory, grew by more than
+the threshold, or when it now runs more statements per call. It exits with status 1 if anything
+regressed, so it can gate a CI job.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime
+from functools import partial
+
+import auth
+import budget
+import database
+import reports
+import transactions
+from benchmarks.generator import DEFAULT_PASSWORD, generate
+
+DEFAULT_REPEAT = 20
+# The password functions run the full KDF, so they get fewer calls
+KDF_REPEAT = 5
+DEFAULT_THRESHOLD = 0.25
+# Differences smaller than these are noise, whatever the ratio
+MIN_DELTA_MS = 0.05
+MIN_DELTA_KIB = 16
+
+
+@dataclass
+class Context:
+    db_file: str
+    users: int
+    years: list
+    rng: random.Random
+    samples: list
+
+    def user(self):
+        return self.rng.randint(1, self.users)
+
+    def month(self):
+        return self.rng.randint(1, 12), self.rng.choice(self.years)
+
+
+def _sample_transactions(db_file, count, rng):
+    """Pick existing (id, user_id) pairs for the update and delete cases"""
+    conn = database.get_connection(db_file)
+    low, high = conn.execute('SELECT MIN(id), MAX(id) FROM transactions').fetchone()
+    samples = []
+    while len(samples) < count and low is not None:
+        row = conn.execute('SELECT id, user_id FROM transactions WHERE id >= ? LIMIT 1',
+                           (rng.randint(low, high),)).fetchone()
+        if row not in samples:
+            samples.append(row)
+    return samples
+
+
+# Each case maps a context and a call number to the call to time, so
+# choosing arguments stays outside the measurement. Cases run in this
+# order, reads before the writes that change the data.
+CASES = [
+    ('list_categories', lambda ctx, i: partial(
+        transactions.list_categories, db_file=ctx.db_file)),
+    ('list_transactions', lambda ctx, i: partial(
+        transactions.list_transactions, ctx.user(), 10, db_file=ctx.db_file)),
+    ('get_transactions_page', lambda ctx, i: partial(
+        transactions.get_transactions_page, ctx.user(), 50, (f'{ctx.years[0]}-07-01 00:00:00', 0),
+        db_file=ctx.db_file)),
+    ('get_monthly_summary', lambda ctx, i: partial(
+        reports.get_monthly_summary, ctx.user(), *ctx.month(), db_file=ctx.db_file)),
+    ('get_yearly_summary', lambda ctx, i: partial(
+        reports.get_yearly_summary, ctx.user(), ctx.rng.choice(ctx.years), db_file=ctx.db_file)),
+    ('get_budget_status', lambda ctx, i: partial(
+        budget.get_budget_status, ctx.user(), *ctx.month(), db_file=ctx.db_file)),
+    ('get_budget_statuses', lambda ctx, i: partial(
+        budget.get_budget_statuses, [ctx.user() for _ in range(10)], 1, ctx.years[-1], 12,
+        ctx.years[-1], db_file=ctx.db_file)),
+    ('login_user', lambda ctx, i: partial(
+        auth.login_user, f'user{ctx.user()}', DEFAULT_PASSWORD, db_file=ctx.db_file)),
+    ('register_user', lambda ctx, i: partial(
+        auth.register_user, f'bench{i}', 'secret', db_file=ctx.db_file)),
+    ('change_password', lambda ctx, i: partial(
+        auth.change_password, ctx.user(), DEFAULT_PASSWORD, DEFAULT_PASSWORD, db_file=ctx.db_file)),
+    ('add_transaction', lambda ctx, i: partial(
+        transactions.add_transaction, ctx.user(), 4, '12.50', 'bench', db_file=ctx.db_file)),
+    ('bulk_add_transactions', lambda ctx, i: partial(
+        transactions.bulk_add_transactions, ctx.user(),
+        [('Food', '9.99', 'bench', f'{ctx.years[-1]}-06-{day % 28 + 1:02d} 12:00:00') for day in range(100)],
+        db_file=ctx.db_file)),
+    ('set_budget', lambda ctx, i: partial(
+        budget.set_budget, ctx.user(), 4, '450', *ctx.month(), db_file=ctx.db_file)),
+    ('update_transaction', lambda ctx, i: partial(
+        transactions.update_transaction, *ctx.samples[i % len(ctx.samples)], amount='3.21',
+        db_file=ctx.db_file)),
+    ('delete_transaction', lambda ctx, i: partial(
+        transactions.delete_transaction, *ctx.samples[-1 - i % len(ctx.samples)], db_file=ctx.db_file)),
+]
+
+KDF_CASES = {'login_user', 'register_user', 'change_password'}
+
+
+def measure(ctx, prepare, repeat):
+    """Time `repeat` calls of one case and count their statements and memory"""
+    conn = database.get_connection(ctx.db_file)
+    statements = []
+    timings = []
+    # One untimed call first, so every case starts with a warm cache
+    prepare(ctx, -1)()
+    conn.set_trace_callback(statements.append)
+    try:
+        for i in range(repeat):
+            call = prepare(ctx, i)
+            start = time.perf_counter()
+            call()
+            timings.append(time.perf_counter() - start)
+    finally:
+        conn.set_trace_callback(None)
+
+    # Measured apart from the timings, which tracing would slow down
+    call = prepare(ctx, repeat)
+    tracemalloc.start()
+    try:
+        call()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    ordered = sorted(timings)
+    return {
+        'runs': repeat,
+        'min_ms': ordered[0] * 1000,
+        'median_ms': statistics.median(ordered) * 1000,
+        'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        # Statements run by triggers are reported as comments; skip them
+        'queries': sum(not sql.startswith('--') for sql in statements) / repeat,
+        'peak_kib': peak / 1024,
+    }
+
+
+def run(db_file, repeat=DEFAULT_REPEAT, seed=42, progress=None):
+    """Run every case against db_file, which it modifies; returns the results dict"""
+    rng = random.Random(seed)
+    conn = database.get_connection(db_file)
+    users = conn.execute('SELECT MAX(id) FROM users').fetchone()[0]
+    first, last = conn.execute(
+        'SELECT MIN(substr(date, 1, 4)), MAX(substr(date, 1, 4)) FROM transactions').fetchone()
+    years = list(range(int(first), int(last) + 1))
+    ctx = Context(db_file, users, years, rng, _sample_transactions(db_file, 2 * repeat, rng))
+
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name, prepare in CASES:
+            count = min(repeat, KDF_REPEAT) if name in KDF_CASES else repeat
+            results[name] = measure(ctx, prepare, count)
+            if progress:
+                progress(name, results[name])
+    return results
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """Return (name, metric, old, new) for each regression from baseline to current"""
+    regressions = []
+    for name, new in current['results'].items():
+        old = baseline['results'].get(name)
+        if old is None:
+            continue
+        # Both the fastest and the typical call must be slower, so one
+        # noisy run does not count as a regression
+        if all(new[key] > old[key] * (1 + threshold) and new[key] - old[key] > MIN_DELTA_MS
+               for key in ('min_ms', 'median_ms')):
+            regressions.append((name, 'median_ms', old['median_ms'], new['median_ms']))
+        if new['queries'] > old['queries']:
+            regressions.append((name, 'queries', old['queries'], new['queries']))
+        if (new['peak_kib'] > old['peak_kib'] * (1 + threshold)
+                and new['peak_kib'] - old['peak_kib'] > MIN_DELTA_KIB):
+            regressions.append((name, 'peak_kib', old['peak_kib'], new['peak_kib']))
+    return regressions
+
+
+def _run_command(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, 'suite.db')
+        if args.db_file:
+            shutil.copyfile(args.db_file, db_file)
+            dataset = {'source': os.path.abspath(args.db_file)}
+        else:
+            dataset = generate(db_file, args.users, args.transactions, args.years, seed=args.seed)
+
+        def progress(name, result):
+            print(f"{name:24} {result['median_ms']:9.3f} ms  {result['queries']:5.1f} queries"
+                  f"  {result['peak_kib']:8.1f} KiB", file=sys.stderr)
+
+        try:
+            results = run(db_file, args.repeat, args.seed, progress)
+        finally:
+            database.close_connections()
+
+    report = {
+        'meta': {
+            'created': datetime.now().isoformat(' ', 'seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'dataset': dataset,
+        },
+        'results': results,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.out}.")
+
+
+def _compare_command(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    if baseline['meta'].get('dataset') != current['meta'].get('dataset'):
+        print("Warning: the runs used different datasets.")
+
+    for name, new in current['results'].items():
+        old = baseline['results'].get(name)
+        if old is None:
+            print(f"{name:24} {new['median_ms']:9.3f} ms  (new)")
+        else:
+            ratio = new['median_ms'] / old['median_ms'] if old['median_ms'] else float('inf')
+            print(f"{name:24} {old['median_ms']:9.3f} -> {new['median_ms']:9.3f} ms  {ratio:5.2f}x"
+                  f"  queries {old['queries']:g} -> {new['queries']:g}")
+
+    regressions = compare(baseline, current, args.threshold)
+    for name, metric, old, new in regressions:
+        print(f"REGRESSION {name}: {metric} {old:.3f} -> {new:.3f}")
+    if regressions:
+        sys.exit(1)
+    print("No regressions.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run')
+    run_parser.add_argument('--out', default='bench_results.json')
+    run_parser.add_argument('--db', dest='db_file', default=None)
+    run_parser.add_argument('--users', type=int, default=200)
+    run_parser.add_argument('--transactions', type=int, default=200_000)
+    run_parser.add_argument('--years', type=int, default=3)
+    run_parser.add_argument('--seed', type=int, default=42)
+    run_parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+
+    compare_parser = commands.add_parser('compare')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        _run_command(args)
+    else:
+        _compare_command(args)
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
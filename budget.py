@@ -1,116 +1,86 @@
 import sqlite3
-from prettytable import PrettyTable
-from datetime import datetime
-from database import create_connection
+from functools import partial
+from sqlite3 import Error
+from categories import category_name, lookup
+from database import after_commit, connection
+import report_cache
+from models import BudgetStatus
+from money import Money
 
 
-def set_budget(user_id, category_id, amount, month, year):
+def set_budget(user_id, category_id, amount, month, year, db_file=None):
     """Set or update a budget for a category"""
-    conn = create_connection()
-    if conn is not None:
-        try:
+    try:
+        # Check if category exists and is an expense category
+        category = lookup(category_id, db_file)
+        if category is None or category.type != 'expense':
+            print("Invalid category ID or category is not an expense type.")
+            return False
+
+        with connection(db_file) as conn:
             cursor = conn.cursor()
 
-            # Check if category exists and is an expense category
-            cursor.execute('SELECT id FROM categories WHERE id=? AND type="expense"', (category_id,))
-            if not cursor.fetchone():
-                print("Invalid category ID or category is not an expense type.")
-                return False
-
-            # Insert or replace budget
+            # An upsert rather than INSERT OR REPLACE keeps the budget's id,
+            # so the change log sees an update instead of a new row
             cursor.execute('''
-            INSERT OR REPLACE INTO budgets (user_id, category_id, amount, month, year)
+            INSERT INTO budgets (user_id, category_id, amount, month, year)
             VALUES (?, ?, ?, ?, ?)
-            ''', (user_id, category_id, amount, month, year))
-            conn.commit()
-            print("Budget set successfully!")
-            return True
-        except Error as e:
-            print(f"Error setting budget: {e}")
-        finally:
-            conn.close()
+            ON CONFLICT (user_id, category_id, month, year) DO UPDATE SET amount = excluded.amount
+            ''', (user_id, category.id, Money.of(amount), month, year))
+            after_commit(partial(report_cache.invalidate_budget, user_id, month, year, db_file), db_file)
+        print("Budget set successfully!")
+        return True
+    except Error as e:
+        print(f"Error setting budget: {e}")
     return False
 
 
-def get_budget_status(user_id, month, year):
-    """Get budget status for the month"""
-    conn = create_connection()
-    if conn is not None:
-        try:
-            cursor = conn.cursor()
-
-            # Get all budgets for the month
-            cursor.execute('''
-            SELECT b.category_id, c.name, b.amount
-            FROM budgets b
-            JOIN categories c ON b.category_id = c.id
-            WHERE b.user_id=? AND b.month=? AND b.year=?
-            ''', (user_id, month, year))
-            budgets = cursor.fetchall()
-
-            if not budgets:
-                print("No budgets set for this month.")
-                return None
-
-            # Get actual expenses for each budget category
-            budget_status = []
-            for budget in budgets:
-                category_id, category_name, budget_amount = budget
-
-                cursor.execute('''
-                SELECT COALESCE(SUM(amount), 0)
-                FROM transactions
-                WHERE user_id=? AND category_id=?
-                AND strftime('%m', date) = ? AND strftime('%Y', date) = ?
-                ''', (user_id, category_id, f"{month:02d}", str(year)))
-                actual_expense = cursor.fetchone()[0]
-
-                remaining = budget_amount - actual_expense
-                percentage = (actual_expense / budget_amount) * 100 if budget_amount > 0 else 0
-
-                budget_status.append({
-                    'category_id': category_id,
-                    'category_name': category_name,
-                    'budget': budget_amount,
-                    'spent': actual_expense,
-                    'remaining': remaining,
-                    'percentage': percentage
-                })
-
-            # Print budget status
-            print(f"\nBudget Status for {month}/{year}")
-            print("=" * 40)
-
-            table = PrettyTable()
-            table.field_names = ["Category", "Budget", "Spent", "Remaining", "Percentage"]
-
-            for status in budget_status:
-                percentage_str = f"{status['percentage']:.1f}%"
-                if status['percentage'] > 100:
-                    percentage_str = f"\033[91m{percentage_str}\033[0m"  # Red color for exceeded
-                elif status['percentage'] > 80:
-                    percentage_str = f"\033[93m{percentage_str}\033[0m"  # Yellow color for warning
-
-                table.add_row([
-                    status['category_name'],
-                    f"${status['budget']:.2f}",
-                    f"${status['spent']:.2f}",
-                    f"${status['remaining']:.2f}",
-                    percentage_str
-                ])
-
-            print(table)
-
-            # Check for exceeded budgets
-            exceeded = [s for s in budget_status if s['remaining'] < 0]
-            if exceeded:
-                print("\n\033[91mWarning: Budget exceeded for categories:\033[0m")
-                for category in exceeded:
-                    print(f"- {category['category_name']} (over by ${-category['remaining']:.2f})")
-
-            return budget_status
-        except Error as e:
-            print(f"Error getting budget status: {e}")
-        finally:
-            conn.close()
-    return None
\ No newline at end of file
+def _fetch_budget_status(cursor, user_ids, first, last, db_file=None):
+    """Return budget status rows for user_ids between two (month, year) periods.
+
+    Each budget is LEFT JOINed to the monthly rollup row of its own user,
+    category and month, so every period and user is answered by one query.
+    Category names come from the cached catalog.
+    """
+    placeholders = ', '.join('?' * len(user_ids))
+    cursor.execute(f'''
+    SELECT b.user_id, b.month, b.year, b.category_id, b.amount, COALESCE(r.total, 0)
+    FROM budgets b
+    LEFT JOIN monthly_rollups r
+      ON r.user_id = b.user_id AND r.year = b.year
+     AND r.month = b.month AND r.category_id = b.category_id
+    WHERE b.user_id IN ({placeholders})
+      AND b.year * 12 + b.month BETWEEN ? AND ?
+    ''', (*user_ids, first[1] * 12 + first[0], last[1] * 12 + last[0]))
+
+    statuses = [BudgetStatus(user_id, month, year, category_id, category_name(category_id, db_file),
+                             Money(budget), Money(spent), Money(budget - spent),
+                             spent * 100.0 / budget if budget > 0 else 0)
+                for user_id, month, year, category_id, budget, spent in cursor.fetchall()]
+    statuses.sort(key=lambda status: (status.user_id, status.year, status.month, status.category_name))
+    return statuses
+
+
+def get_budget_statuses(user_ids, start_month, start_year, end_month=None, end_year=None, db_file=None):
+    """Get budget status for several users over a range of months in one query.
+
+    The range is inclusive and defaults to the single starting month.
+    """
+    if end_month is None or end_year is None:
+        end_month, end_year = start_month, start_year
+    user_ids = list(user_ids)
+    if not user_ids:
+        return []
+    try:
+        with connection(db_file) as conn:
+            return _fetch_budget_status(conn.cursor(), user_ids,
+                                        (start_month, start_year), (end_month, end_year), db_file)
+    except Error as e:
+        print(f"Error getting budget status: {e}")
+    return None
+
+
+def get_budget_status(user_id, month, year, db_file=None):
+    """Get budget status for the month, from the report cache if it is there"""
+    return report_cache.cached(report_cache.BUDGET, user_id, year, month, db_file,
+                               get_budget_statuses, [user_id], month, year, None, None, db_file)
\ No newline at end of file
@@ -0,0 +1,101 @@
+"""In-process cache of the categories table.
+
+Categories are seeded by database.create_tables and rarely change, so
+validation and the naming of report rows read them from memory instead
+of querying or joining the table. The catalog for each database file is
+loaded on first use. Code that writes to categories must call
+invalidate(); add_category() does. A lookup for an id the catalog does
+not know reloads it once, so a category added by another process is
+still found.
+"""
+import threading
+from sqlite3 import Error
+
+from database import DEFAULT_DB_FILE, connection
+from models import Category
+
+
+class CategoryCatalog:
+    """An immutable snapshot of the categories table"""
+
+    def __init__(self, categories):
+        self.categories = sorted(categories, key=lambda category: (category.type, category.name))
+        self._by_id = {category.id: category for category in self.categories}
+        self._by_name = {category.name.lower(): category for category in self.categories}
+
+    def __len__(self):
+        return len(self.categories)
+
+    def __iter__(self):
+        return iter(self.categories)
+
+    def get(self, category_id):
+        """Return the Category with this id, which may be a numeric string, or None"""
+        try:
+            return self._by_id.get(int(category_id))
+        except (TypeError, ValueError):
+            return None
+
+    def find(self, key):
+        """Return the Category matching an id or a case-insensitive name, or None"""
+        if isinstance(key, str) and not key.strip().isdigit():
+            return self._by_name.get(key.strip().lower())
+        return self.get(key)
+
+    def ids_of_type(self, category_type):
+        return [category.id for category in self.categories if category.type == category_type]
+
+
+_lock = threading.Lock()
+_catalogs = {}
+
+
+def get_catalog(db_file=None):
+    """Return the cached CategoryCatalog for db_file, loading it if needed"""
+    db_file = db_file or DEFAULT_DB_FILE
+    catalog = _catalogs.get(db_file)
+    if catalog is None:
+        with connection(db_file) as conn:
+            rows = conn.execute('SELECT id, name, type FROM categories').fetchall()
+        catalog = CategoryCatalog([Category(*row) for row in rows])
+        with _lock:
+            _catalogs[db_file] = catalog
+    return catalog
+
+
+def invalidate(db_file=None):
+    """Drop the cached catalog for db_file; with no argument, for every database"""
+    with _lock:
+        if db_file is None:
+            _catalogs.clear()
+        else:
+            _catalogs.pop(db_file, None)
+
+
+def lookup(category_id, db_file=None):
+    """Return the Category with this id, reloading the catalog once if it is unknown"""
+    category = get_catalog(db_file).get(category_id)
+    if category is None:
+        invalidate(db_file or DEFAULT_DB_FILE)
+        category = get_catalog(db_file).get(category_id)
+    return category
+
+
+def category_name(category_id, db_file=None):
+    """Return the name of a category id, or the id as text if it is unknown"""
+    category = lookup(category_id, db_file)
+    return category.name if category else str(category_id)
+
+
+def add_category(name, category_type, db_file=None):
+    """Add a category; returns its id, or None if it could not be added"""
+    try:
+        with connection(db_file) as conn:
+            cursor = conn.cursor()
+            cursor.execute('INSERT INTO categories (name, type) VALUES (?, ?)', (name, category_type))
+        return cursor.lastrowid
+    except Error as e:
+        print(f"Error adding category: {e}")
+    finally:
+        invalidate(db_file or DEFAULT_DB_FILE)
+    return None
\ No newline at end of file
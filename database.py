@@ -1,12 +1,42 @@
+import atexit
+import os
 import sqlite3
+import threading
+from contextlib import contextmanager
 from sqlite3 import Error
 
+DEFAULT_DB_FILE = 'finance.db'
 
-def create_connection():
+# Pragmas applied to every pooled connection when it is opened.
+# Negative cache_size is in KiB, mmap_size is in bytes.
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -16000,
+    'mmap_size': 64 * 1024 * 1024,
+}
+
+# Connection class for pooled connections; profiling swaps in one that
+# records statement timings.
+CONNECTION_FACTORY = sqlite3.Connection
+
+# When set, pooled connections open the database read-only, as the batch
+# report workers do. journal_mode is left alone, since changing it writes.
+READ_ONLY = False
+
+_local = threading.local()
+_pool_lock = threading.Lock()
+_pool = []
+# Bumped by reopen_connections(); each pooled connection records the
+# generation it was opened in
+_generation = 0
+
+
+def create_connection(db_file=None):
     """Create a database connection to the SQLite database"""
     conn = None
     try:
-        conn = sqlite3.connect('finance.db')
+        conn = sqlite3.connect(db_file or DEFAULT_DB_FILE)
         return conn
     except Error as e:
         print(e)
@@ -14,50 +44,620 @@ def create_connection():
     return conn
 
 
-def create_tables(conn):
-    """Create all necessary tables"""
+def configure(**pragmas):
+    """Update the pragmas used for pooled connections.
+
+    Pooled connections are reopened with the new settings, see
+    reopen_connections().
+    """
+    PRAGMAS.update(pragmas)
+    reopen_connections()
+
+
+def reopen_connections():
+    """Have every pooled connection reopened before its thread next uses it.
+
+    Safe to call while other threads are inside a connection() block: a
+    connection is only replaced when its thread starts an outermost block
+    or calls get_connection() outside of one, so no transaction is cut
+    short.
+    """
+    global _generation
+    with _pool_lock:
+        _generation += 1
+
+
+def _open_connection(db_file):
+    if READ_ONLY:
+        # Imported here, as only the batch report workers need it
+        from urllib.parse import quote
+        uri = f'file:{quote(os.path.abspath(db_file))}?mode=ro'
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, factory=CONNECTION_FACTORY)
+    else:
+        conn = sqlite3.connect(db_file, check_same_thread=False, factory=CONNECTION_FACTORY)
+    for name, value in PRAGMAS.items():
+        if not (READ_ONLY and name == 'journal_mode'):
+            conn.execute(f'PRAGMA {name}={value}')
+    return conn
+
+
+def get_connection(db_file=None):
+    """Return this thread's long-lived connection to db_file"""
+    db_file = db_file or DEFAULT_DB_FILE
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    entry = connections.get(db_file)
+    if entry is not None and entry[2] != _generation and entry[1] == 0:
+        _close(connections, db_file, entry[0])
+        entry = None
+    if entry is None:
+        generation = _generation
+        conn = _open_connection(db_file)
+        entry = connections[db_file] = [conn, 0, generation, []]
+        with _pool_lock:
+            _pool.append((connections, db_file, conn))
+    return entry[0]
+
+
+@contextmanager
+def connection(db_file=None):
+    """Borrow the pooled connection for the current thread.
+
+    The outermost block commits on success and rolls back on error, so
+    nested helpers can share one transaction. The public write functions
+    leave committing to it, so they can be nested under a caller's block
+    and commit or roll back together with it. Callbacks registered with
+    after_commit() run once the outermost block has committed.
+    """
+    conn = get_connection(db_file)
+    entry = _local.connections[db_file or DEFAULT_DB_FILE]
+    entry[1] += 1
     try:
-        cursor = conn.cursor()
+        yield conn
+    except BaseException:
+        if entry[1] == 1:
+            del entry[3][:]
+            conn.rollback()
+        raise
+    else:
+        if entry[1] == 1:
+            callbacks = entry[3][:]
+            del entry[3][:]
+            conn.commit()
+            for callback in callbacks:
+                callback()
+    finally:
+        entry[1] -= 1
 
-        # Users table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL
-        )
+
+def after_commit(callback, db_file=None):
+    """Call callback() once this thread's outermost connection() block commits.
+
+    Writers use it to invalidate caches: run any earlier, a reader could
+    cache the data the open transaction is about to replace. The callback
+    is dropped if the block rolls back, and runs at once outside a block.
+    """
+    entry = getattr(_local, 'connections', {}).get(db_file or DEFAULT_DB_FILE)
+    if entry is None or entry[1] == 0:
+        callback()
+    else:
+        entry[3].append(callback)
+
+
+def _close(connections, db_file, conn):
+    with _pool_lock:
+        _pool[:] = [pooled for pooled in _pool if pooled[2] is not conn]
+    connections.pop(db_file, None)
+    try:
+        conn.close()
+    except Error:
+        pass
+
+
+def close_connections():
+    """Close every pooled connection, across all threads.
+
+    Only call this while no thread is using its connection: at exit,
+    between tests or after worker threads have finished. Use
+    reopen_connections() while the pool is busy.
+    """
+    with _pool_lock:
+        pooled = _pool[:]
+        del _pool[:]
+    for connections, db_file, conn in pooled:
+        connections.pop(db_file, None)
+        try:
+            conn.close()
+        except Error:
+            pass
+
+
+atexit.register(close_connections)
+
+
+def month_range(month, year):
+    """Return the half-open [start, end) date bounds of a month"""
+    start = f"{year:04d}-{month:02d}-01"
+    if month == 12:
+        return start, f"{year + 1:04d}-01-01"
+    return start, f"{year:04d}-{month + 1:02d}-01"
+
+
+def year_range(year):
+    """Return the half-open [start, end) date bounds of a year"""
+    return f"{year:04d}-01-01", f"{year + 1:04d}-01-01"
+
+
+def create_indexes(conn):
+    """Create the indexes used to page through a user's transactions.
+
+    Safe to run against existing databases, so it doubles as the migration
+    for files created before the indexes existed. Reports and budgets read
+    monthly_rollups, so the ledger keeps only the indexes listing needs;
+    each one is maintained on every insert.
+    """
+    cursor = conn.cursor()
+    cursor.execute('DROP INDEX IF EXISTS idx_transactions_user_date')
+    # Pages filtered by category walk this in (date, id) order, as the
+    # rowid ends every index entry
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_transactions_user_category_date
+    ON transactions (user_id, category_id, date)
+    ''')
+    # Keyset pagination walks this in (date, id) order
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_transactions_user_date_id
+    ON transactions (user_id, date, id)
+    ''')
+    conn.commit()
+
+
+def drop_report_index(conn):
+    """Drop the covering index reports searched before monthly_rollups replaced them"""
+    conn.execute('DROP INDEX IF EXISTS idx_transactions_user_date_cover')
+    conn.commit()
+
+
+# Per-month aggregate of transactions, recomputed from scratch; {source}
+# is filled in by transaction_source(), which includes archived years
+ROLLUP_SOURCE = '''
+SELECT user_id, category_id,
+       CAST(substr(date, 1, 4) AS INTEGER) AS year,
+       CAST(substr(date, 6, 2) AS INTEGER) AS month,
+       SUM(amount) AS total, COUNT(*) AS count
+FROM {source}
+GROUP BY user_id, category_id, year, month
+'''
+
+
+def create_rollups(conn):
+    """Create the monthly_rollups table and the triggers that maintain it.
+
+    Every insert, update and delete on transactions adjusts the matching
+    (user_id, category_id, year, month) row, so reports never need to
+    aggregate raw transactions. The table is filled from existing data the
+    first time it is created.
+    """
+    cursor = conn.cursor()
+    exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='monthly_rollups'"
+    ).fetchone()
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS monthly_rollups (
+        user_id INTEGER NOT NULL,
+        year INTEGER NOT NULL,
+        month INTEGER NOT NULL,
+        category_id INTEGER NOT NULL,
+        total INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (user_id, year, month, category_id)
+    ) WITHOUT ROWID
+    ''')
+
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_insert AFTER INSERT ON transactions
+    BEGIN
+        INSERT INTO monthly_rollups (user_id, year, month, category_id, total, count)
+        VALUES (NEW.user_id, CAST(substr(NEW.date, 1, 4) AS INTEGER),
+                CAST(substr(NEW.date, 6, 2) AS INTEGER), NEW.category_id, NEW.amount, 1)
+        ON CONFLICT (user_id, year, month, category_id)
+        DO UPDATE SET total = total + excluded.total, count = count + 1;
+    END
+    ''')
+
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_delete AFTER DELETE ON transactions
+    BEGIN
+        UPDATE monthly_rollups SET total = total - OLD.amount, count = count - 1
+        WHERE user_id = OLD.user_id AND category_id = OLD.category_id
+          AND year = CAST(substr(OLD.date, 1, 4) AS INTEGER)
+          AND month = CAST(substr(OLD.date, 6, 2) AS INTEGER);
+        DELETE FROM monthly_rollups
+        WHERE user_id = OLD.user_id AND category_id = OLD.category_id
+          AND year = CAST(substr(OLD.date, 1, 4) AS INTEGER)
+          AND month = CAST(substr(OLD.date, 6, 2) AS INTEGER)
+          AND count = 0;
+    END
+    ''')
+
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_update
+    AFTER UPDATE OF user_id, category_id, amount, date ON transactions
+    BEGIN
+        UPDATE monthly_rollups SET total = total - OLD.amount, count = count - 1
+        WHERE user_id = OLD.user_id AND category_id = OLD.category_id
+          AND year = CAST(substr(OLD.date, 1, 4) AS INTEGER)
+          AND month = CAST(substr(OLD.date, 6, 2) AS INTEGER);
+        DELETE FROM monthly_rollups
+        WHERE user_id = OLD.user_id AND category_id = OLD.category_id
+          AND year = CAST(substr(OLD.date, 1, 4) AS INTEGER)
+          AND month = CAST(substr(OLD.date, 6, 2) AS INTEGER)
+          AND count = 0;
+        INSERT INTO monthly_rollups (user_id, year, month, category_id, total, count)
+        VALUES (NEW.user_id, CAST(substr(NEW.date, 1, 4) AS INTEGER),
+                CAST(substr(NEW.date, 6, 2) AS INTEGER), NEW.category_id, NEW.amount, 1)
+        ON CONFLICT (user_id, year, month, category_id)
+        DO UPDATE SET total = total + excluded.total, count = count + 1;
+    END
+    ''')
+
+    if not exists:
+        rebuild_rollups(conn)
+    conn.commit()
+
+
+def rebuild_rollups(conn):
+    """Recompute monthly_rollups from the raw transactions"""
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM monthly_rollups')
+    cursor.execute(f'''
+    INSERT INTO monthly_rollups (user_id, category_id, year, month, total, count)
+    {ROLLUP_SOURCE.format(source=transaction_source(conn))}
+    ''')
+    conn.commit()
+
+
+# Tables whose changes are logged in change_log
+LOGGED_TABLES = ('users', 'budgets', 'transactions')
+
+
+def _log_change(table, row, deleted, condition='1'):
+    """Trigger statement appending a change to change_log, stamped one past the highest stamp so far"""
+    return f'''
+        INSERT INTO change_log (table_name, row_id, deleted, stamp, origin)
+        SELECT '{table}', {row}, {deleted}, (SELECT COALESCE(MAX(stamp), 0) + 1 FROM change_log), node
+        FROM sync_node WHERE {condition};'''
+
+
+def create_change_tracking(conn):
+    """Create the change_log and the triggers that append to it.
+
+    Each insert, update or delete on users, budgets and transactions logs
+    the table, the row id and whether the row was deleted under an
+    increasing seq. Incremental backups export the transactions changed
+    since a given seq, and sync sends peers the rows changed since the
+    last seq they saw.
+
+    Each entry is also stamped with a Lamport clock, one past the highest
+    stamp logged so far, and the node that made the change, from the
+    single row of sync_node. A row's latest entry is its version, which
+    sync compares to decide which of two writes to a row wins. The
+    triggers are silent while sync_node.applying is set, as sync logs the
+    changes it applies with their original stamps itself.
+    """
+    # Imported here, as migrations are the only callers at startup
+    import secrets
+
+    cursor = conn.cursor()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS sync_node (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        node TEXT NOT NULL,
+        id_block INTEGER,
+        applying INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO sync_node (id, node) VALUES (1, ?)', (secrets.token_hex(8),))
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS change_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        table_name TEXT NOT NULL,
+        row_id INTEGER NOT NULL,
+        deleted INTEGER NOT NULL,
+        stamp INTEGER NOT NULL,
+        origin TEXT NOT NULL
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_change_log_row ON change_log (table_name, row_id, seq)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_change_log_stamp ON change_log (stamp)')
+
+    for table in LOGGED_TABLES:
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_changes_{table}_insert AFTER INSERT ON {table}
+        WHEN (SELECT applying FROM sync_node) = 0
+        BEGIN{_log_change(table, 'NEW.id', 0)}
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_changes_{table}_update AFTER UPDATE ON {table}
+        WHEN (SELECT applying FROM sync_node) = 0
+        BEGIN{_log_change(table, 'OLD.id', 1, 'OLD.id != NEW.id')}{_log_change(table, 'NEW.id', 0)}
+        END
         ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_changes_{table}_delete AFTER DELETE ON {table}
+        WHEN (SELECT applying FROM sync_node) = 0
+        BEGIN{_log_change(table, 'OLD.id', 1)}
+        END
+        ''')
+    conn.commit()
 
-        # Categories table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS categories (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE NOT NULL,
-            type TEXT NOT NULL CHECK(type IN ('income', 'expense'))
-        )
+
+def create_full_text_search(conn):
+    """Create the transactions_fts index and the triggers that keep it in sync.
+
+    transactions_fts is an external-content FTS5 table over transactions,
+    so it stores only the index, not a second copy of the text. user_id is
+    indexed alongside description, which lets a search intersect a user's
+    rows inside the index instead of joining every match back to the
+    ledger. The prefix indexes serve two and three letter prefix queries.
+    The index is built from existing data the first time it is created.
+    """
+    cursor = conn.cursor()
+    exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='transactions_fts'"
+    ).fetchone()
+
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5(
+        description, user_id,
+        content='transactions', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_fts_insert AFTER INSERT ON transactions
+    BEGIN
+        INSERT INTO transactions_fts (rowid, description, user_id)
+        VALUES (NEW.id, NEW.description, NEW.user_id);
+    END
+    ''')
+
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_fts_delete AFTER DELETE ON transactions
+    BEGIN
+        INSERT INTO transactions_fts (transactions_fts, rowid, description, user_id)
+        VALUES ('delete', OLD.id, OLD.description, OLD.user_id);
+    END
+    ''')
+
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_fts_update AFTER UPDATE OF id, user_id, description ON transactions
+    BEGIN
+        INSERT INTO transactions_fts (transactions_fts, rowid, description, user_id)
+        VALUES ('delete', OLD.id, OLD.description, OLD.user_id);
+        INSERT INTO transactions_fts (rowid, description, user_id)
+        VALUES (NEW.id, NEW.description, NEW.user_id);
+    END
+    ''')
+
+    if not exists:
+        rebuild_full_text_search(conn)
+    conn.commit()
+
+
+def rebuild_full_text_search(conn):
+    """Rebuild transactions_fts from the raw transactions"""
+    conn.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild')")
+    conn.commit()
+
+
+def create_recurring_rules(conn):
+    """Create the recurring_rules table.
+
+    A rule posts a transaction every `interval` days, weeks, months or
+    years from start_date, until end_date if it has one. posted counts the
+    occurrences posted so far and next_due is the date of the next one, or
+    NULL once the rule has ended, so the partial index on next_due is the
+    queue of rules by due date.
+    """
+    cursor = conn.cursor()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS recurring_rules (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        category_id INTEGER NOT NULL,
+        amount INTEGER NOT NULL,
+        description TEXT,
+        frequency TEXT NOT NULL CHECK(frequency IN ('daily', 'weekly', 'monthly', 'yearly')),
+        interval INTEGER NOT NULL DEFAULT 1 CHECK(interval > 0),
+        start_date TEXT NOT NULL,
+        end_date TEXT,
+        posted INTEGER NOT NULL DEFAULT 0,
+        next_due TEXT,
+        FOREIGN KEY (user_id) REFERENCES users (id),
+        FOREIGN KEY (category_id) REFERENCES categories (id)
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_recurring_rules_next_due
+    ON recurring_rules (next_due) WHERE next_due IS NOT NULL
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_recurring_rules_user
+    ON recurring_rules (user_id)
+    ''')
+    conn.commit()
+
+
+TRANSACTION_COLUMNS = ('id', 'user_id', 'category_id', 'amount', 'description', 'date')
+
+
+def create_archive(conn):
+    """Create the archived_years table and the triggers that close archived years.
+
+    archive.py moves the transactions of a closed year out of the ledger
+    into a table of their own, transactions_<year>, which has the
+    ledger's columns and a (user_id, date, id) index. A year gets a row
+    here when its move starts and is marked complete when the ledger holds
+    none of its transactions any more. From the start, no transaction can
+    be added to the year or moved into it, so the move cannot miss one.
+    """
+    cursor = conn.cursor()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS archived_years (
+        year INTEGER PRIMARY KEY,
+        complete INTEGER NOT NULL DEFAULT 0,
+        moved INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    for event in ('INSERT', 'UPDATE OF date'):
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_archive_{event.split()[0].lower()} BEFORE {event} ON transactions
+        WHEN EXISTS (SELECT 1 FROM archived_years WHERE year = CAST(substr(NEW.date, 1, 4) AS INTEGER))
+        BEGIN
+            SELECT RAISE(ABORT, 'transactions cannot be added to an archived year');
+        END
         ''')
+    conn.commit()
+
+
+def create_archive_table(conn, year):
+    """Create the archive table for a year; returns its name"""
+    table = f'transactions_{int(year):04d}'
+    conn.execute(f'''
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        category_id INTEGER NOT NULL,
+        amount INTEGER NOT NULL,
+        description TEXT,
+        date TEXT NOT NULL
+    )
+    ''')
+    conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_user_date_id ON {table} (user_id, date, id)')
+    return table
+
+
+def transaction_partitions(conn, start_date=None, end_date=None):
+    """Return the tables holding the transactions dated in [start_date, end_date).
+
+    Each is a (table, end) pair, where end is the exclusive upper bound of
+    the table's dates, or None for the ledger itself, newest first. The
+    ledger is left out when the range lies within archived years whose
+    move is complete, and archive tables when the range misses their year.
+    """
+    try:
+        archived = conn.execute('SELECT year, complete FROM archived_years ORDER BY year DESC').fetchall()
+    except sqlite3.OperationalError as e:
+        # Databases and backups from before archiving have no archive
+        if 'no such table' not in str(e):
+            raise
+        archived = []
+    if not archived:
+        return [('transactions', None)]
+
+    first = int(start_date[:4]) if start_date else None
+    last = None
+    if end_date:
+        last = int(end_date[:4]) if end_date > f"{end_date[:4]}-01-01" else int(end_date[:4]) - 1
+    partitions = []
+    closed = set()
+    for year, complete in archived:
+        if (first is None or year >= first) and (last is None or year <= last):
+            partitions.append((f'transactions_{year:04d}', year_range(year)[1]))
+            if complete:
+                closed.add(year)
+    if not partitions or first is None or last is None or not closed.issuperset(range(first, last + 1)):
+        partitions.insert(0, ('transactions', None))
+    return partitions
 
-        # Transactions table
+
+def transaction_source(conn, start_date=None, end_date=None):
+    """SQL for the rows of every table holding transactions dated in [start_date, end_date).
+
+    Just the ledger's name when one table covers the range, otherwise a
+    UNION ALL subquery, for use in a FROM clause.
+    """
+    tables = [table for table, _ in transaction_partitions(conn, start_date, end_date)]
+    if len(tables) == 1:
+        return tables[0]
+    columns = ', '.join(TRANSACTION_COLUMNS)
+    return '(' + ' UNION ALL '.join(f'SELECT {columns} FROM {table}' for table in tables) + ')'
+
+
+def _column_type(cursor, table, column):
+    for row in cursor.execute(f'PRAGMA table_info({table})'):
+        if row[1] == column:
+            return row[2].upper()
+    return None
+
+
+def convert_amounts_to_cents(conn, chunk_size=10000, progress=None):
+    """Migrate REAL amount columns to INTEGER cents in place.
+
+    Transactions are copied into a new INTEGER table in id order, one
+    committed chunk at a time, so an interrupted run resumes where it
+    stopped. The tables are then swapped in a single transaction. Indexes,
+    triggers and monthly_rollups are dropped with the old table and are
+    recreated by create_tables. progress(copied) is called after each
+    chunk. Returns True if anything was converted.
+    """
+    cursor = conn.cursor()
+    converted = False
+
+    if _column_type(cursor, 'transactions', 'amount') == 'REAL':
         cursor.execute('''
-        CREATE TABLE IF NOT EXISTS transactions (
+        CREATE TABLE IF NOT EXISTS transactions_cents (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
             category_id INTEGER NOT NULL,
-            amount REAL NOT NULL,
+            amount INTEGER NOT NULL,
             description TEXT,
             date TEXT NOT NULL,
             FOREIGN KEY (user_id) REFERENCES users (id),
             FOREIGN KEY (category_id) REFERENCES categories (id)
         )
         ''')
+        conn.commit()
+
+        while True:
+            last_id = cursor.execute('SELECT COALESCE(MAX(id), 0) FROM transactions_cents').fetchone()[0]
+            cursor.execute('''
+            INSERT INTO transactions_cents (id, user_id, category_id, amount, description, date)
+            SELECT id, user_id, category_id, CAST(ROUND(amount * 100) AS INTEGER), description, date
+            FROM transactions
+            WHERE id > ?
+            ORDER BY id
+            LIMIT ?
+            ''', (last_id, chunk_size))
+            copied = cursor.rowcount
+            conn.commit()
+            if copied <= 0:
+                break
+            if progress:
+                progress(copied)
+
+        cursor.execute('BEGIN')
+        cursor.execute('DROP TABLE transactions')
+        cursor.execute('ALTER TABLE transactions_cents RENAME TO transactions')
+        cursor.execute('DROP TABLE IF EXISTS monthly_rollups')
+        conn.commit()
+        converted = True
 
-        # Budgets table
+    if _column_type(cursor, 'budgets', 'amount') == 'REAL':
+        cursor.execute('BEGIN')
         cursor.execute('''
-        CREATE TABLE IF NOT EXISTS budgets (
+        CREATE TABLE budgets_cents (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
             category_id INTEGER NOT NULL,
-            amount REAL NOT NULL,
+            amount INTEGER NOT NULL,
             month INTEGER NOT NULL,
             year INTEGER NOT NULL,
             FOREIGN KEY (user_id) REFERENCES users (id),
@@ -65,33 +665,144 @@ def create_tables(conn):
             UNIQUE(user_id, category_id, month, year)
         )
         ''')
+        cursor.execute('''
+        INSERT INTO budgets_cents (id, user_id, category_id, amount, month, year)
+        SELECT id, user_id, category_id, CAST(ROUND(amount * 100) AS INTEGER), month, year
+        FROM budgets
+        ''')
+        cursor.execute('DROP TABLE budgets')
+        cursor.execute('ALTER TABLE budgets_cents RENAME TO budgets')
+        conn.commit()
+        converted = True
+
+    return converted
 
-        # Insert default categories if they don't exist
-        default_categories = [
-            ('Salary', 'income'),
-            ('Bonus', 'income'),
-            ('Investment', 'income'),
-            ('Food', 'expense'),
-            ('Rent', 'expense'),
-            ('Transportation', 'expense'),
-            ('Entertainment', 'expense'),
-            ('Utilities', 'expense'),
-            ('Healthcare', 'expense'),
-            ('Education', 'expense'),
-            ('Other', 'expense')
-        ]
-
-        cursor.executemany('''
-        INSERT OR IGNORE INTO categories (name, type) VALUES (?, ?)
-        ''', default_categories)
 
+def create_base_tables(conn):
+    """Create the users, categories, transactions and budgets tables and the default categories"""
+    cursor = conn.cursor()
+
+    # Users table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL
+    )
+    ''')
+
+    # Categories table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS categories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE NOT NULL,
+        type TEXT NOT NULL CHECK(type IN ('income', 'expense'))
+    )
+    ''')
+
+    # Transactions table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS transactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        category_id INTEGER NOT NULL,
+        amount INTEGER NOT NULL,
+        description TEXT,
+        date TEXT NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users (id),
+        FOREIGN KEY (category_id) REFERENCES categories (id)
+    )
+    ''')
+
+    # Budgets table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS budgets (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        category_id INTEGER NOT NULL,
+        amount INTEGER NOT NULL,
+        month INTEGER NOT NULL,
+        year INTEGER NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users (id),
+        FOREIGN KEY (category_id) REFERENCES categories (id),
+        UNIQUE(user_id, category_id, month, year)
+    )
+    ''')
+
+    # Insert default categories if they don't exist
+    default_categories = [
+        ('Salary', 'income'),
+        ('Bonus', 'income'),
+        ('Investment', 'income'),
+        ('Food', 'expense'),
+        ('Rent', 'expense'),
+        ('Transportation', 'expense'),
+        ('Entertainment', 'expense'),
+        ('Utilities', 'expense'),
+        ('Healthcare', 'expense'),
+        ('Education', 'expense'),
+        ('Other', 'expense')
+    ]
+
+    cursor.executemany('''
+    INSERT OR IGNORE INTO categories (name, type) VALUES (?, ?)
+    ''', default_categories)
+
+    conn.commit()
+
+
+# Schema migrations, in order. PRAGMA user_version holds how many of them
+# a database has had, so startup runs only the ones it has not. Each is
+# safe to run again, as databases from before user_version was kept start
+# at 0 and run them all. Add new ones at the end.
+MIGRATIONS = (
+    create_base_tables,
+    convert_amounts_to_cents,
+    create_indexes,
+    create_archive,
+    create_rollups,
+    create_change_tracking,
+    create_full_text_search,
+    create_recurring_rules,
+    drop_report_index,
+)
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate(conn):
+    """Run the migrations conn's database has not had; returns how many ran.
+
+    A database that is already current costs one PRAGMA read and no DDL.
+    Raises sqlite3.DatabaseError for a database from a newer version. Every
+    entry point that opens a database runs this, or create_tables(), first.
+    """
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version > SCHEMA_VERSION:
+        raise sqlite3.DatabaseError(
+            f"Database schema version {version} is newer than this version's {SCHEMA_VERSION}")
+    for number, step in enumerate(MIGRATIONS[version:], version + 1):
+        step(conn)
+        conn.execute(f'PRAGMA user_version = {number}')
         conn.commit()
+    if version < SCHEMA_VERSION:
+        # Imported here, since both caches build on this module
+        from categories import invalidate
+        from report_cache import clear
+        invalidate()
+        clear()
+    return SCHEMA_VERSION - version
+
+
+def create_tables(conn):
+    """Bring the schema up to date, running only the pending migrations"""
+    try:
+        migrate(conn)
     except Error as e:
         print(e)
 
 
-def initialize_database():
-    conn = create_connection()
+def initialize_database(db_file=None):
+    conn = create_connection(db_file)
     if conn is not None:
         create_tables(conn)
         conn.close()
@@ -1,10 +1,19 @@
 import sys
+import argparse
+import atexit
 import getpass
 from datetime import datetime
+from money import Money
 from auth import register_user, login_user, change_password
-from transactions import add_transaction, update_transaction, delete_transaction, list_categories, list_transactions
+from transactions import (add_transaction, update_transaction, delete_transaction, list_categories, list_transactions,
+                          search_transactions)
 from reports import get_monthly_summary, get_yearly_summary
 from budget import set_budget, get_budget_status
+from presentation import (print_budget_status, print_cache_stats, print_categories, print_monthly_summary,
+                          print_query_profile, print_recurring_rules, print_transactions,
+                          print_yearly_summary)
+from recurring import Scheduler, add_rule, delete_rule, list_rules, post_due
+import report_cache
 
 
 def main_menu():
@@ -27,15 +36,17 @@ def user_menu(user_id):
     print("7. Set Budget")
     print("8. View Budget Status")
     print("9. Change Password")
-    print("10. Logout")
+    print("10. Recurring Transactions")
+    print("11. Search Transactions")
+    print("12. Logout")
     choice = input("Enter your choice: ")
     return choice
 
 
 def get_transaction_details():
-    list_categories()
+    print_categories(list_categories())
     category_id = input("Enter category ID: ")
-    amount = float(input("Enter amount: "))
+    amount = Money.of(input("Enter amount: "))
     description = input("Enter description (optional): ")
     return category_id, amount, description if description else None
 
@@ -74,7 +85,7 @@ def main():
 
             elif choice == '2':
                 print("\nUpdate Transaction")
-                list_transactions(current_user)
+                print_transactions(list_transactions(current_user))
                 transaction_id = input("Enter transaction ID to update: ")
                 print("Leave fields blank to keep current values")
 
@@ -82,7 +93,7 @@ def main():
                 amount_input = input("Enter new amount (or leave blank): ")
                 description = input("Enter new description (or leave blank): ")
 
-                amount = float(amount_input) if amount_input else None
+                amount = Money.of(amount_input) if amount_input else None
                 category_id = int(category_id) if category_id else None
                 description = description if description else None
 
@@ -90,30 +101,30 @@ def main():
 
             elif choice == '3':
                 print("\nDelete Transaction")
-                list_transactions(current_user)
+                print_transactions(list_transactions(current_user))
                 transaction_id = input("Enter transaction ID to delete: ")
                 delete_transaction(transaction_id, current_user)
 
             elif choice == '4':
                 print("\nRecent Transactions")
-                list_transactions(current_user)
+                print_transactions(list_transactions(current_user))
 
             elif choice == '5':
                 print("\nMonthly Summary")
                 month = int(input("Enter month (1-12): "))
                 year = int(input("Enter year: "))
-                get_monthly_summary(current_user, month, year)
+                print_monthly_summary(get_monthly_summary(current_user, month, year))
 
             elif choice == '6':
                 print("\nYearly Summary")
                 year = int(input("Enter year: "))
-                get_yearly_summary(current_user, year)
+                print_yearly_summary(get_yearly_summary(current_user, year))
 
             elif choice == '7':
                 print("\nSet Budget")
-                list_categories()
+                print_categories(list_categories())
                 category_id = input("Enter category ID: ")
-                amount = float(input("Enter budget amount: "))
+                amount = Money.of(input("Enter budget amount: "))
                 month = int(input("Enter month (1-12): "))
                 year = int(input("Enter year: "))
                 set_budget(current_user, category_id, amount, month, year)
@@ -122,7 +133,7 @@ def main():
                 print("\nBudget Status")
                 month = int(input("Enter month (1-12): "))
                 year = int(input("Enter year: "))
-                get_budget_status(current_user, month, year)
+                print_budget_status(get_budget_status(current_user, month, year), month, year)
 
             elif choice == '9':
                 print("\nChange Password")
@@ -136,6 +147,27 @@ def main():
                     print("Passwords don't match!")
 
             elif choice == '10':
+                print("\nRecurring Transactions")
+                print_recurring_rules(list_rules(current_user))
+                action = input("Add (a), delete (d) or go back (Enter): ").strip().lower()
+                if action == 'a':
+                    category_id, amount, description = get_transaction_details()
+                    frequency = input("Repeat daily, weekly, monthly or yearly: ").strip().lower()
+                    interval = int(input("Every how many of those (1): ") or 1)
+                    start_date = input("First date (YYYY-MM-DD): ")
+                    end_date = input("Last date (YYYY-MM-DD, or leave blank): ")
+                    if add_rule(current_user, category_id, amount, description, frequency, start_date,
+                                interval, end_date or None):
+                        post_due()
+                elif action == 'd':
+                    delete_rule(input("Enter recurring transaction ID to delete: "), current_user)
+
+            elif choice == '11':
+                print("\nSearch Transactions")
+                query = input("Search descriptions for: ")
+                print_transactions(search_transactions(current_user, query))
+
+            elif choice == '12':
                 print("Logging out...")
                 current_user = None
 
@@ -143,10 +175,52 @@ def main():
                 print("Invalid choice. Please try again.")
 
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Personal Finance Management System")
+    parser.add_argument('--profile', nargs='?', const='-', metavar='FILE',
+                        help="profile queries and print the profile and report cache "
+                             "statistics at exit, or write them to FILE as JSON")
+    parser.add_argument('--slow-ms', type=float, default=100.0,
+                        help="log statements slower than this with their query plan")
+    return parser.parse_args(argv)
+
+
+def dump_profile(path):
+    import json
+    import profiling
+
+    profiles = profiling.snapshot()
+    cache_stats = report_cache.stats()
+    if path == '-':
+        print_query_profile(profiles)
+        print_cache_stats(cache_stats)
+    else:
+        with open(path, 'w') as f:
+            json.dump({'statements': [profile._asdict() for profile in profiles],
+                       'report_cache': {**cache_stats._asdict(), 'hit_rate': cache_stats.hit_rate}},
+                      f, indent=2)
+
+
 if __name__ == "__main__":
-    # Initialize database if not exists
+    args = parse_args()
+    if args.profile:
+        # Only imported when profiling, to keep startup fast
+        import logging
+        import profiling
+
+        logging.basicConfig(format="%(message)s")
+        profiling.enable(slow_threshold=args.slow_ms / 1000)
+        atexit.register(dump_profile, args.profile)
+
+    # Create the database or run its pending migrations; a current one
+    # costs a single PRAGMA read
     from database import initialize_database
 
     initialize_database()
+    # Recurring transactions that fell due while the app was closed, and
+    # those falling due while it runs, are posted on a background thread,
+    # so startup does not wait on post_due()'s write lock
+    scheduler = Scheduler()
+    atexit.register(scheduler.stop)
 
     main()
\ No newline at end of file
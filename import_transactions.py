@@ -0,0 +1,122 @@
+"""Stream bank exports into the transactions table.
+
+Usage:
+
+    python import_transactions.py USER_ID FILE [FILE ...] [--db finance.db]
+
+CSV files need a header with date and amount columns, and may also have
+category and description columns. OFX files are read one STMTTRN block at
+a time. Negative amounts are money going out. Rows without a category use
+--expense-category for money out and --income-category for money in.
+Amounts are stored as positive values, as add_transaction expects.
+"""
+import argparse
+import csv
+import re
+import time
+from datetime import datetime
+
+from money import Money
+from transactions import bulk_add_transactions
+
+# Tried after ISO 8601, which is parsed by the much faster fromisoformat()
+DATE_FORMATS = ('%d/%m/%Y', '%m/%d/%Y', '%d.%m.%Y')
+
+OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+
+
+def parse_date(value):
+    """Normalize an export date to the '%Y-%m-%d %H:%M:%S' stored format"""
+    value = value.strip()
+    try:
+        return datetime.fromisoformat(value).isoformat(' ', 'seconds')
+    except ValueError:
+        pass
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).isoformat(' ', 'seconds')
+        except ValueError:
+            pass
+    raise ValueError(f"Unrecognized date: {value!r}")
+
+
+def parse_ofx_date(value):
+    """Parse an OFX date such as 20250601120000.000[-5:EST]"""
+    value = value.strip()
+    if len(value) >= 14 and value[:14].isdigit():
+        posted = datetime.strptime(value[:14], '%Y%m%d%H%M%S')
+    else:
+        posted = datetime.strptime(value[:8], '%Y%m%d')
+    return posted.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _row(category, amount, description, date, income_category, expense_category):
+    if not category:
+        category = income_category if amount >= 0 else expense_category
+    return category, abs(amount), description or None, date
+
+
+def read_csv(path, income_category='Salary', expense_category='Other'):
+    """Yield (category, amount, description, date) rows from a CSV export"""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        reader.fieldnames = [name.strip().lower() for name in reader.fieldnames or []]
+        for record in reader:
+            amount = Money.of(record['amount'].replace(',', ''))
+            yield _row(record.get('category'), amount, record.get('description'),
+                       parse_date(record['date']), income_category, expense_category)
+
+
+def read_ofx(path, income_category='Salary', expense_category='Other'):
+    """Yield (category, amount, description, date) rows from an OFX export"""
+    with open(path, encoding='utf-8', errors='replace') as f:
+        fields = None
+        for line in f:
+            for closing, tag, value in OFX_TAG.findall(line):
+                tag = tag.upper()
+                if tag == 'STMTTRN':
+                    if not closing:
+                        fields = {}
+                    elif fields is not None:
+                        yield _row(None, Money.of(fields['TRNAMT']),
+                                   fields.get('MEMO') or fields.get('NAME'),
+                                   parse_ofx_date(fields['DTPOSTED']),
+                                   income_category, expense_category)
+                        fields = None
+                elif fields is not None and not closing:
+                    fields[tag] = value.strip()
+
+
+def read_file(path, **categories):
+    if path.lower().endswith(('.ofx', '.qfx')):
+        return read_ofx(path, **categories)
+    return read_csv(path, **categories)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('user_id', type=int)
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--db', dest='db_file', default=None)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--income-category', default='Salary')
+    parser.add_argument('--expense-category', default='Other')
+    args = parser.parse_args()
+
+    for path in args.files:
+        start = time.perf_counter()
+        rows = read_file(path, income_category=args.income_category,
+                         expense_category=args.expense_category)
+        try:
+            inserted = bulk_add_transactions(args.user_id, rows, args.chunk_size, db_file=args.db_file)
+        except (KeyError, ValueError) as e:
+            # Chunks committed before the bad row are kept
+            print(f"{path}: stopped on a malformed row: {e}")
+            continue
+        elapsed = time.perf_counter() - start
+        rate = inserted / elapsed if elapsed else 0
+        print(f"{path}: imported {inserted} rows in {elapsed:.2f}s ({rate:,.0f} rows/sec)")
+
+
+if __name__ == '__main__':
+    main()
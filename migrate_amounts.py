@@ -0,0 +1,42 @@
+"""Convert a database's REAL amounts to INTEGER cents in place.
+
+Usage:
+
+    python migrate_amounts.py [--db finance.db] [--chunk-size 10000]
+
+Stop the app first. An interrupted run can simply be started again and
+carries on from the last committed chunk.
+"""
+import argparse
+import time
+
+from database import connection, convert_amounts_to_cents, create_tables
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', dest='db_file', default=None)
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    copied = [0]
+
+    def progress(rows):
+        copied[0] += rows
+        print(f"\rConverted {copied[0]} transactions", end='', flush=True)
+
+    with connection(args.db_file) as conn:
+        converted = convert_amounts_to_cents(conn, args.chunk_size, progress)
+        if converted:
+            print()
+            # Recreate the indexes, triggers and rollups dropped with the old table
+            create_tables(conn)
+    if converted:
+        print(f"Amounts converted to cents in {time.perf_counter() - start:.1f}s.")
+    else:
+        print("Amounts are already stored as cents.")
+
+
+if __name__ == '__main__':
+    main()
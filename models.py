@@ -0,0 +1,109 @@
+"""Result types returned by the data functions.
+
+Rows are NamedTuples so they still unpack and index like the plain
+sqlite3 tuples they replace.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, NamedTuple, Optional
+
+from money import Money
+
+
+class Category(NamedTuple):
+    id: int
+    name: str
+    type: str
+
+
+class Transaction(NamedTuple):
+    id: int
+    category: str
+    amount: Money
+    description: str
+    date: str
+
+
+class CategoryAmount(NamedTuple):
+    category: str
+    amount: Money
+
+
+class MonthBreakdown(NamedTuple):
+    month: int
+    income: Money
+    expenses: Money
+
+    @property
+    def savings(self):
+        return self.income - self.expenses
+
+
+class BudgetStatus(NamedTuple):
+    user_id: int
+    month: int
+    year: int
+    category_id: int
+    category_name: str
+    budget: Money
+    spent: Money
+    remaining: Money
+    percentage: float
+
+
+class CategoryTrend(NamedTuple):
+    category: str
+    year: int
+    total: Money
+    count: int
+    change: Optional[float]
+
+
+class RollingTotal(NamedTuple):
+    year: int
+    month: int
+    total: Money
+    average: Money
+
+
+class CategoryPercentiles(NamedTuple):
+    category: str
+    count: int
+    percentiles: Dict[float, Money]
+
+
+class RecurringRule(NamedTuple):
+    id: int
+    category: str
+    amount: Money
+    description: str
+    frequency: str
+    interval: int
+    start_date: str
+    end_date: Optional[str]
+    next_due: Optional[str]
+
+
+@dataclass
+class MonthlySummary:
+    month: int
+    year: int
+    total_income: Money = Money(0)
+    total_expenses: Money = Money(0)
+    income_by_category: List[CategoryAmount] = field(default_factory=list)
+    expenses_by_category: List[CategoryAmount] = field(default_factory=list)
+
+    @property
+    def savings(self):
+        return self.total_income - self.total_expenses
+
+
+@dataclass
+class YearlySummary:
+    year: int
+    total_income: Money = Money(0)
+    total_expenses: Money = Money(0)
+    monthly_breakdown: List[MonthBreakdown] = field(default_factory=list)
+
+    @property
+    def savings(self):
+        return self.total_income - self.total_expenses
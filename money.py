@@ -0,0 +1,118 @@
+"""Exact currency amounts stored as integer cents"""
+import sqlite3
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from functools import total_ordering
+
+CENT = Decimal('0.01')
+
+
+@total_ordering
+class Money:
+    """An amount of money held as an integer number of cents.
+
+    Money(1250) is $12.50. Use Money.of() to convert user input such as
+    12.5, '12.50' or Decimal('12.5'). Instances compare equal to plain
+    numbers of the same value, so Money.of(12.5) == 12.5.
+    """
+    __slots__ = ('cents',)
+
+    def __init__(self, cents=0):
+        if isinstance(cents, float):
+            if not cents.is_integer():
+                raise ValueError(f"Money takes whole cents, got {cents!r}")
+            cents = int(cents)
+        object.__setattr__(self, 'cents', int(cents))
+
+    @classmethod
+    def of(cls, value):
+        """Convert an amount in currency units to Money, rounding to cents"""
+        if isinstance(value, Money):
+            return value
+        try:
+            amount = Decimal(value) if isinstance(value, (int, Decimal)) else Decimal(str(value).strip())
+            return cls(int((amount * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP)))
+        except InvalidOperation:
+            raise ValueError(f"Invalid amount: {value!r}") from None
+
+    @property
+    def amount(self):
+        """The value in currency units as a Decimal"""
+        return Decimal(self.cents) * CENT
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Money is immutable")
+
+    def __add__(self, other):
+        if isinstance(other, Money):
+            return Money(self.cents + other.cents)
+        if other == 0:
+            return self
+        return NotImplemented
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        if isinstance(other, Money):
+            return Money(self.cents - other.cents)
+        return NotImplemented
+
+    def __neg__(self):
+        return Money(-self.cents)
+
+    def __abs__(self):
+        return Money(abs(self.cents))
+
+    def __bool__(self):
+        return self.cents != 0
+
+    @staticmethod
+    def _number(other):
+        """A plain number as a Decimal to compare against, or None.
+
+        Floats compare by the decimal they print as, as Money.of() reads
+        them, so Money.of(19.99) == 19.99 despite 19.99's binary error.
+        """
+        if isinstance(other, float):
+            return Decimal(repr(other))
+        if isinstance(other, (int, Decimal)):
+            return other
+        return None
+
+    def __eq__(self, other):
+        if isinstance(other, Money):
+            return self.cents == other.cents
+        number = self._number(other)
+        if number is None:
+            return NotImplemented
+        return self.amount == number
+
+    def __lt__(self, other):
+        if isinstance(other, Money):
+            return self.cents < other.cents
+        number = self._number(other)
+        if number is None:
+            return NotImplemented
+        return self.amount < number
+
+    def __hash__(self):
+        # Agrees with __eq__ for floats and ints: self equals a float only
+        # if that float is float(self). A Decimal such as Decimal('19.99'),
+        # which has no exact float, compares equal but hashes differently,
+        # as no hash can match both it and the float 19.99.
+        return hash(float(self))
+
+    def __float__(self):
+        return self.cents / 100
+
+    def __format__(self, spec):
+        return format(self.amount, spec or '.2f')
+
+    def __str__(self):
+        return f"{self.amount:.2f}"
+
+    def __repr__(self):
+        return f"Money('{self}')"
+
+
+# Money can be bound straight into queries as its integer cents
+sqlite3.register_adapter(Money, lambda money: money.cents)
@@ -0,0 +1,147 @@
+"""Console rendering for the data returned by the finance modules"""
+import calendar
+
+RED = "\033[91m"
+YELLOW = "\033[93m"
+RESET = "\033[0m"
+
+
+def _table():
+    # prettytable is slow to import and the menus never need it, so it is
+    # loaded when the first table is printed
+    from prettytable import PrettyTable
+    return PrettyTable()
+
+
+def _money(amount):
+    return f"${amount:.2f}"
+
+
+def print_categories(categories):
+    if not categories:
+        print("No categories found.")
+        return
+
+    table = _table()
+    table.field_names = ["ID", "Category", "Type"]
+    for category in categories:
+        table.add_row(category)
+    print(table)
+
+
+def print_transactions(transactions):
+    if not transactions:
+        print("No transactions found.")
+        return
+
+    table = _table()
+    table.field_names = ["ID", "Category", "Amount", "Description", "Date"]
+    for transaction in transactions:
+        table.add_row(transaction)
+    print(table)
+
+
+def print_recurring_rules(rules):
+    if not rules:
+        print("No recurring transactions found.")
+        return
+
+    table = _table()
+    table.field_names = ["ID", "Category", "Amount", "Description", "Repeats", "Next Due"]
+    for rule in rules:
+        repeats = rule.frequency if rule.interval == 1 else f"every {rule.interval} ({rule.frequency})"
+        table.add_row([rule.id, rule.category, _money(rule.amount), rule.description, repeats,
+                       rule.next_due or "ended"])
+    print(table)
+
+
+def _print_totals(title, summary):
+    print(f"\n{title}")
+    print("=" * 40)
+    print(f"Total Income: {_money(summary.total_income)}")
+    print(f"Total Expenses: {_money(summary.total_expenses)}")
+    print(f"Savings: {_money(summary.savings)}")
+
+
+def _print_category_amounts(title, rows):
+    if not rows:
+        return
+    print(f"\n{title}:")
+    table = _table()
+    table.field_names = ["Category", "Amount"]
+    for row in rows:
+        table.add_row([row.category, _money(row.amount)])
+    print(table)
+
+
+def print_monthly_summary(summary):
+    if summary is None:
+        return
+    _print_totals(f"Monthly Summary for {summary.month}/{summary.year}", summary)
+    _print_category_amounts("Income by Category", summary.income_by_category)
+    _print_category_amounts("Expenses by Category", summary.expenses_by_category)
+
+
+def print_yearly_summary(summary):
+    if summary is None:
+        return
+    _print_totals(f"Yearly Summary for {summary.year}", summary)
+
+    if summary.monthly_breakdown:
+        print("\nMonthly Breakdown:")
+        table = _table()
+        table.field_names = ["Month", "Income", "Expenses", "Savings"]
+        for row in summary.monthly_breakdown:
+            table.add_row([calendar.month_name[row.month], _money(row.income),
+                           _money(row.expenses), _money(row.savings)])
+        print(table)
+
+
+def print_budget_status(statuses, month, year):
+    if statuses is None:
+        return
+    if not statuses:
+        print("No budgets set for this month.")
+        return
+
+    print(f"\nBudget Status for {month}/{year}")
+    print("=" * 40)
+
+    table = _table()
+    table.field_names = ["Category", "Budget", "Spent", "Remaining", "Percentage"]
+    for status in statuses:
+        percentage = f"{status.percentage:.1f}%"
+        if status.percentage > 100:
+            percentage = f"{RED}{percentage}{RESET}"  # Exceeded
+        elif status.percentage > 80:
+            percentage = f"{YELLOW}{percentage}{RESET}"  # Warning
+        table.add_row([status.category_name, _money(status.budget), _money(status.spent),
+                       _money(status.remaining), percentage])
+    print(table)
+
+    exceeded = [status for status in statuses if status.remaining < 0]
+    if exceeded:
+        print(f"\n{RED}Warning: Budget exceeded for categories:{RESET}")
+        for status in exceeded:
+            print(f"- {status.category_name} (over by {_money(-status.remaining)})")
+
+
+def print_query_profile(profiles, limit=20, width=70):
+    if not profiles:
+        print("No queries recorded.")
+        return
+
+    print(f"\nQuery Profile (top {min(limit, len(profiles))} of {len(profiles)} by total time)")
+    table = _table()
+    table.field_names = ["Statement", "Calls", "Rows", "Total ms", "Mean ms", "p99 ms", "VM steps"]
+    table.align["Statement"] = "l"
+    for profile in profiles[:limit]:
+        sql = profile.sql if len(profile.sql) <= width else profile.sql[:width - 3] + "..."
+        table.add_row([sql, profile.count, profile.rows, f"{profile.total_ms:.2f}",
+                       f"{profile.mean_ms:.3f}", f"{profile.p99_ms:.3f}", profile.vm_steps])
+    print(table)
+
+
+def print_cache_stats(stats):
+    print(f"\nReport cache: {stats.hits} hits, {stats.misses} misses ({stats.hit_rate:.0%} hit rate), "
+          f"{stats.invalidations} invalidated, {stats.evictions} evicted, {stats.size}/{stats.maxsize} cached")
\ No newline at end of file
@@ -0,0 +1,280 @@
+"""Per-statement query statistics for the pooled connections.
+
+    import profiling
+    profiling.enable(slow_threshold=0.05)
+    ...
+    for statement in profiling.snapshot():
+        print(statement.sql, statement.count, statement.p99_ms)
+
+enable() makes the pooled connections in database.py instrumented ones.
+Each statement run through them is timed from execute() until its rows
+are fetched, and rows returned are counted. Statements are grouped by
+their SQL text with whitespace collapsed, and commits are timed as
+COMMIT. A progress handler also counts the SQLite virtual machine steps
+each statement takes, including the triggers it fires, in units of
+PROGRESS_STEPS; unlike time, that does not vary from run to run. A
+statement slower than slow_threshold seconds is logged as a warning with
+its EXPLAIN QUERY PLAN.
+
+Latency percentiles come from the most recent sample_size executions of
+each statement; counts and totals cover every execution.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from typing import NamedTuple
+
+import database
+
+DEFAULT_SLOW_THRESHOLD = 0.1
+DEFAULT_SAMPLE_SIZE = 1000
+PROGRESS_STEPS = 1000
+
+logger = logging.getLogger(__name__)
+
+
+class StatementProfile(NamedTuple):
+    sql: str
+    count: int
+    rows: int
+    vm_steps: int
+    total_ms: float
+    mean_ms: float
+    p99_ms: float
+    max_ms: float
+
+
+@lru_cache(maxsize=1024)
+def normalize(sql):
+    """Collapse whitespace so the same statement always gets the same key"""
+    return ' '.join(sql.split())
+
+
+class _Statement:
+    __slots__ = ('count', 'rows', 'steps', 'total', 'max', 'samples')
+
+    def __init__(self, sample_size):
+        self.count = 0
+        self.rows = 0
+        self.steps = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=sample_size)
+
+
+class QueryProfiler:
+    def __init__(self, slow_threshold=DEFAULT_SLOW_THRESHOLD, sample_size=DEFAULT_SAMPLE_SIZE):
+        self.slow_threshold = slow_threshold
+        self.sample_size = sample_size
+        self._lock = threading.Lock()
+        self._statements = {}
+
+    def record(self, sql, elapsed, rows=0, steps=0):
+        key = normalize(sql)
+        with self._lock:
+            statement = self._statements.get(key)
+            if statement is None:
+                statement = self._statements[key] = _Statement(self.sample_size)
+            statement.count += 1
+            statement.rows += rows
+            statement.steps += steps
+            statement.total += elapsed
+            statement.max = max(statement.max, elapsed)
+            statement.samples.append(elapsed)
+
+    def snapshot(self):
+        """Return a StatementProfile per statement, most total time first"""
+        with self._lock:
+            items = [(sql, s.count, s.rows, s.steps, s.total, s.max, sorted(s.samples))
+                     for sql, s in self._statements.items()]
+        profiles = []
+        for sql, count, rows, steps, total, longest, samples in items:
+            p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+            profiles.append(StatementProfile(sql, count, rows, steps * PROGRESS_STEPS, total * 1000,
+                                             total * 1000 / count, p99 * 1000, longest * 1000))
+        profiles.sort(key=lambda profile: (-profile.total_ms, -profile.count))
+        return profiles
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+
+
+_profiler = None
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """A cursor that reports each statement's time and rows to the profiler"""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._sql = None
+
+    def _start(self, sql, parameters, elapsed, steps):
+        self._sql = sql
+        self._parameters = parameters
+        self._elapsed = elapsed
+        self._steps = steps
+        self._rows = 0
+
+    def _add(self, elapsed, steps):
+        if self._sql is not None:
+            self._elapsed += elapsed
+            self._steps += steps
+
+    def _finish(self):
+        sql, self._sql = getattr(self, '_sql', None), None
+        profiler = _profiler
+        if sql is None or profiler is None:
+            return
+        profiler.record(sql, self._elapsed, self._rows, self._steps)
+        if self._elapsed >= profiler.slow_threshold:
+            _log_slow_statement(self.connection, sql, self._parameters, self._elapsed)
+
+    def _run(self, method, sql, arg, parameters, finish):
+        self._finish()
+        ticks = self.connection.ticks
+        start = time.perf_counter()
+        try:
+            return method(sql, arg)
+        finally:
+            self._start(sql, parameters, time.perf_counter() - start, self.connection.ticks - ticks)
+            if finish:
+                self._finish()
+
+    def execute(self, sql, parameters=()):
+        return self._run(super().execute, sql, parameters, parameters, False)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._run(super().executemany, sql, seq_of_parameters, None, True)
+
+    def executescript(self, sql_script):
+        self._finish()
+        ticks = self.connection.ticks
+        start = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            self._start(sql_script, None, time.perf_counter() - start, self.connection.ticks - ticks)
+            self._finish()
+
+    def _fetch(self, fetch, *args):
+        """Call fetch(*args), charging its time to the current statement"""
+        ticks = self.connection.ticks
+        start = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            self._add(time.perf_counter() - start, self.connection.ticks - ticks)
+
+    def fetchone(self):
+        row = self._fetch(super().fetchone)
+        if row is None:
+            self._finish()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._fetch(super().fetchmany, self.arraysize if size is None else size)
+        if rows:
+            self._rows += len(rows)
+        else:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._fetch(super().fetchall)
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            row = self._fetch(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+        self._rows += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """A connection whose cursors and commits are profiled"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ticks = 0
+        self.set_progress_handler(self._tick, PROGRESS_STEPS)
+
+    def _tick(self):
+        self.ticks += 1
+        return 0
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            profiler = _profiler
+            if profiler is not None:
+                profiler.record('COMMIT', time.perf_counter() - start)
+
+
+def _log_slow_statement(conn, sql, parameters, elapsed):
+    plan = None
+    if parameters is not None:
+        try:
+            # A plain cursor, so explaining is not itself profiled
+            plan = sqlite3.Cursor(conn).execute(f'EXPLAIN QUERY PLAN {sql}', parameters).fetchall()
+        except sqlite3.Error:
+            pass
+    lines = [f"Slow statement ({elapsed * 1000:.1f} ms): {normalize(sql)}"]
+    lines.extend(f"    {row[-1]}" for row in plan or [])
+    logger.warning('\n'.join(lines))
+
+
+def enable(slow_threshold=DEFAULT_SLOW_THRESHOLD, sample_size=DEFAULT_SAMPLE_SIZE):
+    """Start profiling the pooled connections; returns the new QueryProfiler"""
+    global _profiler
+    _profiler = QueryProfiler(slow_threshold, sample_size)
+    database.CONNECTION_FACTORY = ProfiledConnection
+    # Reopened on next use, now instrumented
+    database.reopen_connections()
+    return _profiler
+
+
+def disable():
+    global _profiler
+    _profiler = None
+    database.CONNECTION_FACTORY = sqlite3.Connection
+    database.reopen_connections()
+
+
+def snapshot():
+    """Return the current StatementProfiles, or [] when profiling is off"""
+    return _profiler.snapshot() if _profiler is not None else []
+
+
+def reset():
+    if _profiler is not None:
+        _profiler.reset()
\ No newline at end of file
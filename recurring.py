@@ -0,0 +1,263 @@
+"""Recurring transactions, such as rent and salary, posted when they fall due.
+
+    rule_id = add_rule(user_id, 5, '1500', 'Rent', 'monthly', '2025-01-01')
+    post_due()              # posts every occurrence due by now
+
+A rule repeats every `interval` days, weeks, months or years from its
+start date. Monthly and yearly rules keep the start's day of the month,
+moved back to the month's last day where it is shorter, so a rule started
+on the 31st posts on Feb 28 and again on Mar 31.
+
+The partial index on recurring_rules.next_due is the scheduler's priority
+queue: post_due() reads only the rules due by now from it, in due order,
+and never looks at the rest. The occurrences of those rules are generated
+lazily and merged by date, then inserted in one batch in the same
+transaction that advances each rule's posted count and next_due. Posting
+is therefore idempotent: after downtime one run catches up every missed
+occurrence, and running it again posts nothing until the next one is due.
+BEGIN IMMEDIATE keeps two schedulers from posting the same occurrence.
+
+Archived years are closed to new transactions (see archive.py), so a rule
+cannot start in one, and post_due() skips the occurrences that fall in
+one, counting them as posted, rather than failing the whole batch.
+
+Scheduler runs post_due() on a background thread, sleeping until the
+earliest next_due or max_sleep, whichever comes first.
+"""
+import calendar
+import heapq
+import threading
+from datetime import datetime, timedelta
+from functools import partial
+from sqlite3 import Error
+
+import report_cache
+from categories import category_name, lookup
+from database import after_commit, connection
+from models import RecurringRule
+from money import Money
+from transactions import insert_transaction_rows
+
+FREQUENCIES = ('daily', 'weekly', 'monthly', 'yearly')
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+DEFAULT_MAX_SLEEP = 60.0
+
+RULE_COLUMNS = ('id, user_id, category_id, amount, description, frequency, interval, '
+                'start_date, end_date, posted')
+
+
+def parse_date(value):
+    """Parse 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS'"""
+    value = value.strip()
+    return datetime.strptime(value, DATE_FORMAT if ' ' in value else '%Y-%m-%d')
+
+
+def occurrence(start, frequency, interval, n):
+    """Return the datetime of occurrence n of a rule, counting the start as 0"""
+    if frequency == 'daily':
+        return start + timedelta(days=n * interval)
+    if frequency == 'weekly':
+        return start + timedelta(weeks=n * interval)
+    months = n * interval * (12 if frequency == 'yearly' else 1)
+    year, month = divmod(start.month - 1 + months, 12)
+    year += start.year
+    day = min(start.day, calendar.monthrange(year, month + 1)[1])
+    return start.replace(year=year, month=month + 1, day=day)
+
+
+def _next_due(start, frequency, interval, end, n):
+    """next_due for a rule with n occurrences posted, or None if it has ended"""
+    when = occurrence(start, frequency, interval, n)
+    return None if end is not None and when > end else when.strftime(DATE_FORMAT)
+
+
+def _archived_years(cursor):
+    return {year for year, in cursor.execute('SELECT year FROM archived_years')}
+
+
+def add_rule(user_id, category_id, amount, description, frequency, start_date, interval=1,
+             end_date=None, db_file=None):
+    """Add a recurring transaction rule; returns its id, or None if it is invalid"""
+    category = lookup(category_id, db_file)
+    if category is None:
+        print("Invalid category ID.")
+        return None
+    if frequency not in FREQUENCIES or int(interval) < 1:
+        print(f"Frequency must be one of {', '.join(FREQUENCIES)}, with an interval of at least 1.")
+        return None
+    try:
+        start = parse_date(start_date)
+        end = parse_date(end_date) if end_date else None
+    except ValueError:
+        print("Dates must be YYYY-MM-DD or YYYY-MM-DD HH:MM:SS.")
+        return None
+
+    try:
+        with connection(db_file) as conn:
+            cursor = conn.cursor()
+            if start.year in _archived_years(cursor):
+                print(f"{start.year} is archived; recurring transactions cannot start in it.")
+                return None
+            cursor.execute('''
+            INSERT INTO recurring_rules (user_id, category_id, amount, description, frequency,
+                                         interval, start_date, end_date, next_due)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (user_id, category.id, Money.of(amount), description, frequency, int(interval),
+                  start.strftime(DATE_FORMAT), end.strftime(DATE_FORMAT) if end else None,
+                  _next_due(start, frequency, int(interval), end, 0)))
+            print("Recurring transaction added successfully!")
+            return cursor.lastrowid
+    except Error as e:
+        print(f"Error adding recurring transaction: {e}")
+    return None
+
+
+def delete_rule(rule_id, user_id, db_file=None):
+    """Delete a user's rule; transactions it already posted are kept"""
+    try:
+        with connection(db_file) as conn:
+            cursor = conn.execute('DELETE FROM recurring_rules WHERE id=? AND user_id=?', (rule_id, user_id))
+            if cursor.rowcount == 0:
+                print("Recurring transaction not found or doesn't belong to you.")
+                return False
+            print("Recurring transaction deleted successfully!")
+            return True
+    except Error as e:
+        print(f"Error deleting recurring transaction: {e}")
+    return False
+
+
+def list_rules(user_id, db_file=None):
+    """Get a user's rules, soonest due first and ended rules last"""
+    try:
+        with connection(db_file) as conn:
+            rows = conn.execute('''
+            SELECT id, category_id, amount, description, frequency, interval, start_date, end_date,
+                   next_due
+            FROM recurring_rules
+            WHERE user_id=?
+            ORDER BY next_due IS NULL, next_due, id
+            ''', (user_id,)).fetchall()
+            return [RecurringRule(rule_id, category_name(category_id, db_file), Money(amount), *rest)
+                    for rule_id, category_id, amount, *rest in rows]
+    except Error as e:
+        print(f"Error listing recurring transactions: {e}")
+    return []
+
+
+def _occurrences(rule_id, start, frequency, interval, posted, until):
+    """Yield (date, rule id, n) for each unposted occurrence of a rule up to until"""
+    n = posted
+    while True:
+        when = occurrence(start, frequency, interval, n)
+        if when > until:
+            return
+        yield when, rule_id, n
+        n += 1
+
+
+def post_due(now=None, limit=None, db_file=None):
+    """Post every occurrence due by now as a transaction; returns how many were posted.
+
+    limit caps the number of rules handled in one run, taking the longest
+    overdue first; the rest are left for the next run. Occurrences in
+    archived years are skipped but count as posted.
+    """
+    now = now or datetime.now()
+    query = f'''
+    SELECT {RULE_COLUMNS} FROM recurring_rules
+    WHERE next_due IS NOT NULL AND next_due <= ?
+    ORDER BY next_due
+    '''
+    params = [now.strftime(DATE_FORMAT)]
+    if limit is not None:
+        query += ' LIMIT ?'
+        params.append(limit)
+
+    try:
+        with connection(db_file) as conn:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            archived = _archived_years(cursor)
+            rules = {}
+            for rule in cursor.execute(query, params).fetchall():
+                # Stored dates are always DATE_FORMAT, which fromisoformat
+                # reads far faster than strptime
+                start = datetime.fromisoformat(rule[7])
+                end = datetime.fromisoformat(rule[8]) if rule[8] else None
+                rules[rule[0]] = (rule, start, end)
+
+            rows = []
+            posted = {}
+            due = (_occurrences(rule_id, start, rule[5], rule[6], rule[9], min(now, end or now))
+                   for rule_id, (rule, start, end) in rules.items())
+            for when, rule_id, n in heapq.merge(*due):
+                posted[rule_id] = n + 1
+                if when.year in archived:
+                    continue
+                _, user_id, category_id, amount, description = rules[rule_id][0][:5]
+                rows.append((user_id, category_id, amount, description, when.strftime(DATE_FORMAT)))
+
+            insert_transaction_rows(cursor, rows)
+            updates = []
+            for rule_id, (rule, start, end) in rules.items():
+                count = posted.get(rule_id, rule[9])
+                updates.append((count, _next_due(start, rule[5], rule[6], end, count), rule_id))
+            cursor.executemany('UPDATE recurring_rules SET posted=?, next_due=? WHERE id=?', updates)
+            after_commit(partial(report_cache.invalidate_transactions,
+                                 {(row[0], row[4]) for row in rows}, db_file), db_file)
+        return len(rows)
+    except Error as e:
+        print(f"Error posting recurring transactions: {e}")
+    return 0
+
+
+def next_due(db_file=None):
+    """Return the datetime the next occurrence of any rule falls due, or None"""
+    try:
+        with connection(db_file) as conn:
+            value = conn.execute(
+                'SELECT MIN(next_due) FROM recurring_rules WHERE next_due IS NOT NULL').fetchone()[0]
+            return parse_date(value) if value else None
+    except Error as e:
+        print(f"Error reading recurring transactions: {e}")
+    return None
+
+
+class Scheduler:
+    """Posts recurring transactions as they fall due, on a background thread.
+
+    Rules added by other connections are picked up within max_sleep
+    seconds; call wake() to check again at once.
+    """
+
+    def __init__(self, db_file=None, max_sleep=DEFAULT_MAX_SLEEP):
+        self.db_file = db_file
+        self.max_sleep = max_sleep
+        self.posted = 0
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='finance-scheduler', daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stopping = True
+        self._wake.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.clear()
+            self.posted += post_due(db_file=self.db_file)
+            due = next_due(self.db_file)
+            delay = self.max_sleep if due is None else (due - datetime.now()).total_seconds()
+            self._wake.wait(min(max(delay, 0), self.max_sleep))
\ No newline at end of file
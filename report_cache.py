@@ -0,0 +1,144 @@
+"""LRU cache of report results, invalidated by the writes that change them.
+
+Monthly and yearly summaries and monthly budget status are cached per
+database file under (user_id, year, month, report), with yearly reports
+under month None. The public write functions in transactions.py and
+budget.py, and a WriteQueue, call invalidate_transactions() or
+invalidate_budget() after they commit, through database.after_commit()
+when nested in a caller's connection() block. These drop exactly the
+entries for the user and period they touched:
+
+    a transaction dated 2025-03-14   monthly 2025-03, budget 2025-03, yearly 2025
+    a budget for 2025-03             budget 2025-03
+
+A report computed while such a write committed is returned but not
+stored, so the cache never keeps a result older than a write it has
+already been told about. Writes made any other way, by raw SQL, a restore
+or another process, are not seen; call clear() after them.
+
+Cached results are shared between callers and must not be modified.
+"""
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+from database import DEFAULT_DB_FILE
+
+DEFAULT_MAXSIZE = 1024
+
+MONTHLY = 'monthly'
+YEARLY = 'yearly'
+BUDGET = 'budget'
+
+
+class CacheStats(NamedTuple):
+    hits: int
+    misses: int
+    invalidations: int
+    evictions: int
+    size: int
+    maxsize: int
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class ReportCache:
+    def __init__(self, maxsize=DEFAULT_MAXSIZE):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # Bumped by every invalidation, so a result computed across one is not stored
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        self._evictions = 0
+
+    def get(self, key, compute, *args):
+        """Return the cached result for key, or compute(*args) and cache it unless it is None"""
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return result
+            self._misses += 1
+            generation = self._generation
+
+        result = compute(*args)
+        if result is not None:
+            with self._lock:
+                if generation == self._generation and self.maxsize > 0:
+                    self._entries[key] = result
+                    while len(self._entries) > self.maxsize:
+                        self._entries.popitem(last=False)
+                        self._evictions += 1
+        return result
+
+    def invalidate(self, keys):
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self._invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return CacheStats(self._hits, self._misses, self._invalidations, self._evictions,
+                              len(self._entries), self.maxsize)
+
+    def reset_stats(self):
+        with self._lock:
+            self._hits = self._misses = self._invalidations = self._evictions = 0
+
+
+_cache = ReportCache()
+
+
+def configure(maxsize=DEFAULT_MAXSIZE):
+    """Replace the cache with an empty one holding at most maxsize reports; 0 disables it"""
+    global _cache
+    _cache = ReportCache(maxsize)
+
+
+def cached(report, user_id, year, month, db_file, compute, *args):
+    """Return a cached report, computing it with compute(*args) on a miss"""
+    return _cache.get((db_file or DEFAULT_DB_FILE, user_id, year, month, report), compute, *args)
+
+
+def invalidate_transactions(touched, db_file=None):
+    """Drop the reports affected by transactions of (user_id, date) pairs"""
+    db_file = db_file or DEFAULT_DB_FILE
+    keys = set()
+    for user_id, date in touched:
+        year, month = int(date[:4]), int(date[5:7])
+        keys.update(((db_file, user_id, year, month, MONTHLY),
+                     (db_file, user_id, year, month, BUDGET),
+                     (db_file, user_id, year, None, YEARLY)))
+    if keys:
+        _cache.invalidate(keys)
+
+
+def invalidate_budget(user_id, month, year, db_file=None):
+    """Drop the budget status report of one user's month"""
+    _cache.invalidate([(db_file or DEFAULT_DB_FILE, user_id, year, month, BUDGET)])
+
+
+def clear():
+    _cache.clear()
+
+
+def stats():
+    return _cache.stats()
+
+
+def reset_stats():
+    _cache.reset_stats()
\ No newline at end of file
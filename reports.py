@@ -1,169 +1,86 @@
 import sqlite3
-from prettytable import PrettyTable
-from datetime import datetime
-from database import create_connection
+from sqlite3 import Error
+from categories import lookup
+from database import connection
+import report_cache
+from models import CategoryAmount, MonthBreakdown, MonthlySummary, YearlySummary
+from money import Money
 
 
-def get_monthly_summary(user_id, month, year):
-    """Generate monthly income/expense summary"""
-    conn = create_connection()
-    if conn is not None:
-        try:
+def _categorize(rows, db_file):
+    """Pair (category_id, ...) rows with their catalog Category, dropping unknown ids"""
+    for category_id, *values in rows:
+        category = lookup(category_id, db_file)
+        if category is not None:
+            yield category, *values
+
+
+def get_monthly_summary(user_id, month, year, db_file=None):
+    """Get the monthly income/expense summary, from the report cache if it is there"""
+    return report_cache.cached(report_cache.MONTHLY, user_id, year, month, db_file,
+                               _monthly_summary, user_id, month, year, db_file)
+
+
+def get_yearly_summary(user_id, year, db_file=None):
+    """Get the yearly income/expense summary, from the report cache if it is there"""
+    return report_cache.cached(report_cache.YEARLY, user_id, year, None, db_file,
+                               _yearly_summary, user_id, year, db_file)
+
+
+def _monthly_summary(user_id, month, year, db_file):
+    try:
+        with connection(db_file) as conn:
             cursor = conn.cursor()
 
-            # Get total income
+            # Per-category totals come straight from the monthly rollup,
+            # named and typed from the cached category catalog
             cursor.execute('''
-            SELECT COALESCE(SUM(t.amount), 0)
-            FROM transactions t
-            JOIN categories c ON t.category_id = c.id
-            WHERE t.user_id=? AND c.type='income' 
-            AND strftime('%m', t.date) = ? AND strftime('%Y', t.date) = ?
-            ''', (user_id, f"{month:02d}", str(year)))
-            total_income = cursor.fetchone()[0]
-
-            # Get total expenses
-            cursor.execute('''
-            SELECT COALESCE(SUM(t.amount), 0)
-            FROM transactions t
-            JOIN categories c ON t.category_id = c.id
-            WHERE t.user_id=? AND c.type='expense' 
-            AND strftime('%m', t.date) = ? AND strftime('%Y', t.date) = ?
-            ''', (user_id, f"{month:02d}", str(year)))
-            total_expenses = cursor.fetchone()[0]
-
-            # Get income by category
-            cursor.execute('''
-            SELECT c.name, COALESCE(SUM(t.amount), 0)
-            FROM transactions t
-            JOIN categories c ON t.category_id = c.id
-            WHERE t.user_id=? AND c.type='income' 
-            AND strftime('%m', t.date) = ? AND strftime('%Y', t.date) = ?
-            GROUP BY c.name
-            ''', (user_id, f"{month:02d}", str(year)))
-            income_by_category = cursor.fetchall()
-
-            # Get expenses by category
-            cursor.execute('''
-            SELECT c.name, COALESCE(SUM(t.amount), 0)
-            FROM transactions t
-            JOIN categories c ON t.category_id = c.id
-            WHERE t.user_id=? AND c.type='expense' 
-            AND strftime('%m', t.date) = ? AND strftime('%Y', t.date) = ?
-            GROUP BY c.name
-            ''', (user_id, f"{month:02d}", str(year)))
-            expenses_by_category = cursor.fetchall()
-
-            # Calculate savings
-            savings = total_income - total_expenses
-
-            # Print summary
-            print(f"\nMonthly Summary for {month}/{year}")
-            print("=" * 40)
-            print(f"Total Income: ${total_income:.2f}")
-            print(f"Total Expenses: ${total_expenses:.2f}")
-            print(f"Savings: ${savings:.2f}")
-
-            # Print income by category
-            if income_by_category:
-                print("\nIncome by Category:")
-                table = PrettyTable()
-                table.field_names = ["Category", "Amount"]
-                for row in income_by_category:
-                    table.add_row([row[0], f"${row[1]:.2f}"])
-                print(table)
-
-            # Print expenses by category
-            if expenses_by_category:
-                print("\nExpenses by Category:")
-                table = PrettyTable()
-                table.field_names = ["Category", "Amount"]
-                for row in expenses_by_category:
-                    table.add_row([row[0], f"${row[1]:.2f}"])
-                print(table)
-
-            return {
-                'total_income': total_income,
-                'total_expenses': total_expenses,
-                'savings': savings,
-                'income_by_category': income_by_category,
-                'expenses_by_category': expenses_by_category
-            }
-        except Error as e:
-            print(f"Error generating monthly summary: {e}")
-        finally:
-            conn.close()
+            SELECT category_id, total
+            FROM monthly_rollups
+            WHERE user_id=? AND year=? AND month=?
+            ''', (user_id, year, month))
+
+            summary = MonthlySummary(month, year)
+            for category, cents in sorted(_categorize(cursor.fetchall(), db_file),
+                                          key=lambda row: row[0].name):
+                if category.type == 'income':
+                    summary.income_by_category.append(CategoryAmount(category.name, Money(cents)))
+                else:
+                    summary.expenses_by_category.append(CategoryAmount(category.name, Money(cents)))
+
+            # Integer cents, so the totals are exact
+            summary.total_income = sum((row.amount for row in summary.income_by_category), Money(0))
+            summary.total_expenses = sum((row.amount for row in summary.expenses_by_category), Money(0))
+            return summary
+    except Error as e:
+        print(f"Error generating monthly summary: {e}")
     return None
 
 
-def get_yearly_summary(user_id, year):
-    """Generate yearly income/expense summary"""
-    conn = create_connection()
-    if conn is not None:
-        try:
+def _yearly_summary(user_id, year, db_file):
+    try:
+        with connection(db_file) as conn:
             cursor = conn.cursor()
 
-            # Get total income
-            cursor.execute('''
-            SELECT COALESCE(SUM(t.amount), 0)
-            FROM transactions t
-            JOIN categories c ON t.category_id = c.id
-            WHERE t.user_id=? AND c.type='income' 
-            AND strftime('%Y', t.date) = ?
-            ''', (user_id, str(year)))
-            total_income = cursor.fetchone()[0]
-
-            # Get total expenses
-            cursor.execute('''
-            SELECT COALESCE(SUM(t.amount), 0)
-            FROM transactions t
-            JOIN categories c ON t.category_id = c.id
-            WHERE t.user_id=? AND c.type='expense' 
-            AND strftime('%Y', t.date) = ?
-            ''', (user_id, str(year)))
-            total_expenses = cursor.fetchone()[0]
-
-            # Get monthly breakdown
+            # Get monthly breakdown from the rollup, at most 12 x categories rows,
+            # split into income and expenses by the cached category types
             cursor.execute('''
-            SELECT strftime('%m', t.date) as month, 
-                   SUM(CASE WHEN c.type='income' THEN t.amount ELSE 0 END) as income,
-                   SUM(CASE WHEN c.type='expense' THEN t.amount ELSE 0 END) as expense
-            FROM transactions t
-            JOIN categories c ON t.category_id = c.id
-            WHERE t.user_id=? AND strftime('%Y', t.date) = ?
-            GROUP BY month
-            ORDER BY month
-            ''', (user_id, str(year)))
-            monthly_breakdown = cursor.fetchall()
-
-            # Calculate savings
-            savings = total_income - total_expenses
-
-            # Print summary
-            print(f"\nYearly Summary for {year}")
-            print("=" * 40)
-            print(f"Total Income: ${total_income:.2f}")
-            print(f"Total Expenses: ${total_expenses:.2f}")
-            print(f"Savings: ${savings:.2f}")
-
-            # Print monthly breakdown
-            if monthly_breakdown:
-                print("\nMonthly Breakdown:")
-                table = PrettyTable()
-                table.field_names = ["Month", "Income", "Expenses", "Savings"]
-                for row in monthly_breakdown:
-                    month_name = datetime.strptime(row[0], "%m").strftime("%B")
-                    monthly_savings = row[1] - row[2]
-                    table.add_row([month_name, f"${row[1]:.2f}", f"${row[2]:.2f}", f"${monthly_savings:.2f}"])
-                print(table)
-
-            return {
-                'total_income': total_income,
-                'total_expenses': total_expenses,
-                'savings': savings,
-                'monthly_breakdown': monthly_breakdown
-            }
-        except Error as e:
-            print(f"Error generating yearly summary: {e}")
-        finally:
-            conn.close()
+            SELECT category_id, month, total
+            FROM monthly_rollups
+            WHERE user_id=? AND year=?
+            ''', (user_id, year))
+
+            months = {}
+            for category, month, cents in _categorize(cursor.fetchall(), db_file):
+                totals = months.setdefault(month, [0, 0])
+                totals[category.type != 'income'] += cents
+
+            summary = YearlySummary(year)
+            summary.monthly_breakdown = [MonthBreakdown(month, Money(income), Money(expenses))
+                                         for month, (income, expenses) in sorted(months.items())]
+            summary.total_income = sum((row.income for row in summary.monthly_breakdown), Money(0))
+            summary.total_expenses = sum((row.expenses for row in summary.monthly_breakdown), Money(0))
+            return summary
+    except Error as e:
+        print(f"Error generating yearly summary: {e}")
     return None
\ No newline at end of file
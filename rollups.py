@@ -0,0 +1,62 @@
+"""Check or rebuild the monthly_rollups table from raw transactions.
+
+Usage:
+
+    python rollups.py verify [--db finance.db]
+    python rollups.py rebuild [--db finance.db]
+"""
+import argparse
+import sys
+
+from database import ROLLUP_SOURCE, connection, migrate, rebuild_rollups, transaction_source
+
+
+def verify_rollups(db_file=None):
+    """Diff monthly_rollups against a fresh aggregation of transactions.
+
+    Returns a list of (user_id, category_id, year, month, expected, actual)
+    tuples, where expected and actual are (total cents, count) pairs or None
+    when the row is missing on that side.
+    """
+    with connection(db_file) as conn:
+        expected = {row[:4]: row[4:] for row in conn.execute(
+            ROLLUP_SOURCE.format(source=transaction_source(conn)))}
+        actual = {row[:4]: row[4:] for row in conn.execute(
+            'SELECT user_id, category_id, year, month, total, count FROM monthly_rollups')}
+
+    differences = []
+    for key in sorted(expected.keys() | actual.keys()):
+        want, got = expected.get(key), actual.get(key)
+        if want != got:
+            differences.append((*key, want, got))
+    return differences
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['verify', 'rebuild'])
+    parser.add_argument('--db', dest='db_file', default=None)
+    args = parser.parse_args()
+
+    # Older databases are migrated first, which converts their amounts to
+    # cents and creates and fills the rollups
+    with connection(args.db_file) as conn:
+        migrate(conn)
+
+    if args.command == 'rebuild':
+        with connection(args.db_file) as conn:
+            rebuild_rollups(conn)
+        print("Rollups rebuilt.")
+
+    differences = verify_rollups(args.db_file)
+    for user_id, category_id, year, month, expected, actual in differences:
+        print(f"user {user_id} category {category_id} {year}-{month:02d}: "
+              f"expected {expected}, found {actual}")
+    if differences:
+        print(f"{len(differences)} rollup rows differ from transactions.")
+        sys.exit(1)
+    print("Rollups match transactions.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""Asyncio front end for the finance operations.
+
+The data functions are blocking SQLite calls, so FinanceService runs them
+on executors: one dedicated writer thread, which keeps a single write
+connection and avoids "database is locked" between writers, and a pool of
+reader threads, each with its own pooled connection. WAL mode lets the
+readers proceed while the writer commits.
+
+    async with FinanceService('finance.db') as service:
+        token = await service.login('alice', 'secret')
+        await service.add_transaction(token, 4, '12.50', 'Lunch')
+        summary = await service.monthly_summary(token, 6, 2025)
+
+Per-user calls take the session token login returned and resolve it
+through auth.sessions, a dictionary lookup, so only login pays for the
+password KDF. An unknown, revoked or expired token raises
+PermissionError before any work is queued.
+
+A call that cannot start because max_pending calls are already in flight
+waits for a slot, and every call, including that wait, is bounded by the
+timeout, raising asyncio.TimeoutError. A timed-out call that already
+reached a thread still runs to completion and keeps its slot until then;
+only the caller stops waiting.
+
+With group_commit=True, transaction adds, updates and deletes go through
+a WriteQueue instead, which commits many of them together; add_transaction
+then returns the new transaction id rather than True, and an unknown
+category raises ValueError rather than returning False.
+
+Given a sharding.ShardMap as shards, users and sessions use its catalog
+and every per-user call goes to that user's shard, with a WriteQueue per
+shard under group_commit.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import auth
+import budget
+import reports
+import transactions
+from write_queue import WriteQueue
+
+DEFAULT_READERS = 4
+DEFAULT_MAX_PENDING = 64
+DEFAULT_TIMEOUT = 10.0
+
+
+class FinanceService:
+    def __init__(self, db_file=None, readers=DEFAULT_READERS, max_pending=DEFAULT_MAX_PENDING,
+                 timeout=DEFAULT_TIMEOUT, group_commit=False, shards=None):
+        self.db_file = shards.catalog_file if shards is not None else db_file
+        self.shards = shards
+        self.timeout = timeout
+        self._readers = ThreadPoolExecutor(readers, thread_name_prefix='finance-reader')
+        self._writer = ThreadPoolExecutor(1, thread_name_prefix='finance-writer')
+        self._slots = asyncio.Semaphore(max_pending)
+        self._write_queues = {path: WriteQueue(path) for path in shards or [db_file]} if group_commit else None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Wait for calls already running, then stop the worker threads"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._shutdown)
+
+    def _shutdown(self):
+        for write_queue in (self._write_queues or {}).values():
+            write_queue.close()
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+
+    async def _call(self, executor, func, args, kwargs, timeout):
+        loop = asyncio.get_running_loop()
+        call = functools.partial(func, *args, **{'db_file': self.db_file, **kwargs})
+        return await self._bounded(lambda: loop.run_in_executor(executor, call), timeout)
+
+    def _db(self, user_id):
+        """The database holding user_id's ledger"""
+        return self.shards.shard_for(user_id) if self.shards is not None else self.db_file
+
+    @staticmethod
+    def _user(token):
+        """The user id of a live session token"""
+        user_id = auth.authenticate(token)
+        if user_id is None:
+            raise PermissionError("Invalid or expired session")
+        return user_id
+
+    async def _enqueue(self, submit, *args, timeout=None):
+        return await self._bounded(lambda: asyncio.wrap_future(submit(*args)), timeout)
+
+    async def _bounded(self, start, timeout):
+        timeout = self.timeout if timeout is None else timeout
+
+        async def run():
+            await self._slots.acquire()
+            try:
+                future = start()
+            except BaseException:
+                # Nothing was queued, say on a closed service, so nothing
+                # will release the slot later
+                self._slots.release()
+                raise
+            # The slot is held until the thread finishes, even if the caller
+            # gives up first, so timed-out work still counts as pending
+            future.add_done_callback(lambda _: self._slots.release())
+            return await asyncio.shield(future)
+
+        return await asyncio.wait_for(run(), timeout)
+
+    async def read(self, func, *args, timeout=None, **kwargs):
+        """Run a read-only data function on a reader thread"""
+        return await self._call(self._readers, func, args, kwargs, timeout)
+
+    async def write(self, func, *args, timeout=None, **kwargs):
+        """Run a mutating data function on the writer thread"""
+        return await self._call(self._writer, func, args, kwargs, timeout)
+
+    # Users
+
+    async def register(self, username, password):
+        return await self.write(auth.register_user, username, password)
+
+    async def login(self, username, password):
+        """Return a session token for the other calls, or None"""
+        # The KDF dominates a login, so keep it off the writer thread. The
+        # occasional legacy rehash write just waits on SQLite's busy timeout.
+        return await self.read(auth.start_session, username, password)
+
+    async def logout(self, token):
+        auth.end_session(token)
+
+    async def change_password(self, token, old_password, new_password):
+        """Change the session user's password, which ends all of their sessions"""
+        return await self.write(auth.change_password, self._user(token), old_password, new_password)
+
+    # Transactions
+
+    async def add_transaction(self, token, category_id, amount, description=None):
+        user_id = self._user(token)
+        db_file = self._db(user_id)
+        if self._write_queues is not None:
+            return await self._enqueue(self._write_queues[db_file].add_transaction, user_id, category_id,
+                                       amount, description)
+        return await self.write(transactions.add_transaction, user_id, category_id, amount, description,
+                                db_file=db_file)
+
+    async def update_transaction(self, transaction_id, token, category_id=None, amount=None,
+                                 description=None):
+        user_id = self._user(token)
+        db_file = self._db(user_id)
+        if self._write_queues is not None:
+            return await self._enqueue(self._write_queues[db_file].update_transaction, transaction_id,
+                                       user_id, category_id, amount, description)
+        return await self.write(transactions.update_transaction, transaction_id, user_id,
+                                category_id, amount, description, db_file=db_file)
+
+    async def delete_transaction(self, transaction_id, token):
+        user_id = self._user(token)
+        db_file = self._db(user_id)
+        if self._write_queues is not None:
+            return await self._enqueue(self._write_queues[db_file].delete_transaction, transaction_id,
+                                       user_id)
+        return await self.write(transactions.delete_transaction, transaction_id, user_id, db_file=db_file)
+
+    async def list_categories(self):
+        return await self.read(transactions.list_categories)
+
+    async def list_transactions(self, token, limit=10):
+        user_id = self._user(token)
+        return await self.read(transactions.list_transactions, user_id, limit, db_file=self._db(user_id))
+
+    async def transactions_page(self, token, limit=50, before=None, **filters):
+        user_id = self._user(token)
+        return await self.read(transactions.get_transactions_page, user_id, limit, before,
+                               db_file=self._db(user_id), **filters)
+
+    async def search_transactions(self, token, query, limit=20, **filters):
+        user_id = self._user(token)
+        return await self.read(transactions.search_transactions, user_id, query, limit,
+                               db_file=self._db(user_id), **filters)
+
+    # Reports and budgets
+
+    async def monthly_summary(self, token, month, year):
+        user_id = self._user(token)
+        return await self.read(reports.get_monthly_summary, user_id, month, year, db_file=self._db(user_id))
+
+    async def yearly_summary(self, token, year):
+        user_id = self._user(token)
+        return await self.read(reports.get_yearly_summary, user_id, year, db_file=self._db(user_id))
+
+    async def set_budget(self, token, category_id, amount, month, year):
+        user_id = self._user(token)
+        return await self.write(budget.set_budget, user_id, category_id, amount, month, year,
+                                db_file=self._db(user_id))
+
+    async def budget_status(self, token, month, year):
+        user_id = self._user(token)
+        return await self.read(budget.get_budget_status, user_id, month, year, db_file=self._db(user_id))
+
+    async def budget_statuses(self, user_ids, start_month, start_year, end_month=None, end_year=None):
+        """Budget status of many users at once, for batch reporting rather than a user's session"""
+        by_shard = {}
+        for user_id in user_ids:
+            by_shard.setdefault(self._db(user_id), []).append(user_id)
+        results = await asyncio.gather(*(
+            self.read(budget.get_budget_statuses, shard_users, start_month, start_year, end_month,
+                      end_year, db_file=db_file)
+            for db_file, shard_users in by_shard.items()))
+        if None in results:
+            return None
+        # Each shard's rows come sorted; merge them in the same order
+        statuses = [status for shard_statuses in results for status in shard_statuses]
+        statuses.sort(key=lambda status: (status.user_id, status.year, status.month, status.category_name))
+        return statuses
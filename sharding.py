@@ -0,0 +1,344 @@
+"""Optional sharding of the ledger across several database files.
+
+Usage:
+
+    python sharding.py create CATALOG --shards 4
+    python sharding.py rebalance CATALOG --shards 8 [--batch 100]
+    python sharding.py totals CATALOG YEAR [MONTH]
+
+A sharded deployment has one catalog database, holding users, categories
+and the list of shards, and N shard databases, each a full finance
+database that holds the transactions, budgets and rollups of its users.
+Every user_id maps to one shard through jump consistent hashing, so the
+mapping needs no lookup table and growing from N to M shards moves only
+about 1 - N/M of the users. The data functions run unchanged against a
+shard:
+
+    shards = ShardMap.load('catalog.db')
+    login_user('alice', 'secret', db_file=shards.catalog_file)
+    get_monthly_summary(user_id, 6, 2025, db_file=shards.shard_for(user_id))
+
+Each shard hands out transaction ids from its own range of 2**40, and a
+rebalance gives every shard a fresh range above all ids in use, so ids
+stay unique across shards and moved transactions keep theirs. Categories
+are added to the catalog and copied to every shard with the same id
+through add_category() here.
+
+Admin aggregates across all users run one query per shard in parallel
+threads and merge the results; see fan_out() and category_totals().
+
+rebalance moves users between shards in batches, each in one transaction
+per source shard, and records the new shard count only when every user
+has moved. Run it while the app is stopped. It is safe to run again after
+an interruption, which finishes the moves. It moves the ledger, budgets
+and recurring rules but not archived years (see archive.py), so it
+refuses to run once any shard has archived one.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import categories
+import report_cache
+from database import connection, initialize_database
+from models import CategoryAmount
+from money import Money
+
+ID_RANGE_BITS = 40
+DEFAULT_BATCH = 100
+# Threads shared by every fan-out; they live on, so their pooled
+# connections are reused rather than opened per call
+FAN_OUT_WORKERS = 16
+
+# Tables moved with a user; transactions keep their id, recurring rules
+# get a new one in the target shard
+MOVED_TABLES = {
+    'transactions': ('id', 'user_id', 'category_id', 'amount', 'description', 'date'),
+    'budgets': ('user_id', 'category_id', 'amount', 'month', 'year'),
+    'recurring_rules': ('user_id', 'category_id', 'amount', 'description', 'frequency', 'interval',
+                        'start_date', 'end_date', 'posted', 'next_due'),
+}
+
+
+def jump_hash(key, buckets):
+    """Map an integer key to one of `buckets` buckets (Lamping and Veach's jump consistent hash)"""
+    key &= 0xFFFFFFFFFFFFFFFF
+    bucket, jump = -1, 0
+    while jump < buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+class ShardMap:
+    """The catalog database and the shard files that user ids map to"""
+
+    def __init__(self, catalog_file, shard_files):
+        self.catalog_file = catalog_file
+        self.shard_files = list(shard_files)
+
+    @classmethod
+    def load(cls, catalog_file):
+        """Read the shard list recorded in catalog_file"""
+        with connection(catalog_file) as conn:
+            rows = conn.execute('SELECT file FROM shards ORDER BY idx').fetchall()
+        if not rows:
+            raise ValueError(f"{catalog_file} lists no shards")
+        base = os.path.dirname(catalog_file)
+        return cls(catalog_file, [os.path.join(base, row[0]) for row in rows])
+
+    def __len__(self):
+        return len(self.shard_files)
+
+    def __iter__(self):
+        return iter(self.shard_files)
+
+    def shard_index(self, user_id):
+        return jump_hash(int(user_id), len(self.shard_files))
+
+    def shard_for(self, user_id):
+        """Return the database file holding user_id's ledger"""
+        return self.shard_files[self.shard_index(user_id)]
+
+
+def _shard_name(catalog_file, index):
+    stem = os.path.splitext(os.path.basename(catalog_file))[0]
+    return f"{stem}-shard{index}.db"
+
+
+def _create_tables(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS shards (
+        idx INTEGER PRIMARY KEY,
+        file TEXT NOT NULL
+    )
+    ''')
+
+
+def _shard_path(catalog_file, index):
+    return os.path.join(os.path.dirname(catalog_file), _shard_name(catalog_file, index))
+
+
+def _open_shards(catalog_file, count):
+    """Initialize shards 0..count-1 next to the catalog; returns their paths"""
+    paths = []
+    for index in range(count):
+        path = _shard_path(catalog_file, index)
+        initialize_database(path)
+        _copy_categories(catalog_file, path)
+        paths.append(path)
+    return paths
+
+
+def _copy_categories(catalog_file, shard_file):
+    conn = sqlite3.connect(shard_file)
+    try:
+        conn.execute('ATTACH DATABASE ? AS catalog', (catalog_file,))
+        conn.execute('INSERT OR REPLACE INTO categories SELECT id, name, type FROM catalog.categories')
+        conn.commit()
+    finally:
+        conn.close()
+    categories.invalidate(shard_file)
+
+
+def _reserve_id_ranges(shard_files):
+    """Start each shard's transaction ids in its own range above every id in use"""
+    highest = 0
+    for path in shard_files:
+        with connection(path) as conn:
+            highest = max(highest, conn.execute('SELECT COALESCE(MAX(id), 0) FROM transactions').fetchone()[0])
+    base = (highest >> ID_RANGE_BITS) + 1
+    for index, path in enumerate(shard_files):
+        with connection(path) as conn:
+            conn.execute("DELETE FROM sqlite_sequence WHERE name = 'transactions'")
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('transactions', ?)",
+                         ((base + index) << ID_RANGE_BITS,))
+
+
+def _record_shards(catalog_file, shard_files):
+    base = os.path.dirname(catalog_file)
+    with connection(catalog_file) as conn:
+        conn.execute('DELETE FROM shards')
+        conn.executemany('INSERT INTO shards (idx, file) VALUES (?, ?)',
+                         [(index, os.path.relpath(path, base or '.'))
+                          for index, path in enumerate(shard_files)])
+
+
+def create_shards(catalog_file, count):
+    """Create a catalog and `count` empty shards next to it; returns the ShardMap"""
+    if count < 1:
+        raise ValueError("A sharded database needs at least one shard")
+    initialize_database(catalog_file)
+    with connection(catalog_file) as conn:
+        _create_tables(conn)
+        if conn.execute('SELECT COUNT(*) FROM shards').fetchone()[0]:
+            raise ValueError(f"{catalog_file} already has shards; use rebalance to change their number")
+    shard_files = _open_shards(catalog_file, count)
+    _reserve_id_ranges(shard_files)
+    _record_shards(catalog_file, shard_files)
+    return ShardMap(catalog_file, shard_files)
+
+
+def add_category(shards, name, category_type):
+    """Add a category to the catalog and every shard; returns its id, or None"""
+    category_id = categories.add_category(name, category_type, db_file=shards.catalog_file)
+    if category_id is not None:
+        for path in shards:
+            _copy_categories(shards.catalog_file, path)
+    return category_id
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def fan_out(shards, func, *args, **kwargs):
+    """Call func(*args, db_file=shard, **kwargs) for every shard in parallel.
+
+    Returns the results in shard order. SQLite releases the GIL while a
+    query runs, so threads are enough to scan the shards concurrently.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(FAN_OUT_WORKERS, thread_name_prefix='finance-shard')
+    futures = [_executor.submit(func, *args, db_file=path, **kwargs) for path in shards]
+    return [future.result() for future in futures]
+
+
+def _category_totals(year, month=None, db_file=None):
+    query = 'SELECT category_id, SUM(total) FROM monthly_rollups WHERE year = ?'
+    params = [year]
+    if month is not None:
+        query += ' AND month = ?'
+        params.append(month)
+    with connection(db_file) as conn:
+        return conn.execute(query + ' GROUP BY category_id', params).fetchall()
+
+
+def category_totals(shards, year, month=None):
+    """Total of every category across all users for a year or one month of it"""
+    totals = {}
+    for rows in fan_out(shards, _category_totals, year, month):
+        for category_id, cents in rows:
+            totals[category_id] = totals.get(category_id, 0) + cents
+    rows = [CategoryAmount(categories.category_name(category_id, shards.catalog_file), Money(cents))
+            for category_id, cents in totals.items()]
+    rows.sort(key=lambda row: row.category)
+    return rows
+
+
+def _move_users(source, target, user_ids):
+    """Move every row of user_ids from source to target in one transaction"""
+    conn = sqlite3.connect(source)
+    try:
+        conn.execute('ATTACH DATABASE ? AS target', (target,))
+        placeholders = ', '.join('?' * len(user_ids))
+        conn.execute('BEGIN')
+        for table, columns in MOVED_TABLES.items():
+            # Rows already copied by an interrupted run are replaced, through
+            # the delete triggers so the target's rollups stay right
+            if 'id' in columns:
+                conn.execute(f'''
+                DELETE FROM target.{table} WHERE id IN
+                    (SELECT id FROM main.{table} WHERE user_id IN ({placeholders}))
+                ''', user_ids)
+            else:
+                conn.execute(f'DELETE FROM target.{table} WHERE user_id IN ({placeholders})', user_ids)
+            column_list = ', '.join(columns)
+            conn.execute(f'''
+            INSERT INTO target.{table} ({column_list})
+            SELECT {column_list} FROM main.{table} WHERE user_id IN ({placeholders})
+            ''', user_ids)
+            conn.execute(f'DELETE FROM main.{table} WHERE user_id IN ({placeholders})', user_ids)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def rebalance(catalog_file, count, batch=DEFAULT_BATCH, progress=None):
+    """Redistribute users over `count` shards; returns the number of users moved.
+
+    New shards are created as needed. Shards beyond count are emptied and
+    dropped from the catalog, but their files are left in place.
+    progress, if given, is called with (source, target, users) after
+    each batch. Raises ValueError if any shard has archived a year, as
+    archive tables are not moved and a user's archived history would be
+    left behind.
+    """
+    if count < 1:
+        raise ValueError("A sharded database needs at least one shard")
+    current = ShardMap.load(catalog_file)
+    for path in dict.fromkeys(current.shard_files + [_shard_path(catalog_file, i) for i in range(count)]):
+        if not os.path.exists(path):
+            continue
+        with connection(path) as conn:
+            archived = [row[0] for row in conn.execute('SELECT year FROM archived_years ORDER BY year')]
+        if archived:
+            raise ValueError(f"{os.path.basename(path)} has archived {', '.join(map(str, archived))}; "
+                             "shards cannot be rebalanced once a year is archived")
+    target = ShardMap(catalog_file, _open_shards(catalog_file, count))
+    moved = 0
+    for source in dict.fromkeys(current.shard_files + target.shard_files):
+        with connection(source) as conn:
+            users = [row[0] for row in conn.execute(
+                ' UNION '.join(f'SELECT user_id FROM {table}' for table in MOVED_TABLES))]
+        destinations = {}
+        for user_id in users:
+            destination = target.shard_for(user_id)
+            if destination != source:
+                destinations.setdefault(destination, []).append(user_id)
+        for destination, user_ids in destinations.items():
+            for start in range(0, len(user_ids), batch):
+                chunk = user_ids[start:start + batch]
+                _move_users(source, destination, chunk)
+                moved += len(chunk)
+                if progress:
+                    progress(source, destination, len(chunk))
+
+    _reserve_id_ranges(target.shard_files)
+    _record_shards(catalog_file, target.shard_files)
+    # The moves bypassed the write functions
+    report_cache.clear()
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['create', 'rebalance', 'totals'])
+    parser.add_argument('catalog')
+    parser.add_argument('year', nargs='?', type=int, help="year to total, for totals")
+    parser.add_argument('month', nargs='?', type=int, help="month to total, for totals")
+    parser.add_argument('--shards', type=int, default=None)
+    parser.add_argument('--batch', type=int, default=DEFAULT_BATCH)
+    args = parser.parse_args()
+
+    if args.command == 'totals':
+        if args.year is None:
+            parser.error("totals needs a year")
+        for row in category_totals(ShardMap.load(args.catalog), args.year, args.month):
+            print(f"{row.category:20} {row.amount}")
+    elif args.shards is None:
+        parser.error(f"{args.command} needs --shards")
+    elif args.command == 'create':
+        try:
+            shards = create_shards(args.catalog, args.shards)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+        print(f"Created {len(shards)} shards for {args.catalog}.")
+    else:
+        try:
+            moved = rebalance(args.catalog, args.shards, args.batch)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+        print(f"Moved {moved} users; {args.catalog} now has {args.shards} shards.")
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
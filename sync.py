@@ -0,0 +1,289 @@
+"""Incremental sync between finance databases.
+
+Usage:
+
+    python sync.py init DB
+    python sync.py pull DB PEER [--batch 500]
+    python sync.py sync DB PEER [--batch 500]
+
+Every insert, update and delete of users, budgets and transactions is
+appended to the database's change_log (see database.create_change_tracking),
+so a database can hand a peer just the rows changed since the last seq of
+its log the peer has seen. Changes travel in batches of plain lists and
+numbers, ready for json.dumps:
+
+    batch = changes_since(seen, exclude=my_node, db_file=peer_file)
+    apply_changes(batch, db_file=my_file)
+
+Only a row's latest change is sent, with the row as it is now, and
+changes that started at the receiving database are left out.
+
+Conflicts resolve the same way on every database, whatever order changes
+arrive in. Each change carries its row's version, a Lamport clock stamp
+and the id of the node that made it, and the higher (stamp, node) wins:
+an older change to a row is ignored, and a delete beats an earlier update.
+When rows with different ids claim one username or one budget month, the
+row with the higher version keeps it; the other user is renamed to
+"name#id" and the other budget is dropped. The database that gives the
+key up logs that as a change of its own, which then reaches the others.
+
+Run init once on each database before its first sync, including a
+database that started as a copy of another. It gives the database a new
+node id and its own block of 2**40 row ids, so rows created on different
+databases never share an id. Rows that existed before init keep their
+ids and versions, so a copy that already has them ignores them when they
+arrive. Categories are not synced.
+"""
+import argparse
+import secrets
+import sys
+
+import report_cache
+from database import LOGGED_TABLES, connection, transaction_source
+
+DEFAULT_BATCH = 500
+ID_BLOCK_BITS = 40
+ID_BLOCKS = 1 << 22
+
+# Columns sent for each synced table, besides id
+SYNCED_COLUMNS = {
+    'users': ('username', 'password'),
+    'budgets': ('user_id', 'category_id', 'amount', 'month', 'year'),
+    'transactions': ('user_id', 'category_id', 'amount', 'description', 'date'),
+}
+
+# Unique keys other than id, which rows from different databases can clash on
+UNIQUE_KEYS = {
+    'users': ('username',),
+    'budgets': ('user_id', 'category_id', 'month', 'year'),
+}
+
+
+def _create_tables(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS sync_peers (
+        node TEXT PRIMARY KEY,
+        seq INTEGER NOT NULL
+    )
+    ''')
+
+
+def node_info(db_file=None):
+    """Return (node id, id block) of a database; the block is None before init"""
+    with connection(db_file) as conn:
+        return conn.execute('SELECT node, id_block FROM sync_node').fetchone()
+
+
+def init_node(db_file=None):
+    """Give a database a new node id and a free block of row ids; returns the node id"""
+    with connection(db_file) as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        _create_tables(conn)
+        while True:
+            block = secrets.randbelow(ID_BLOCKS - 1) + 1
+            low, high = block << ID_BLOCK_BITS, (block + 1) << ID_BLOCK_BITS
+            if not any(conn.execute(f'SELECT 1 FROM {table} WHERE id >= ? AND id < ?', (low, high)).fetchone()
+                       for table in LOGGED_TABLES):
+                break
+        node = secrets.token_hex(8)
+        conn.execute('UPDATE sync_node SET node = ?, id_block = ?', (node, block))
+        for table in LOGGED_TABLES:
+            conn.execute('DELETE FROM sqlite_sequence WHERE name = ?', (table,))
+            conn.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (table, low))
+    return node
+
+
+def changes_since(since, exclude=None, limit=DEFAULT_BATCH, db_file=None):
+    """Return a batch of the changes logged after seq `since`.
+
+    The batch is a dict: node, the database's node id; changes, a list of
+    [table, row id, deleted, stamp, origin, column values or None]; seq,
+    the seq to ask from next time; and more, True if the batch was full.
+    Changes that originated at node `exclude`, normally the caller, are
+    left out.
+    """
+    with connection(db_file) as conn:
+        # One read transaction, so the rows match the log entries
+        conn.execute('BEGIN')
+        try:
+            node = conn.execute('SELECT node FROM sync_node').fetchone()[0]
+            entries = conn.execute('''
+            SELECT c.seq, c.table_name, c.row_id, c.deleted, c.stamp, c.origin
+            FROM change_log c
+            WHERE c.seq > ? AND c.origin != ?
+              AND c.seq = (SELECT MAX(seq) FROM change_log later
+                           WHERE later.table_name = c.table_name AND later.row_id = c.row_id)
+            ORDER BY c.seq
+            LIMIT ?
+            ''', (since, exclude or '', limit)).fetchall()
+
+            rows = {}
+            for table, columns in SYNCED_COLUMNS.items():
+                ids = [entry[2] for entry in entries if entry[1] == table and not entry[3]]
+                if ids:
+                    # Transactions of archived years are in their own tables
+                    source = transaction_source(conn) if table == 'transactions' else table
+                    rows[table] = {row[0]: list(row[1:]) for row in conn.execute(f'''
+                    SELECT id, {', '.join(columns)} FROM {source} WHERE id IN ({', '.join('?' * len(ids))})
+                    ''', ids)}
+            more = len(entries) == limit
+            seq = entries[-1][0] if more else conn.execute(
+                "SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'change_log'), 0)").fetchone()[0]
+        finally:
+            conn.rollback()
+
+    changes = []
+    for _, table, row_id, deleted, stamp, origin in entries:
+        values = None if deleted else rows.get(table, {}).get(row_id)
+        changes.append([table, row_id, int(values is None), stamp, origin, values])
+    return {'node': node, 'seq': max(seq, since), 'more': more, 'changes': changes}
+
+
+def _version(cursor, table, row_id):
+    """Return the (stamp, origin) of a row's latest change, or None"""
+    return cursor.execute('''
+    SELECT stamp, origin FROM change_log WHERE table_name = ? AND row_id = ? ORDER BY seq DESC LIMIT 1
+    ''', (table, row_id)).fetchone()
+
+
+def _log(cursor, table, row_id, deleted, stamp=None, origin=None):
+    """Log a change, by default as one made here, as the triggers would"""
+    cursor.execute('''
+    INSERT INTO change_log (table_name, row_id, deleted, stamp, origin)
+    SELECT ?, ?, ?, COALESCE(?, (SELECT COALESCE(MAX(stamp), 0) + 1 FROM change_log)), COALESCE(?, node)
+    FROM sync_node
+    ''', (table, row_id, deleted, stamp, origin))
+
+
+def _apply(cursor, table, row_id, deleted, stamp, origin, values):
+    """Apply one change unless the row's version here is as new; returns True if applied"""
+    version = (stamp, origin)
+    current = _version(cursor, table, row_id)
+    if current is not None and tuple(current) >= version:
+        return False
+
+    columns = SYNCED_COLUMNS[table]
+    key = UNIQUE_KEYS.get(table)
+    if not deleted and key:
+        row = dict(zip(columns, values))
+        clash = cursor.execute(f'''
+        SELECT id FROM {table} WHERE {' AND '.join(f'{column} = ?' for column in key)} AND id != ?
+        ''', [row[column] for column in key] + [row_id]).fetchone()
+        if clash is not None:
+            clash_version = _version(cursor, table, clash[0])
+            if clash_version is None or tuple(clash_version) < version:
+                # The row here gives the key up to the incoming one
+                if table == 'users':
+                    cursor.execute("UPDATE users SET username = username || '#' || id WHERE id = ?", clash)
+                else:
+                    cursor.execute(f'DELETE FROM {table} WHERE id = ?', clash)
+                # A change made here, so it is sent back to the peer too
+                _log(cursor, table, clash[0], int(table != 'users'))
+            elif table == 'users':
+                values = [f"{row['username']}#{row_id}", *values[1:]]
+            else:
+                deleted = 1
+
+    if deleted:
+        cursor.execute(f'DELETE FROM {table} WHERE id = ?', (row_id,))
+    else:
+        cursor.execute(f'''
+        INSERT INTO {table} (id, {', '.join(columns)}) VALUES ({', '.join('?' * (len(columns) + 1))})
+        ON CONFLICT (id) DO UPDATE SET {', '.join(f'{column} = excluded.{column}' for column in columns)}
+        ''', [row_id, *values])
+    # Logged even for a row that was never here, so an older write to it
+    # that arrives later is still ignored
+    _log(cursor, table, row_id, deleted, stamp, origin)
+    return True
+
+
+def apply_changes(batch, db_file=None):
+    """Apply a batch from changes_since() in one transaction; returns the changes applied.
+
+    The batch's seq is recorded as seen from its node in the same
+    transaction, so an interrupted pull resumes after the last batch
+    applied.
+    """
+    applied = 0
+    with connection(db_file) as conn:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        _create_tables(conn)
+        cursor.execute('UPDATE sync_node SET applying = 1')
+        for change in batch['changes']:
+            applied += _apply(cursor, *change)
+        cursor.execute('UPDATE sync_node SET applying = 0')
+        cursor.execute('''
+        INSERT INTO sync_peers (node, seq) VALUES (?, ?)
+        ON CONFLICT (node) DO UPDATE SET seq = excluded.seq
+        ''', (batch['node'], batch['seq']))
+    if applied:
+        # The changes bypassed the write functions
+        report_cache.clear()
+    return applied
+
+
+def _last_seen(node, db_file=None):
+    with connection(db_file) as conn:
+        _create_tables(conn)
+        row = conn.execute('SELECT seq FROM sync_peers WHERE node = ?', (node,)).fetchone()
+    return row[0] if row else 0
+
+
+def pull(db_file, peer_file, batch=DEFAULT_BATCH, progress=None):
+    """Apply the changes peer_file has that db_file has not seen; returns the number applied.
+
+    progress, if given, is called with the changes received so far after
+    each batch.
+    """
+    node, block = node_info(db_file)
+    peer, peer_block = node_info(peer_file)
+    if block is None or peer_block is None:
+        raise ValueError("Both databases need a node id and id block; run init on each first")
+    if node == peer:
+        raise ValueError(f"{db_file} and {peer_file} are the same node; run init on the copy")
+
+    applied = received = 0
+    since = _last_seen(peer, db_file)
+    while True:
+        changes = changes_since(since, exclude=node, limit=batch, db_file=peer_file)
+        applied += apply_changes(changes, db_file)
+        received += len(changes['changes'])
+        since = changes['seq']
+        if progress:
+            progress(received)
+        if not changes['more']:
+            return applied
+
+
+def sync(db_file, peer_file, batch=DEFAULT_BATCH):
+    """Exchange changes both ways; returns (applied to db_file, applied to peer_file)"""
+    return pull(db_file, peer_file, batch), pull(peer_file, db_file, batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['init', 'pull', 'sync'])
+    parser.add_argument('db_file')
+    parser.add_argument('peer', nargs='?', help="database to sync with, for pull and sync")
+    parser.add_argument('--batch', type=int, default=DEFAULT_BATCH)
+    args = parser.parse_args()
+
+    if args.command == 'init':
+        print(f"{args.db_file} is now node {init_node(args.db_file)}.")
+        return
+    if not args.peer:
+        parser.error(f"{args.command} needs a peer database")
+    try:
+        if args.command == 'pull':
+            print(f"Applied {pull(args.db_file, args.peer, args.batch)} changes from {args.peer}.")
+        else:
+            pulled, pushed = sync(args.db_file, args.peer, args.batch)
+            print(f"Applied {pulled} changes to {args.db_file} and {pushed} to {args.peer}.")
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -1,9 +1,83 @@
 import unittest
 import sqlite3
 import os
-from auth import hash_password, register_user, login_user
-from transactions import add_transaction, list_transactions
-from database import create_connection
+import re
+import contextlib
+import io
+import tempfile
+import gzip
+import csv
+import json
+import asyncio
+import time
+import threading
+import subprocess
+import sys
+from datetime import datetime
+from decimal import Decimal
+from unittest import mock
+from auth import (hash_password, register_user, login_user, change_password, verify_password,
+                  needs_rehash, start_session, authenticate, SessionCache)
+import hashlib
+from money import Money
+from service import FinanceService
+from transactions import (add_transaction, bulk_add_transactions, update_transaction,
+                          delete_transaction, list_transactions, get_transactions_page,
+                          iter_transactions, list_categories, search_transactions)
+from import_transactions import read_csv, read_ofx
+from reports import get_monthly_summary, get_yearly_summary
+from budget import set_budget, get_budget_status, get_budget_statuses
+from presentation import print_budget_status, print_monthly_summary
+from database import (create_connection, close_connections, get_connection, initialize_database,
+                      rebuild_rollups, convert_amounts_to_cents, migrate, SCHEMA_VERSION)
+from rollups import verify_rollups
+from write_queue import WriteQueue
+import backup
+import profiling
+import categories
+import report_cache
+import sharding
+from batch_reports import run_batch
+import recurring
+import sync
+import archive
+import auth
+import database
+
+try:
+    import analytics
+    import numpy
+except ImportError:
+    analytics = numpy = None
+
+# Modules that fall back to the default database file
+DEFAULT_DB_MODULES = (database, categories, report_cache, backup)
+STRAY_DB = "test_stray_default.db"
+
+
+def setUpModule():
+    # Tests must never touch the real finance.db. A call that loses its
+    # db_file opens this file instead, and tearDownModule fails the run
+    for module in DEFAULT_DB_MODULES:
+        module.DEFAULT_DB_FILE = STRAY_DB
+
+
+def tearDownModule():
+    close_connections()
+    stray = os.path.exists(STRAY_DB)
+    for path in (STRAY_DB, STRAY_DB + "-wal", STRAY_DB + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+    for module in DEFAULT_DB_MODULES:
+        module.DEFAULT_DB_FILE = "finance.db"
+    if stray:
+        raise AssertionError("A test wrote to the default database instead of its own")
+
+
+def quietly(func, *args, **kwargs):
+    """Call func, discarding what it prints"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
 
 
 class TestFinanceApp(unittest.TestCase):
@@ -58,8 +132,10 @@ class TestFinanceApp(unittest.TestCase):
     @classmethod
     def tearDownClass(cls):
         # Remove test database
-        if os.path.exists(cls.test_db):
-            os.remove(cls.test_db)
+        close_connections()
+        for path in (cls.test_db, cls.test_db + "-wal", cls.test_db + "-shm"):
+            if os.path.exists(path):
+                os.remove(path)
 
     def test_user_registration(self):
         # Test successful registration
@@ -94,5 +170,1459 @@ class TestFinanceApp(unittest.TestCase):
         self.assertEqual(transactions[0][2], 100.0)  # Check amount
 
 
+class DatabaseTestCase(unittest.TestCase):
+    """Runs against a database built by initialize_database"""
+    test_db = "test_full_schema.db"
+
+    @classmethod
+    def setUpClass(cls):
+        initialize_database(cls.test_db)
+
+    @classmethod
+    def tearDownClass(cls):
+        close_connections()
+        for path in (cls.test_db, cls.test_db + "-wal", cls.test_db + "-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    @classmethod
+    def insert_transactions(cls, rows):
+        """Insert (user_id, category_id, amount, description, date) rows directly"""
+        conn = sqlite3.connect(cls.test_db)
+        conn.executemany('''
+        INSERT INTO transactions (user_id, category_id, amount, description, date)
+        VALUES (?, ?, ?, ?, ?)
+        ''', [(user_id, category_id, Money.of(amount), description, date)
+              for user_id, category_id, amount, description, date in rows])
+        conn.commit()
+        conn.close()
+
+
+class TestConnections(DatabaseTestCase):
+    test_db = "test_connections.db"
+
+    def test_nested_writes_share_the_outer_transaction(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            with self.assertRaises(RuntimeError):
+                with database.connection(self.test_db):
+                    self.assertTrue(add_transaction(5, 4, 10, "Nested", db_file=self.test_db))
+                    self.assertTrue(set_budget(5, 4, 50, 6, 2025, db_file=self.test_db))
+                    raise RuntimeError("abort")
+            with database.connection(self.test_db):
+                add_transaction(5, 4, 10, "Committed", db_file=self.test_db)
+        with sqlite3.connect(self.test_db) as conn:
+            self.assertEqual(conn.execute('SELECT description FROM transactions WHERE user_id=5').fetchall(),
+                             [("Committed",)])
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM budgets WHERE user_id=5').fetchone()[0], 0)
+
+    def test_nested_writes_invalidate_reports_after_the_outer_commit(self):
+        now = datetime.now()
+        summary = lambda: get_monthly_summary(6, now.month, now.year, db_file=self.test_db)
+        report_cache.configure()
+        with contextlib.redirect_stdout(io.StringIO()):
+            add_transaction(6, 4, 10, "Lunch", db_file=self.test_db)
+            self.assertEqual(summary().total_expenses, Money.of(10))
+            with database.connection(self.test_db):
+                add_transaction(6, 4, 5, "Coffee", db_file=self.test_db)
+                # A reader between the nested write and the outer commit
+                # caches the committed total
+                seen = []
+                reader = threading.Thread(target=lambda: seen.append(summary()))
+                reader.start()
+                reader.join()
+                self.assertEqual(seen[0].total_expenses, Money.of(10))
+        self.assertEqual(summary().total_expenses, Money.of(15))
+        report_cache.configure()
+
+    def test_reopen_waits_for_the_open_block(self):
+        with database.connection(self.test_db) as conn:
+            database.configure(cache_size=-8000)
+            conn.execute('SELECT COUNT(*) FROM transactions').fetchone()
+            self.assertIs(get_connection(self.test_db), conn)
+        reopened = get_connection(self.test_db)
+        self.assertIsNot(reopened, conn)
+        self.assertEqual(reopened.execute('PRAGMA cache_size').fetchone()[0], -8000)
+        database.configure(cache_size=-16000)
+
+
+class TestQueryPlans(DatabaseTestCase):
+    """Report and budget queries must search an index, never scan a ledger table"""
+    test_db = "test_query_plans.db"
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with contextlib.redirect_stdout(io.StringIO()):
+            register_user("planuser", "planpass", db_file=cls.test_db)
+            add_transaction(1, 4, 25.0, "Lunch", db_file=cls.test_db)
+            set_budget(1, 4, 100.0, 6, 2025, db_file=cls.test_db)
+
+    def capture_statements(self, report, *args):
+        conn = get_connection(self.test_db)
+        statements = []
+        conn.set_trace_callback(statements.append)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                report(*args, db_file=self.test_db)
+        finally:
+            conn.set_trace_callback(None)
+        return [s for s in statements if s.lstrip().upper().startswith("SELECT")
+                and ("transactions" in s or "monthly_rollups" in s)]
+
+    def assert_uses_index(self, report, *args):
+        statements = self.capture_statements(report, *args)
+        self.assertTrue(statements)
+        conn = get_connection(self.test_db)
+        for statement in statements:
+            plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + statement)]
+            transaction_steps = [step for step in plan if " t " in f" {step} " or "transactions" in step]
+            rollup_steps = [step for step in plan if " r " in f" {step} " or "monthly_rollups" in step]
+            self.assertTrue(transaction_steps or rollup_steps, plan)
+            for step in transaction_steps:
+                # The date bounds must be part of the index search, not a filter
+                self.assertTrue(step.startswith("SEARCH") and "INDEX" in step, (statement, plan))
+                self.assertIn("date>? AND date<?", step)
+            for step in rollup_steps:
+                self.assertTrue(step.startswith("SEARCH") and "PRIMARY KEY" in step, (statement, plan))
+                self.assertIn("user_id=? AND year=?", step)
+
+    def test_monthly_summary_uses_index(self):
+        self.assert_uses_index(get_monthly_summary, 1, 6, 2025)
+
+    def test_yearly_summary_uses_index(self):
+        self.assert_uses_index(get_yearly_summary, 1, 2025)
+
+    def test_budget_status_uses_index(self):
+        self.assert_uses_index(get_budget_status, 1, 6, 2025)
+
+
+class TestBudgetStatus(DatabaseTestCase):
+    test_db = "test_budget_status.db"
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for user_id in (1, 2):
+                set_budget(user_id, 4, 100.0, 5, 2025, db_file=cls.test_db)
+                set_budget(user_id, 4, 100.0, 6, 2025, db_file=cls.test_db)
+                set_budget(user_id, 5, 500.0, 6, 2025, db_file=cls.test_db)
+        cls.insert_transactions([
+            (1, 4, 30.0, "Lunch", "2025-05-31 23:59:59"),
+            (1, 4, 70.0, "Dinner", "2025-06-01 00:00:00"),
+            (1, 4, 50.0, "Groceries", "2025-06-30 12:00:00"),
+            (1, 5, 450.0, "Rent", "2025-06-02 09:00:00"),
+            (1, 4, 99.0, "Next month", "2025-07-01 00:00:00"),
+            (2, 4, 10.0, "Snack", "2025-06-15 15:00:00"),
+        ])
+
+    def test_single_month(self):
+        status = get_budget_status(1, 6, 2025, db_file=self.test_db)
+        by_category = {row.category_name: row for row in status}
+        self.assertEqual(by_category['Food'].spent, 120.0)
+        self.assertEqual(by_category['Food'].remaining, -20.0)
+        self.assertAlmostEqual(by_category['Food'].percentage, 120.0)
+        self.assertEqual(by_category['Rent'].spent, 450.0)
+
+    def test_data_layer_is_silent(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            status = get_budget_status(1, 6, 2025, db_file=self.test_db)
+            summary = get_monthly_summary(1, 6, 2025, db_file=self.test_db)
+        self.assertEqual(output.getvalue(), "")
+
+        with contextlib.redirect_stdout(output):
+            print_budget_status(status, 6, 2025)
+            print_monthly_summary(summary)
+        rendered = output.getvalue()
+        self.assertIn("Budget exceeded", rendered)
+        self.assertIn("Total Expenses: $570.00", rendered)
+
+    def test_unspent_budget_reports_zero(self):
+        statuses = get_budget_statuses([2], 6, 2025, db_file=self.test_db)
+        rent = [row for row in statuses if row.category_name == 'Rent'][0]
+        self.assertEqual(rent.spent, 0)
+        self.assertEqual(rent.remaining, 500.0)
+
+    def test_batch_over_users_and_months(self):
+        statuses = get_budget_statuses([1, 2], 5, 2025, 6, 2025, db_file=self.test_db)
+        spent = {(row.user_id, row.month, row.category_id): row.spent for row in statuses}
+        self.assertEqual(len(statuses), 6)
+        self.assertEqual(spent[(1, 5, 4)], 30.0)
+        self.assertEqual(spent[(1, 6, 4)], 120.0)
+        self.assertEqual(spent[(2, 5, 4)], 0)
+        self.assertEqual(spent[(2, 6, 4)], 10.0)
+
+
+class TestBulkImport(DatabaseTestCase):
+    test_db = "test_bulk_import.db"
+
+    def fetch_imported(self, user_id):
+        conn = get_connection(self.test_db)
+        return conn.execute('''
+        SELECT c.name, t.amount / 100.0, t.description, t.date
+        FROM transactions t JOIN categories c ON t.category_id = c.id
+        WHERE t.user_id=? ORDER BY t.id
+        ''', (user_id,)).fetchall()
+
+    def test_streams_rows_in_chunks(self):
+        rows = ((4 if i % 2 else "food", float(i), f"row {i}", f"2025-01-{i + 1:02d} 10:00:00")
+                for i in range(7))
+        inserted = bulk_add_transactions(10, rows, chunk_size=3, db_file=self.test_db)
+        self.assertEqual(inserted, 7)
+        imported = self.fetch_imported(10)
+        self.assertEqual(len(imported), 7)
+        self.assertEqual({row[0] for row in imported}, {"Food"})
+        self.assertEqual(imported[6], ("Food", 6.0, "row 6", "2025-01-07 10:00:00"))
+
+    def test_unknown_categories_are_skipped(self):
+        rows = [("Rent", 900.0, None, None), ("Nonexistent", 1.0, None, None)]
+        with contextlib.redirect_stdout(io.StringIO()):
+            inserted = bulk_add_transactions(11, rows, db_file=self.test_db)
+        self.assertEqual(inserted, 1)
+        self.assertEqual(self.fetch_imported(11)[0][:2], ("Rent", 900.0))
+
+    def test_reads_csv_and_ofx_exports(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = os.path.join(tmp, "export.csv")
+            with open(csv_path, "w") as f:
+                f.write("Date,Amount,Description,Category\n"
+                        "2025-03-01,-12.50,Coffee,Food\n"
+                        "02/03/2025,\"2,000.00\",Payroll,\n")
+            ofx_path = os.path.join(tmp, "export.ofx")
+            with open(ofx_path, "w") as f:
+                f.write("OFXHEADER:100\n<OFX><BANKTRANLIST>\n"
+                        "<STMTTRN>\n<TRNTYPE>DEBIT\n<DTPOSTED>20250304120000.000[-5:EST]\n"
+                        "<TRNAMT>-45.00\n<NAME>Power Co\n</STMTTRN>\n"
+                        "<STMTTRN><DTPOSTED>20250305<TRNAMT>10.00<MEMO>Refund</STMTTRN>\n"
+                        "</BANKTRANLIST></OFX>\n")
+
+            self.assertEqual(list(read_csv(csv_path)), [
+                ("Food", 12.5, "Coffee", "2025-03-01 00:00:00"),
+                ("Salary", 2000.0, "Payroll", "2025-03-02 00:00:00"),
+            ])
+            self.assertEqual(list(read_ofx(ofx_path, expense_category="Utilities")), [
+                ("Utilities", 45.0, "Power Co", "2025-03-04 12:00:00"),
+                ("Salary", 10.0, "Refund", "2025-03-05 00:00:00"),
+            ])
+
+
+class TestRollups(DatabaseTestCase):
+    test_db = "test_rollups.db"
+
+    def rollup(self, user_id, year, month):
+        conn = get_connection(self.test_db)
+        return {row[0]: row[1:] for row in conn.execute(
+            'SELECT category_id, total, count FROM monthly_rollups WHERE user_id=? AND year=? AND month=?',
+            (user_id, year, month))}
+
+    def test_rollups_follow_every_write_path(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            bulk_add_transactions(20, [("Food", 10.0, "a", "2025-04-01 08:00:00"),
+                                       ("Food", 5.0, "b", "2025-04-20 08:00:00"),
+                                       ("Rent", 700.0, "c", "2025-05-01 08:00:00")],
+                                  db_file=self.test_db)
+            self.assertEqual(self.rollup(20, 2025, 4), {4: (1500, 2)})
+
+            conn = get_connection(self.test_db)
+            first, second, rent = [row[0] for row in conn.execute(
+                'SELECT id FROM transactions WHERE user_id=20 ORDER BY id')]
+            update_transaction(first, 20, category_id=6, amount=12.0, db_file=self.test_db)
+            self.assertEqual(self.rollup(20, 2025, 4), {4: (500, 1), 6: (1200, 1)})
+
+            delete_transaction(second, 20, db_file=self.test_db)
+            self.assertEqual(self.rollup(20, 2025, 4), {6: (1200, 1)})
+
+            summary = get_monthly_summary(20, 5, 2025, db_file=self.test_db)
+            self.assertEqual(summary.expenses_by_category, [("Rent", 700.0)])
+            yearly = get_yearly_summary(20, 2025, db_file=self.test_db)
+            self.assertEqual(yearly.monthly_breakdown, [(4, 0, 12.0), (5, 0, 700.0)])
+
+        self.assertEqual(verify_rollups(self.test_db), [])
+
+    def test_verify_reports_drift(self):
+        self.insert_transactions([(21, 4, 8.0, "x", "2025-02-02 00:00:00")])
+        with sqlite3.connect(self.test_db) as conn:
+            conn.execute('UPDATE monthly_rollups SET total = 1 WHERE user_id = 21')
+        self.assertEqual(verify_rollups(self.test_db), [(21, 4, 2025, 2, (800, 1), (1, 1))])
+        with contextlib.redirect_stdout(io.StringIO()):
+            rebuild_rollups(get_connection(self.test_db))
+        self.assertEqual(verify_rollups(self.test_db), [])
+
+
+class TestPasswordHashing(DatabaseTestCase):
+    test_db = "test_auth.db"
+
+    def insert_user(self, username, password):
+        with sqlite3.connect(self.test_db) as conn:
+            conn.execute('INSERT INTO users (username, password) VALUES (?, ?)', (username, password))
+
+    def stored_hash(self, username):
+        return get_connection(self.test_db).execute(
+            'SELECT password FROM users WHERE username=?', (username,)).fetchone()[0]
+
+    def test_hashes_are_salted(self):
+        first, second = hash_password("secret"), hash_password("secret")
+        self.assertNotEqual(first, second)
+        self.assertTrue(first.startswith("pbkdf2_sha256$"))
+        self.assertTrue(verify_password("secret", first))
+        self.assertFalse(verify_password("wrong", first))
+        self.assertFalse(needs_rehash(first))
+        self.assertTrue(needs_rehash(hash_password("secret", iterations=1000)))
+
+    def test_legacy_hash_is_upgraded_on_login(self):
+        legacy = hashlib.sha256(b"oldpass").hexdigest()
+        self.insert_user("legacy", legacy)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertIsNone(login_user("legacy", "wrong", db_file=self.test_db))
+            self.assertEqual(self.stored_hash("legacy"), legacy)
+            self.assertIsNotNone(login_user("legacy", "oldpass", db_file=self.test_db))
+        upgraded = self.stored_hash("legacy")
+        self.assertFalse(needs_rehash(upgraded))
+        self.assertTrue(verify_password("oldpass", upgraded))
+
+    def test_sessions_skip_the_kdf_and_are_revoked(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            register_user("sessionuser", "pw1", db_file=self.test_db)
+            token = start_session("sessionuser", "pw1", db_file=self.test_db)
+            user_id = authenticate(token)
+            self.assertIsNotNone(user_id)
+            self.assertIsNone(start_session("sessionuser", "nope", db_file=self.test_db))
+            change_password(user_id, "pw1", "pw2", db_file=self.test_db)
+        self.assertIsNone(authenticate(token))
+
+    def test_session_ttl_eviction(self):
+        now = [0.0]
+        cache = SessionCache(ttl=10, max_size=2, clock=lambda: now[0])
+        first = cache.create(1)
+        self.assertEqual(cache.get(first), 1)
+        now[0] = 11
+        self.assertIsNone(cache.get(first))
+        second, third, fourth = cache.create(2), cache.create(3), cache.create(4)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(second))
+        self.assertEqual(cache.get(fourth), 4)
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+
+class TestTransactionPaging(DatabaseTestCase):
+    test_db = "test_paging.db"
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Three transactions share each date, so pages must break ties on id
+        cls.insert_transactions([
+            (30, 4 if i % 2 else 5, float(i), f"row {i}", f"2025-01-{i // 3 + 1:02d} 12:00:00")
+            for i in range(30)
+        ])
+        conn = get_connection(cls.test_db)
+        cls.all_rows = conn.execute(
+            'SELECT id, amount / 100.0, category_id, date FROM transactions WHERE user_id=30 '
+            'ORDER BY date DESC, id DESC').fetchall()
+
+    def test_pages_cover_history_once_in_order(self):
+        rows = list(iter_transactions(30, page_size=4, db_file=self.test_db))
+        self.assertEqual([row.id for row in rows], [row[0] for row in self.all_rows])
+        self.assertEqual([row.id for row in list_transactions(30, 5, db_file=self.test_db)],
+                         [row[0] for row in self.all_rows[:5]])
+
+    def test_cursor_seeks_past_previous_page(self):
+        first = get_transactions_page(30, 4, db_file=self.test_db)
+        second = get_transactions_page(30, 4, before=(first[-1].date, first[-1].id), db_file=self.test_db)
+        self.assertEqual([row.id for row in first + second], [row[0] for row in self.all_rows[:8]])
+
+    def test_filters(self):
+        rows = list(iter_transactions(30, page_size=3, db_file=self.test_db, category_id=4,
+                                      min_amount=5, max_amount=20,
+                                      start_date="2025-01-03", end_date="2025-01-07"))
+        expected = [row[0] for row in self.all_rows
+                    if row[2] == 4 and 5 <= row[1] <= 20 and "2025-01-03" <= row[3] < "2025-01-07"]
+        self.assertEqual([row.id for row in rows], expected)
+        self.assertTrue(expected)
+
+    def test_paging_seeks_an_index(self):
+        conn = get_connection(self.test_db)
+        statements = []
+        conn.set_trace_callback(statements.append)
+        try:
+            get_transactions_page(30, 4, before=("2025-01-05 12:00:00", 14), db_file=self.test_db)
+            get_transactions_page(30, 4, category_id=4, db_file=self.test_db)
+        finally:
+            conn.set_trace_callback(None)
+        before, by_category = [s for s in statements if "FROM transactions" in s]
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + before)]
+        self.assertIn("SEARCH transactions USING INDEX idx_transactions_user_date_id (user_id=? AND date<?)", plan)
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + by_category)]
+        self.assertIn("SEARCH transactions USING INDEX idx_transactions_user_category_date "
+                      "(user_id=? AND category_id=?)", plan)
+        # Reports read monthly_rollups, so paging's are the ledger's only indexes
+        indexes = {row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='transactions' AND sql IS NOT NULL")}
+        self.assertEqual(indexes, {"idx_transactions_user_date_id", "idx_transactions_user_category_date"})
+
+
+class TestTransactionSearch(DatabaseTestCase):
+    test_db = "test_search.db"
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.insert_transactions([
+            (40, 4, 12, "Groceries at Market", "2025-03-01 10:00:00"),
+            (40, 4, 30, "Market groceries and groceries again", "2025-03-05 10:00:00"),
+            (40, 7, 15, "Cinéma tickets", "2025-03-07 10:00:00"),
+            (40, 4, 8, "Coffee", "2025-04-01 10:00:00"),
+            (40, 8, 3, "Coffee", "2025-02-01 10:00:00"),
+            (41, 4, 20, "Groceries", "2025-03-02 10:00:00"),
+            (40, 4, 5, "Straße Café", "2025-01-15 10:00:00"),
+        ])
+
+    def search(self, query, **filters):
+        return [row.description for row in search_transactions(40, query, db_file=self.test_db, **filters)]
+
+    def test_ranking_prefixes_and_user_isolation(self):
+        self.assertEqual(self.search("grocer"),
+                         ["Market groceries and groceries again", "Groceries at Market"])
+        # With one occurrence each, the shorter description ranks first
+        self.assertEqual(self.search("mark"),
+                         ["Groceries at Market", "Market groceries and groceries again"])
+        # and equal scores fall back to newest first
+        self.assertEqual([row.date for row in search_transactions(40, "coffee", db_file=self.test_db)],
+                         ["2025-04-01 10:00:00", "2025-02-01 10:00:00"])
+        self.assertCountEqual(self.search("gro mark"),
+                              ["Market groceries and groceries again", "Groceries at Market"])
+        self.assertEqual(self.search("grocer", prefix=False), [])
+        self.assertEqual(self.search("CINEMA"), ["Cinéma tickets"])
+        # Folding is the tokenizer's, which keeps ß, so the query matches as stored
+        self.assertEqual(self.search("straße cafe", prefix=False), ["Straße Café"])
+        self.assertEqual(self.search("STRASSE"), [])
+        self.assertEqual([row.description for row in search_transactions(40, "gro", limit=1,
+                                                                         db_file=self.test_db)],
+                         ["Market groceries and groceries again"])
+        # Operators and quotes typed by the user are only text
+        self.assertEqual(self.search('coffee OR "market'), [])
+        self.assertEqual(self.search("  ?! "), [])
+
+    def test_filters(self):
+        self.assertEqual(self.search("market", start_date="2025-03-02"),
+                         ["Market groceries and groceries again"])
+        self.assertEqual(self.search("c", category_id=8), ["Coffee"])
+        self.assertEqual(self.search("c", start_date="2025-03-01", end_date="2025-04-01"), ["Cinéma tickets"])
+
+    def test_index_follows_writes(self):
+        add_transaction(40, 5, 900, "Rent for April", db_file=self.test_db)
+        rent = search_transactions(40, "rent", db_file=self.test_db)[0]
+        update_transaction(rent.id, 40, description="Flat rent", db_file=self.test_db)
+        self.assertEqual(self.search("flat"), ["Flat rent"])
+        self.assertEqual(self.search("april"), [])
+        delete_transaction(rent.id, 40, db_file=self.test_db)
+        self.assertEqual(self.search("rent"), [])
+        bulk_add_transactions(40, [("Rent", 50, "Garage rent", "2025-05-01 10:00:00")], db_file=self.test_db)
+        self.assertEqual(self.search("garage"), ["Garage rent"])
+        conn = get_connection(self.test_db)
+        conn.execute("INSERT INTO transactions_fts (transactions_fts, rank) VALUES ('integrity-check', 1)")
+
+    def test_search_starts_from_the_index(self):
+        conn = get_connection(self.test_db)
+        statements = []
+        conn.set_trace_callback(statements.append)
+        try:
+            search_transactions(40, "market", category_id=4, db_file=self.test_db)
+        finally:
+            conn.set_trace_callback(None)
+        # FTS5 traces its own internal statements too
+        query = next(statement for statement in statements if "MATCH" in statement)
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + query)]
+        self.assertTrue(plan[0].startswith("SCAN transactions_fts VIRTUAL TABLE"), plan)
+
+
+class TestMoney(unittest.TestCase):
+    def test_conversion_and_arithmetic_are_exact(self):
+        self.assertEqual(Money.of("0.1") + Money.of(0.2), Money.of("0.3"))
+        self.assertEqual(Money.of(12.345).cents, 1235)
+        self.assertEqual(Money.of(100).cents, 10000)
+        self.assertEqual(Money(1250), 12.5)
+        self.assertEqual(f"${Money(-705):.2f}", "$-7.05")
+        self.assertEqual(str(Money(5)), "0.05")
+        self.assertEqual(sum([Money(1), Money(2)]), Money(3))
+        self.assertLess(Money(-1), 0)
+        self.assertEqual(Money.of(19.99), 19.99)
+        self.assertLessEqual(Money.of(19.99), 19.99)
+        self.assertFalse(Money.of(0.1) < 0.1)
+        self.assertGreater(Money.of(0.1), 0.09)
+        self.assertNotEqual(Money.of(19.99), 19.991)
+        self.assertEqual(hash(Money.of(19.99)), hash(19.99))
+        self.assertEqual(len({Money.of(19.99), 19.99, Money(1999)}), 1)
+        self.assertEqual({Money(1250): "a"}[Decimal("12.5")], "a")
+        self.assertEqual(hash(Money(500)), hash(5))
+        with self.assertRaises(ValueError):
+            Money.of("ten")
+
+
+class TestAmountMigration(unittest.TestCase):
+    test_db = "test_amount_migration.db"
+
+    def setUp(self):
+        # The schema as it was before amounts moved to cents
+        conn = sqlite3.connect(self.test_db)
+        conn.executescript('''
+        CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL,
+                            password TEXT NOT NULL);
+        CREATE TABLE categories (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE NOT NULL,
+                                 type TEXT NOT NULL);
+        CREATE TABLE transactions (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL,
+                                   category_id INTEGER NOT NULL, amount REAL NOT NULL,
+                                   description TEXT, date TEXT NOT NULL);
+        CREATE TABLE budgets (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL,
+                              category_id INTEGER NOT NULL, amount REAL NOT NULL,
+                              month INTEGER NOT NULL, year INTEGER NOT NULL,
+                              UNIQUE(user_id, category_id, month, year));
+        INSERT INTO categories (name, type) VALUES ('Salary', 'income'), ('Bonus', 'income'),
+            ('Investment', 'income'), ('Food', 'expense');
+        INSERT INTO budgets (user_id, category_id, amount, month, year) VALUES (1, 4, 0.3, 3, 2025);
+        ''')
+        conn.executemany('''
+        INSERT INTO transactions (user_id, category_id, amount, description, date)
+        VALUES (1, 4, ?, 'coffee', '2025-03-10 09:00:00')
+        ''', [(0.1,)] * 5 + [(19.99,)])
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        close_connections()
+        for path in (self.test_db, self.test_db + "-wal", self.test_db + "-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_chunked_conversion_resumes_and_keeps_ids(self):
+        conn = get_connection(self.test_db)
+        chunks = []
+        # Simulate an interrupted run that already copied the first row
+        conn.execute("CREATE TABLE transactions_cents (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                     "user_id INTEGER NOT NULL, category_id INTEGER NOT NULL, amount INTEGER NOT NULL, "
+                     "description TEXT, date TEXT NOT NULL)")
+        conn.execute("INSERT INTO transactions_cents SELECT id, user_id, category_id, 10, description, date "
+                     "FROM transactions WHERE id = 1")
+        conn.commit()
+
+        self.assertTrue(convert_amounts_to_cents(conn, chunk_size=2, progress=chunks.append))
+        self.assertEqual(chunks, [2, 2, 1])
+        self.assertFalse(convert_amounts_to_cents(conn))
+        rows = conn.execute("SELECT id, amount, typeof(amount) FROM transactions ORDER BY id").fetchall()
+        self.assertEqual(rows, [(1, 10, "integer"), (2, 10, "integer"), (3, 10, "integer"),
+                                (4, 10, "integer"), (5, 10, "integer"), (6, 1999, "integer")])
+        self.assertEqual(conn.execute("SELECT amount FROM budgets").fetchone()[0], 30)
+
+    def test_initialize_migrates_and_reports_exact_sums(self):
+        initialize_database(self.test_db)
+        summary = get_monthly_summary(1, 3, 2025, db_file=self.test_db)
+        self.assertEqual(summary.total_expenses, Money.of("20.49"))
+        status = get_budget_status(1, 3, 2025, db_file=self.test_db)
+        self.assertEqual(status[0].spent, Money(2049))
+        self.assertEqual(verify_rollups(self.test_db), [])
+        self.assertEqual(get_connection(self.test_db).execute('PRAGMA user_version').fetchone()[0],
+                         SCHEMA_VERSION)
+
+    def test_tools_migrate_before_they_run(self):
+        with tempfile.TemporaryDirectory() as backup_dir:
+            entry = backup.backup_database(self.test_db, backup_dir)
+        self.assertEqual((entry['transactions'], entry['total']), (6, 2049))
+        self.assertEqual(archive.compact_year(2025, db_file=self.test_db), 6)
+        self.assertEqual(archive.archive_status(self.test_db), [(2025, 1, 6)])
+        self.assertEqual(verify_rollups(self.test_db), [])
+        self.assertEqual(get_monthly_summary(1, 3, 2025, db_file=self.test_db).total_expenses,
+                         Money.of("20.49"))
+
+
+class TestSchemaVersion(DatabaseTestCase):
+    test_db = "test_schema_version.db"
+
+    def test_current_schema_runs_no_ddl(self):
+        with contextlib.closing(sqlite3.connect(self.test_db)) as conn:
+            statements = []
+            conn.set_trace_callback(statements.append)
+            self.assertEqual(migrate(conn), 0)
+        self.assertEqual(statements, ["PRAGMA user_version"])
+
+    def test_only_pending_migrations_run(self):
+        with contextlib.closing(sqlite3.connect(self.test_db)) as conn:
+            conn.execute('DROP TABLE recurring_rules')
+            conn.execute('CREATE INDEX idx_transactions_user_date_cover '
+                         'ON transactions (user_id, date, category_id, amount)')
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION - 2}')
+            conn.commit()
+            self.assertEqual(migrate(conn), 2)
+            self.assertEqual(conn.execute('PRAGMA user_version').fetchone()[0], SCHEMA_VERSION)
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM recurring_rules').fetchone()[0], 0)
+            self.assertIsNone(conn.execute("SELECT 1 FROM sqlite_master "
+                                           "WHERE name = 'idx_transactions_user_date_cover'").fetchone())
+
+    def test_newer_schema_is_refused(self):
+        with contextlib.closing(sqlite3.connect(self.test_db)) as conn:
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION + 1}')
+            try:
+                with self.assertRaises(sqlite3.DatabaseError):
+                    migrate(conn)
+            finally:
+                conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+
+def slow_call(seconds, db_file=None):
+    time.sleep(seconds)
+    return seconds
+
+
+class TestFinanceService(DatabaseTestCase):
+    test_db = "test_service.db"
+
+    def test_concurrent_writes_and_reads(self):
+        async def scenario():
+            async with FinanceService(self.test_db, readers=4) as service:
+                self.assertTrue(await service.register("asyncuser", "pw"))
+                token = await service.login("asyncuser", "pw")
+                self.assertIsNotNone(token)
+
+                results = await asyncio.gather(
+                    *[service.add_transaction(token, 4, "1.25", f"write {i}") for i in range(40)],
+                    *[service.list_transactions(token, 5) for _ in range(10)])
+                self.assertTrue(all(results[:40]))
+                page = await service.transactions_page(token, 100)
+                summary = await service.monthly_summary(token, int(page[0].date[5:7]), int(page[0].date[:4]))
+
+                await service.logout(token)
+                with self.assertRaises(PermissionError):
+                    await service.list_transactions(token)
+                with self.assertRaises(PermissionError):
+                    await service.add_transaction("forged", 4, "1.00")
+                return page, summary
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            page, summary = asyncio.run(scenario())
+        self.assertEqual(len(page), 40)
+        self.assertEqual(summary.total_expenses, Money(5000))
+
+    def test_timeouts_and_backpressure(self):
+        async def scenario():
+            async with FinanceService(self.test_db, readers=2, max_pending=1, timeout=0.05) as service:
+                with self.assertRaises(asyncio.TimeoutError):
+                    await service.read(slow_call, 0.2)
+                # The only slot is taken, so this call times out waiting for it
+                running = asyncio.ensure_future(service.read(slow_call, 0.15, timeout=1))
+                await asyncio.sleep(0.01)
+                with self.assertRaises(asyncio.TimeoutError):
+                    await service.read(slow_call, 0)
+                self.assertEqual(await running, 0.15)
+
+        asyncio.run(scenario())
+
+
+class TestWriteQueue(DatabaseTestCase):
+    test_db = "test_write_queue.db"
+
+    def test_concurrent_producers_share_commits(self):
+        with WriteQueue(self.test_db, max_batch=64, max_latency=0.01) as writes:
+            futures = []
+
+            def produce(n):
+                for i in range(25):
+                    futures.append(writes.add_transaction(50, 4, "2.00", f"producer {n} write {i}"))
+
+            threads = [threading.Thread(target=produce, args=(n,)) for n in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            ids = [future.result(timeout=5) for future in futures]
+
+        self.assertEqual(len(set(ids)), 200)
+        self.assertEqual(writes.writes, 200)
+        self.assertLess(writes.batches, 200)
+        count, total = get_connection(self.test_db).execute(
+            "SELECT COUNT(*), SUM(amount) FROM transactions WHERE user_id = 50").fetchone()
+        self.assertEqual((count, total), (200, 40000))
+
+    def test_failed_write_does_not_abort_batch(self):
+        with WriteQueue(self.test_db, max_latency=0.05) as writes:
+            good = writes.add_transaction(51, 4, "3.00", "kept")
+            bad = writes.add_transaction(51, 4, "not money", "rejected")
+            updated = writes.update_transaction(good.result(timeout=5), 51, amount="4.50")
+            foreign = writes.delete_transaction(good.result(timeout=5), 52)
+            unknown = writes.add_transaction(51, 999, "5.00", "no such category")
+            recategorized = writes.update_transaction(good.result(timeout=5), 51, category_id=999)
+
+            with self.assertRaises(ValueError):
+                bad.result(timeout=5)
+            for future in (unknown, recategorized):
+                with self.assertRaisesRegex(ValueError, "Invalid category"):
+                    future.result(timeout=5)
+            self.assertTrue(updated.result(timeout=5))
+            self.assertFalse(foreign.result(timeout=5))
+
+        self.assertRaises(RuntimeError, writes.add_transaction, 51, 4, "1.00")
+        rows = get_connection(self.test_db).execute(
+            "SELECT amount, description FROM transactions WHERE user_id = 51").fetchall()
+        self.assertEqual(rows, [(450, "kept")])
+
+    def test_service_group_commit(self):
+        async def scenario():
+            token = auth.sessions.create(53)
+            async with FinanceService(self.test_db, group_commit=True) as service:
+                ids = await asyncio.gather(*[service.add_transaction(token, 4, "1.00") for _ in range(20)])
+                deleted = await service.delete_transaction(ids[0], token)
+                return ids, deleted
+
+        ids, deleted = asyncio.run(scenario())
+        self.assertEqual(len(set(ids)), 20)
+        self.assertTrue(deleted)
+
+    def test_failed_submit_releases_its_slot(self):
+        async def scenario():
+            token = auth.sessions.create(54)
+            async with FinanceService(self.test_db, max_pending=1, timeout=1, group_commit=True) as service:
+                service._write_queues[self.test_db].close()
+                for _ in range(2):
+                    with self.assertRaises(RuntimeError):
+                        await service.add_transaction(token, 4, "1.00")
+                return await service.read(slow_call, 0)
+
+        self.assertEqual(asyncio.run(scenario()), 0)
+
+
+# Inserts into the database named by argv[1] for 6 seconds, as fast as it can
+STEADY_WRITER = """
+import sqlite3, sys, time
+conn = sqlite3.connect(sys.argv[1])
+conn.execute('PRAGMA synchronous=OFF')
+print(flush=True)
+deadline = time.monotonic() + 6
+while time.monotonic() < deadline:
+    conn.execute("INSERT INTO transactions (user_id, category_id, amount, description, date) "
+                 "VALUES (61, 4, 100, 'steady', '2025-01-06 09:00:00')")
+    conn.commit()
+"""
+
+
+class TestBackup(DatabaseTestCase):
+    test_db = "test_backup.db"
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.backup_dir = os.path.join(self.tmp.name, "backups")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_incremental_restore_matches_live_database(self):
+        self.insert_transactions([(60, 4, 10.00, "first", "2025-01-05 09:00:00"),
+                                  (60, 4, 20.00, "second", "2025-01-06 09:00:00")])
+        full = backup.backup_database(self.test_db, self.backup_dir, pages=1)
+
+        conn = get_connection(self.test_db)
+        first_id = conn.execute("SELECT MIN(id) FROM transactions WHERE user_id = 60").fetchone()[0]
+        with contextlib.redirect_stdout(io.StringIO()):
+            update_transaction(first_id, 60, amount=15, db_file=self.test_db)
+            delete_transaction(first_id + 1, 60, db_file=self.test_db)
+            add_transaction(60, 5, 99, db_file=self.test_db)
+        changes = backup.export_changes(self.test_db, self.backup_dir)
+
+        self.assertEqual(changes["seq"] - full["seq"], 3)
+        with gzip.open(os.path.join(self.backup_dir, changes["file"]), "rt") as f:
+            self.assertEqual(len(f.readlines()), 3)
+
+        target = os.path.join(self.tmp.name, "restored.db")
+        backup.restore_backup(changes["file"], target, self.backup_dir)
+        restored = sqlite3.connect(target)
+        try:
+            rows = restored.execute("SELECT id, amount FROM transactions ORDER BY id").fetchall()
+        finally:
+            restored.close()
+        self.assertEqual(rows, conn.execute("SELECT id, amount FROM transactions ORDER BY id").fetchall())
+        self.assertEqual(backup.verify_backup(full["file"], self.backup_dir), [])
+
+    def test_full_backup_finishes_under_steady_writes(self):
+        db_file = os.path.join(self.tmp.name, "busy.db")
+        initialize_database(db_file)
+        # Enough pages that one pass of the copy outlasts many writes
+        with contextlib.closing(sqlite3.connect(db_file)) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executemany("INSERT INTO transactions (user_id, category_id, amount, description, date) "
+                             "VALUES (61, 4, 100, ?, '2025-01-05 09:00:00')", [("x" * 2000,)] * 4000)
+            conn.commit()
+        get_connection(db_file)
+        # Another process, so the writes do not wait on the GIL
+        writer = subprocess.Popen([sys.executable, "-c", STEADY_WRITER, db_file], stdout=subprocess.PIPE)
+        try:
+            writer.stdout.readline()
+            start = time.monotonic()
+            entry = backup.backup_database(db_file, self.backup_dir, pages=1)
+            elapsed = time.monotonic() - start
+        finally:
+            writer.kill()
+            writer.wait()
+            writer.stdout.close()
+        self.assertLess(elapsed, 3)
+        self.assertEqual(backup.verify_backup(entry["file"], self.backup_dir), [])
+        self.assertGreaterEqual(entry["transactions"], 4000)
+
+    def test_verify_detects_corruption_and_rotation_prunes(self):
+        self.assertRaises(ValueError, backup.export_changes, self.test_db, self.backup_dir)
+        names = [backup.backup_database(self.test_db, self.backup_dir)["file"] for _ in range(3)]
+        names.append(backup.export_changes(self.test_db, self.backup_dir)["file"])
+
+        removed = backup.rotate_backups(self.backup_dir, keep=2, db_file=self.test_db)
+        self.assertEqual(removed, names[:1])
+        self.assertEqual([entry["file"] for entry in backup.load_manifest(self.backup_dir)], names[1:])
+        self.assertFalse(os.path.exists(os.path.join(self.backup_dir, names[0])))
+
+        with open(os.path.join(self.backup_dir, names[1]), "r+b") as f:
+            f.seek(20)
+            f.write(b"corrupt")
+        problems = backup.verify_backup(names[1], self.backup_dir)
+        self.assertEqual(len(problems), 1)
+        self.assertIn("checksum", problems[0])
+
+
+@unittest.skipUnless(numpy, "analytics needs numpy")
+class TestAnalytics(DatabaseTestCase):
+    test_db = "test_analytics.db"
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls().insert_transactions([
+            (70, 4, 10.00, "", "2023-11-15 12:00:00"),
+            (70, 4, 30.00, "", "2024-01-02 12:00:00"),
+            (71, 4, 20.00, "", "2024-01-31 23:59:59"),
+            (71, 5, 800.00, "", "2024-03-01 00:00:00"),
+            (70, 1, 3000.00, "", "2024-03-05 09:00:00"),
+            (71, 4, 25.55, "", "2025-02-10 09:00:00"),
+        ])
+
+    def test_load_ledger_types_and_filters(self):
+        ledger = analytics.load_ledger(self.test_db, chunk_size=4)
+        self.assertEqual(len(ledger), 6)
+        self.assertEqual((ledger.days.dtype, ledger.category_ids.dtype, ledger.amounts.dtype),
+                         (numpy.int64, numpy.int32, numpy.int64))
+        self.assertEqual(str(numpy.datetime64(int(ledger.days.min()), 'D')), "2023-11-15")
+        self.assertEqual(int(ledger.amounts.sum()), 388555)
+
+        subset = analytics.load_ledger(self.test_db, user_ids=[71], start_date="2024-01-01",
+                                       end_date="2025-01-01")
+        self.assertEqual(sorted(subset.amounts.tolist()), [2000, 80000])
+
+    def test_trends_rolling_average_and_percentiles(self):
+        ledger = analytics.load_ledger(self.test_db)
+        food = [trend for trend in analytics.yearly_trends(ledger, kind="expense")
+                if trend.category == "Food"]
+        self.assertEqual([(t.year, t.total, t.count) for t in food],
+                         [(2023, 10.00, 1), (2024, 50.00, 2), (2025, Money.of("25.55"), 1)])
+        self.assertIsNone(food[0].change)
+        self.assertAlmostEqual(food[1].change, 4.0)
+        self.assertAlmostEqual(food[2].change, -0.489)
+
+        rolling = analytics.rolling_average(ledger, window=3)
+        self.assertEqual(rolling[0][:3], (2023, 11, 10.00))
+        self.assertEqual(len(rolling), 16)
+        january = rolling[2]
+        self.assertEqual((january.year, january.month, january.total, january.average),
+                         (2024, 1, 50.00, Money.of("20.00")))
+        self.assertEqual(rolling[4].average, Money.of("283.33"))
+
+        spread = {p.category: p for p in analytics.category_percentiles(ledger, (0, 50, 90))}
+        self.assertEqual(spread["Food"].count, 4)
+        expected = numpy.percentile([1000, 3000, 2000, 2555], [0, 50, 90])
+        self.assertEqual([money.cents for money in spread["Food"].percentiles.values()],
+                         numpy.rint(expected).astype(int).tolist())
+
+
+class TestProfiling(DatabaseTestCase):
+    test_db = "test_profiling.db"
+
+    def tearDown(self):
+        profiling.disable()
+
+    def test_snapshot_counts_statements_and_rows(self):
+        self.insert_transactions([(80, 4, 5.00, "", f"2025-03-{day:02d} 10:00:00") for day in range(1, 8)])
+        profiling.enable()
+        for limit in (3, 5):
+            self.assertEqual(len(list_transactions(80, limit, db_file=self.test_db)), limit)
+        with contextlib.redirect_stdout(io.StringIO()):
+            add_transaction(80, 4, 1, db_file=self.test_db)
+
+        profiles = {profile.sql.split()[0]: profile for profile in profiling.snapshot()
+                    if "transactions" in profile.sql or profile.sql == "COMMIT"}
+        select, insert = profiles["SELECT"], profiles["INSERT"]
+        self.assertEqual((select.count, select.rows), (2, 8))
+        self.assertEqual((insert.count, insert.rows), (1, 0))
+        self.assertGreaterEqual(select.p99_ms, select.mean_ms * 0.5)
+        self.assertGreaterEqual(profiles["COMMIT"].count, 1)
+
+        profiling.reset()
+        self.assertEqual(profiling.snapshot(), [])
+
+    def test_slow_statements_are_logged_with_plan(self):
+        profiling.enable(slow_threshold=0)
+        with self.assertLogs("profiling", "WARNING") as logs:
+            get_monthly_summary(81, 3, 2025, db_file=self.test_db)
+        report = next(line for line in logs.output if "monthly_rollups" in line)
+        self.assertIn("USING PRIMARY KEY", report)
+
+
+class TestCategoryCatalog(DatabaseTestCase):
+    test_db = "test_categories.db"
+
+    def count_queries(self, func, *args, **kwargs):
+        statements = []
+        conn = get_connection(self.test_db)
+        conn.set_trace_callback(statements.append)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = func(*args, **kwargs)
+        finally:
+            conn.set_trace_callback(None)
+        return result, [sql for sql in statements if "categories" in sql]
+
+    def test_catalog_is_cached_until_invalidated(self):
+        categories.invalidate()
+        first, queries = self.count_queries(list_categories, db_file=self.test_db)
+        self.assertEqual(len(queries), 1)
+        second, queries = self.count_queries(list_categories, db_file=self.test_db)
+        self.assertEqual((second, queries), (first, []))
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            new_id = categories.add_category("Travel", "expense", db_file=self.test_db)
+        self.assertIn(("Travel", "expense"), [(c.name, c.type) for c in list_categories(db_file=self.test_db)])
+        self.assertEqual(categories.get_catalog(self.test_db).find("travel").id, new_id)
+
+    def test_writes_validate_against_catalog_and_reports_skip_join(self):
+        self.assertFalse(self.count_queries(add_transaction, 90, 999, 5, db_file=self.test_db)[0])
+        self.assertFalse(self.count_queries(set_budget, 90, 1, 100, 3, 2025, db_file=self.test_db)[0])
+        self.assertTrue(self.count_queries(set_budget, 90, "4", 100, 3, 2025, db_file=self.test_db)[0])
+        self.insert_transactions([(90, 4, 30.00, "", "2025-03-02 10:00:00"),
+                                  (90, 1, 500.00, "", "2025-03-03 10:00:00")])
+
+        summary, queries = self.count_queries(get_monthly_summary, 90, 3, 2025, db_file=self.test_db)
+        self.assertEqual(queries, [])
+        self.assertEqual((summary.income_by_category, summary.expenses_by_category),
+                         ([("Salary", 500.0)], [("Food", 30.0)]))
+        statuses, queries = self.count_queries(get_budget_status, 90, 3, 2025, db_file=self.test_db)
+        self.assertEqual(queries, [])
+        self.assertEqual([(s.category_name, s.spent) for s in statuses], [("Food", 30.0)])
+
+
+class TestReportCache(DatabaseTestCase):
+    test_db = "test_report_cache.db"
+
+    def setUp(self):
+        report_cache.configure()
+        self.insert_transactions([(95, 4, 40.00, "Groceries", "2025-03-05 10:00:00"),
+                                  (95, 1, 900.00, "Salary", "2025-04-01 09:00:00")])
+        # Raw inserts bypass invalidation
+        report_cache.clear()
+
+    def tearDown(self):
+        conn = get_connection(self.test_db)
+        conn.execute('DELETE FROM transactions')
+        conn.execute('DELETE FROM budgets')
+        conn.commit()
+        report_cache.configure()
+
+    def reports(self):
+        return (get_monthly_summary(95, 3, 2025, db_file=self.test_db),
+                get_monthly_summary(95, 4, 2025, db_file=self.test_db),
+                get_yearly_summary(95, 2025, db_file=self.test_db),
+                get_budget_status(95, 3, 2025, db_file=self.test_db))
+
+    def test_repeated_reports_are_served_from_cache(self):
+        first = self.reports()
+        self.assertEqual(report_cache.stats()[:2], (0, 4))
+        second = self.reports()
+        self.assertTrue(all(a is b for a, b in zip(first, second)))
+        stats = report_cache.stats()
+        self.assertEqual((stats.hits, stats.misses, stats.size), (4, 4, 4))
+        self.assertEqual(stats.hit_rate, 0.5)
+
+    def test_writes_invalidate_only_their_user_and_period(self):
+        march, april, year, budgets = self.reports()
+        transaction_id = get_connection(self.test_db).execute(
+            "SELECT id FROM transactions WHERE description = 'Groceries'").fetchone()[0]
+
+        quietly(update_transaction, transaction_id, 95, description="Market", db_file=self.test_db)
+        self.assertIs(self.reports()[0], march)
+
+        quietly(update_transaction, transaction_id, 95, amount="55.00", db_file=self.test_db)
+        new_march, new_april, new_year, new_budgets = self.reports()
+        self.assertEqual(new_march.total_expenses, Money.of("55.00"))
+        self.assertEqual(new_year.total_expenses, Money.of("55.00"))
+        self.assertIs(new_april, april)
+        self.assertIsNot(new_budgets, budgets)
+
+        quietly(set_budget, 95, 4, 100, 3, 2025, db_file=self.test_db)
+        after_budget = self.reports()
+        self.assertIs(after_budget[0], new_march)
+        self.assertEqual([(b.category_name, b.spent) for b in after_budget[3]], [("Food", 55.0)])
+
+        quietly(delete_transaction, transaction_id, 95, db_file=self.test_db)
+        self.assertEqual(self.reports()[0].total_expenses, Money(0))
+        self.assertEqual(report_cache.stats().invalidations, 7)
+
+    def test_queued_and_bulk_writes_invalidate(self):
+        self.reports()
+        with WriteQueue(self.test_db) as writes:
+            writes.add_transaction(95, 4, "10.00", "Lunch", "2025-03-20 12:00:00").result()
+        self.assertEqual(self.reports()[0].total_expenses, Money.of("50.00"))
+
+        quietly(bulk_add_transactions, 95, [("Salary", "100.00", "Bonus", "2025-04-15 12:00:00")],
+                db_file=self.test_db)
+        march, april, year, _ = self.reports()
+        self.assertEqual((march.total_expenses, april.total_income, year.total_income),
+                         (Money.of("50.00"), Money.of("1000.00"), Money.of("1000.00")))
+
+    def test_cache_is_bounded_least_recently_used_first(self):
+        report_cache.configure(maxsize=2)
+        march, april, year, _ = self.reports()
+        stats = report_cache.stats()
+        self.assertEqual((stats.size, stats.evictions), (2, 2))
+        self.assertIsNot(get_monthly_summary(95, 3, 2025, db_file=self.test_db), march)
+        self.assertIsNot(get_yearly_summary(95, 2025, db_file=self.test_db), year)
+
+
+class TestSharding(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.catalog = os.path.join(self.tmp.name, "catalog.db")
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.shards = sharding.create_shards(self.catalog, 2)
+            register_user("shard1", "pw", db_file=self.catalog)
+            for user_id in range(1, 13):
+                for _ in range(2):
+                    add_transaction(user_id, 4, "10.00", "Lunch", db_file=self.shards.shard_for(user_id))
+        self.today = datetime.now()
+
+    def tearDown(self):
+        close_connections()
+        self.tmp.cleanup()
+
+    def ledger(self, db_file):
+        conn = get_connection(db_file)
+        return conn.execute("SELECT id, user_id, amount FROM transactions ORDER BY id").fetchall()
+
+    def test_jump_hash_is_stable_and_moves_few_keys(self):
+        self.assertEqual([sharding.jump_hash(key, 1) for key in range(5)], [0] * 5)
+        before = [sharding.jump_hash(key, 4) for key in range(10000)]
+        after = [sharding.jump_hash(key, 5) for key in range(10000)]
+        moved = [(a, b) for a, b in zip(before, after) if a != b]
+        self.assertTrue(all(b == 4 for _, b in moved))
+        self.assertAlmostEqual(len(moved) / 10000, 0.2, delta=0.02)
+
+    def test_users_route_to_their_shard_with_unique_ids(self):
+        rows = {path: self.ledger(path) for path in self.shards}
+        for index, path in enumerate(self.shards):
+            self.assertTrue(rows[path])
+            self.assertEqual({user_id for _, user_id, _ in rows[path]},
+                             {u for u in range(1, 13) if self.shards.shard_index(u) == index})
+            self.assertTrue(all(i >> sharding.ID_RANGE_BITS == index + 1 for i, _, _ in rows[path]))
+        self.assertEqual(sharding.ShardMap.load(self.catalog).shard_files, self.shards.shard_files)
+        self.assertEqual(sharding.category_totals(self.shards, self.today.year, self.today.month),
+                         [("Food", Money.of("240.00"))])
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            category_id = sharding.add_category(self.shards, "Pets", "expense")
+            self.assertTrue(add_transaction(1, category_id, "5", db_file=self.shards.shard_for(1)))
+
+    def test_rebalance_moves_users_and_keeps_their_data(self):
+        summaries = {u: get_monthly_summary(u, self.today.month, self.today.year,
+                                            db_file=self.shards.shard_for(u)).total_expenses
+                     for u in range(1, 13)}
+        ids = sorted(row for path in self.shards for row in self.ledger(path))
+
+        moved = sharding.rebalance(self.catalog, 3, batch=2)
+        shards = sharding.ShardMap.load(self.catalog)
+        self.assertEqual(len(shards), 3)
+        self.assertEqual(moved, sum(self.shards.shard_index(u) != shards.shard_index(u) for u in range(1, 13)))
+        self.assertGreater(moved, 0)
+        self.assertEqual(sorted(row for path in shards for row in self.ledger(path)), ids)
+        for u in range(1, 13):
+            summary = get_monthly_summary(u, self.today.month, self.today.year, db_file=shards.shard_for(u))
+            self.assertEqual(summary.total_expenses, summaries[u])
+        self.assertEqual(verify_rollups(shards.shard_files[2]), [])
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            for u in range(1, 13):
+                add_transaction(u, 4, "1.00", db_file=shards.shard_for(u))
+        all_ids = [row[0] for path in shards for row in self.ledger(path)]
+        self.assertEqual(len(all_ids), len(set(all_ids)))
+        self.assertEqual(sharding.rebalance(self.catalog, 3), 0)
+
+    def test_rebalance_refuses_archived_years(self):
+        archive.compact_year(2001, db_file=self.shards.shard_files[1])
+        with self.assertRaises(ValueError):
+            sharding.rebalance(self.catalog, 3)
+        self.assertEqual(len(sharding.ShardMap.load(self.catalog)), 2)
+        self.assertFalse(os.path.exists(sharding._shard_path(self.catalog, 2)))
+
+    def test_service_routes_per_user(self):
+        async def scenario():
+            async with FinanceService(shards=self.shards, group_commit=True) as service:
+                tokens = {u: auth.sessions.create(u) for u in range(1, 13)}
+                tokens[1] = await service.login("shard1", "pw")
+                self.assertIsNotNone(tokens[1])
+                await asyncio.gather(*[service.add_transaction(tokens[u], 4, "2.00") for u in range(1, 13)])
+                for u in range(1, 13):
+                    await service.set_budget(tokens[u], 4, 50, self.today.month, self.today.year)
+                return await service.budget_statuses(range(1, 13), self.today.month, self.today.year)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            statuses = asyncio.run(scenario())
+        self.assertEqual([(s.user_id, s.spent) for s in statuses], [(u, 22.0) for u in range(1, 13)])
+        for path in self.shards:
+            self.assertTrue(all(amount in (1000, 200) for _, _, amount in self.ledger(path)))
+        self.assertEqual(sum(len(self.ledger(path)) for path in self.shards), 36)
+
+
+class TestBatchReports(DatabaseTestCase):
+    test_db = "test_batch_reports.db"
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        conn = sqlite3.connect(cls.test_db)
+        conn.executemany("INSERT INTO users (id, username, password) VALUES (?, ?, '')",
+                         [(u, f"batch{u}") for u in range(1, 8)])
+        conn.commit()
+        conn.close()
+        cls.insert_transactions([(u, 4, u * 10, "Food", "2025-05-10 12:00:00") for u in range(1, 8)]
+                                + [(3, 1, 1000, "Pay", "2025-05-01 09:00:00")])
+        with contextlib.redirect_stdout(io.StringIO()):
+            set_budget(2, 4, 15, 5, 2025, db_file=cls.test_db)
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_jsonl_and_csv_output(self):
+        out = os.path.join(self.tmp.name, "reports.jsonl")
+        self.assertEqual(run_batch(5, 2025, out, db_file=self.test_db, workers=2, chunk_size=3), 7)
+        with open(out) as f:
+            records = sorted((json.loads(line) for line in f), key=lambda record: record["user_id"])
+        self.assertEqual([record["expenses"] for record in records], [f"{u * 10}.00" for u in range(1, 8)])
+        self.assertEqual(records[2]["income_by_category"], {"Salary": "1000.00"})
+        self.assertEqual(records[1]["budgets"], [{"category": "Food", "budget": "15.00", "spent": "20.00",
+                                                  "remaining": "-5.00", "percentage": 133.3}])
+        self.assertFalse(os.path.exists(out + ".checkpoint"))
+
+        out = os.path.join(self.tmp.name, "reports.csv")
+        run_batch(5, 2025, out, db_file=self.test_db, workers=1, chunk_size=4)
+        with open(out, newline="") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(rows[1]["over_budget"], "1")
+
+    def test_interrupted_run_resumes_without_duplicates(self):
+        out = os.path.join(self.tmp.name, "reports.jsonl")
+
+        def interrupt(done, total):
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            run_batch(5, 2025, out, db_file=self.test_db, workers=1, chunk_size=2, progress=interrupt)
+        with open(out, "a") as f:
+            f.write('{"user_id": 99, "partial')
+
+        self.assertEqual(run_batch(5, 2025, out, db_file=self.test_db, workers=1, chunk_size=2), 5)
+        with open(out) as f:
+            user_ids = sorted(json.loads(line)["user_id"] for line in f)
+        self.assertEqual(user_ids, list(range(1, 8)))
+        with self.assertRaises(ValueError):
+            with open(out + ".checkpoint", "w") as f:
+                f.write(json.dumps({"db": "other.db"}) + "\n")
+            run_batch(5, 2025, out, db_file=self.test_db)
+
+    def test_resume_before_the_first_chunk_keeps_the_csv_header(self):
+        out = os.path.join(self.tmp.name, "reports.csv")
+        with mock.patch("batch_reports.as_completed", side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                run_batch(5, 2025, out, db_file=self.test_db, workers=1, chunk_size=2)
+        with open(out, "a") as f:
+            f.write("99,5,2025,partial")
+
+        self.assertEqual(run_batch(5, 2025, out, db_file=self.test_db, workers=1, chunk_size=2), 7)
+        with open(out, newline="") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(sorted(int(row["user_id"]) for row in rows), list(range(1, 8)))
+
+    def test_deleted_output_starts_the_job_over(self):
+        out = os.path.join(self.tmp.name, "reports.jsonl")
+
+        def interrupt(done, total):
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            run_batch(5, 2025, out, db_file=self.test_db, workers=1, chunk_size=2, progress=interrupt)
+        os.remove(out)
+
+        self.assertEqual(run_batch(5, 2025, out, db_file=self.test_db, workers=1, chunk_size=2), 7)
+        with open(out) as f:
+            self.assertEqual(sorted(json.loads(line)["user_id"] for line in f), list(range(1, 8)))
+        self.assertFalse(os.path.exists(out + ".checkpoint"))
+
+
+class TestRecurring(DatabaseTestCase):
+    test_db = "test_recurring.db"
+
+    def setUp(self):
+        conn = get_connection(self.test_db)
+        conn.execute('DELETE FROM recurring_rules')
+        conn.execute('DELETE FROM transactions')
+        conn.commit()
+
+    def add_rule(self, *args, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return recurring.add_rule(*args, db_file=self.test_db, **kwargs)
+
+    def posted(self):
+        return get_connection(self.test_db).execute(
+            'SELECT category_id, amount, date FROM transactions ORDER BY id').fetchall()
+
+    def test_occurrences_keep_the_day_of_month(self):
+        start = datetime(2025, 1, 31, 8, 30)
+        self.assertEqual([recurring.occurrence(start, 'monthly', 1, n).date().isoformat() for n in range(4)],
+                         ['2025-01-31', '2025-02-28', '2025-03-31', '2025-04-30'])
+        leap = datetime(2024, 2, 29)
+        self.assertEqual([recurring.occurrence(leap, 'yearly', 1, n).date().isoformat() for n in (1, 4)],
+                         ['2025-02-28', '2028-02-29'])
+        self.assertEqual(recurring.occurrence(start, 'weekly', 2, 3), datetime(2025, 3, 14, 8, 30))
+
+    def test_catch_up_is_batched_and_idempotent(self):
+        rent = self.add_rule(91, 5, '1500', 'Rent', 'monthly', '2025-01-31')
+        self.add_rule(91, 1, '3000', 'Salary', 'weekly', '2025-01-01 09:00:00', interval=2,
+                      end_date='2025-02-20')
+        self.assertIsNone(self.add_rule(91, 99, '1', 'Bad', 'monthly', '2025-01-01'))
+        self.assertIsNone(self.add_rule(91, 5, '1', 'Bad', 'hourly', '2025-01-01'))
+        self.assertEqual(get_monthly_summary(91, 3, 2025, db_file=self.test_db).total_expenses, Money(0))
+
+        statements = []
+        conn = get_connection(self.test_db)
+        conn.set_trace_callback(statements.append)
+        try:
+            self.assertEqual(recurring.post_due(datetime(2025, 3, 31), db_file=self.test_db), 7)
+        finally:
+            conn.set_trace_callback(None)
+        self.assertEqual([sql for sql in statements if sql in ('BEGIN IMMEDIATE', 'COMMIT')],
+                         ['BEGIN IMMEDIATE', 'COMMIT'])
+        self.assertEqual([date[:10] for _, _, date in self.posted()],
+                         ['2025-01-01', '2025-01-15', '2025-01-29', '2025-01-31', '2025-02-12',
+                          '2025-02-28', '2025-03-31'])
+        self.assertEqual(get_monthly_summary(91, 3, 2025, db_file=self.test_db).total_expenses,
+                         Money.of("1500"))
+
+        self.assertEqual(recurring.post_due(datetime(2025, 3, 31), db_file=self.test_db), 0)
+        self.assertEqual(recurring.post_due(datetime(2025, 5, 1), db_file=self.test_db), 1)
+        rules = recurring.list_rules(91, db_file=self.test_db)
+        self.assertEqual([(rule.id, rule.next_due) for rule in rules],
+                         [(rent, '2025-05-31 00:00:00'), (rent + 1, None)])
+        self.assertEqual(recurring.next_due(self.test_db), datetime(2025, 5, 31))
+
+    def test_limit_takes_the_most_overdue_rules(self):
+        self.add_rule(92, 4, '5', 'Coffee', 'daily', '2025-06-01')
+        self.add_rule(92, 8, '60', 'Phone', 'monthly', '2025-05-10')
+        self.assertEqual(recurring.post_due(datetime(2025, 6, 2), limit=1, db_file=self.test_db), 1)
+        self.assertEqual({category_id for category_id, _, _ in self.posted()}, {8})
+        self.assertEqual(recurring.post_due(datetime(2025, 6, 2), limit=1, db_file=self.test_db), 2)
+
+    def test_scheduler_posts_due_rules_in_background(self):
+        self.add_rule(93, 5, '900', 'Rent', 'monthly', '2025-01-01')
+        with recurring.Scheduler(self.test_db, max_sleep=0.05) as scheduler:
+            deadline = time.monotonic() + 5
+            while not self.posted() and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertGreater(scheduler.posted, 0)
+        self.assertEqual(len(self.posted()), scheduler.posted)
+
+    def test_archived_years_are_skipped(self):
+        rent = self.add_rule(94, 5, '800', 'Rent', 'monthly', '2023-11-01')
+        archive.compact_year(2024, db_file=self.test_db)
+        self.addCleanup(self.reopen_archived_years)
+        self.assertIsNone(self.add_rule(94, 5, '1', 'Late', 'monthly', '2024-06-01'))
+
+        self.assertEqual(recurring.post_due(datetime(2025, 2, 1), db_file=self.test_db), 4)
+        self.assertEqual([date[:10] for _, _, date in self.posted()],
+                         ['2023-11-01', '2023-12-01', '2025-01-01', '2025-02-01'])
+        self.assertEqual([(rule.id, rule.next_due) for rule in recurring.list_rules(94, db_file=self.test_db)],
+                         [(rent, '2025-03-01 00:00:00')])
+
+    def reopen_archived_years(self):
+        with database.connection(self.test_db) as conn:
+            conn.execute('DELETE FROM archived_years')
+
+
+
+class TestArchive(DatabaseTestCase):
+    test_db = "test_archive.db"
+
+    class Interrupted(Exception):
+        pass
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.insert_transactions(
+            [(40, 4, float(i + 1), f"2020 row {i}", f"2020-{i % 12 + 1:02d}-15 12:00:00") for i in range(7)]
+            + [(40, 1, 100.0 + i, f"2021 row {i}", f"2021-0{i + 1}-01 09:00:00") for i in range(3)]
+            + [(40, 5, 50.0, f"2022 row {i}", f"2022-0{i + 1}-01 09:00:00") for i in range(4)]
+            + [(41, 4, 9.0, "other user", "2020-06-01 10:00:00")])
+        conn = get_connection(cls.test_db)
+        cls.history = [row[0] for row in conn.execute(
+            'SELECT id FROM transactions WHERE user_id=40 ORDER BY date DESC, id DESC')]
+        cls.yearly = get_yearly_summary(40, 2020, db_file=cls.test_db)
+        cls.logged = conn.execute('SELECT COUNT(*) FROM change_log').fetchone()[0]
+
+        # The 2020 move is interrupted after its first batch and resumed
+        def interrupt(moved):
+            raise cls.Interrupted()
+        with contextlib.suppress(cls.Interrupted):
+            archive.compact_year(2020, batch_size=3, pause=0, progress=interrupt, db_file=cls.test_db)
+        cls.partial = [row.id for row in iter_transactions(40, page_size=2, db_file=cls.test_db)]
+        cls.moved = archive.compact_year(2020, batch_size=3, pause=0, db_file=cls.test_db)
+        archive.compact_year(2021, batch_size=3, pause=0, db_file=cls.test_db)
+
+    def ids(self, **filters):
+        return [row.id for row in iter_transactions(40, page_size=2, db_file=self.test_db, **filters)]
+
+    def test_years_move_out_of_the_ledger(self):
+        conn = get_connection(self.test_db)
+        self.assertEqual(archive.archive_status(self.test_db), [(2020, 1, 8), (2021, 1, 3)])
+        self.assertEqual(self.moved, 5)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM transactions WHERE date < '2022'").fetchone()[0], 0)
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM transactions_2020').fetchone()[0], 8)
+        # A move is not a change: nothing is logged for sync or backups
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM change_log').fetchone()[0], self.logged)
+
+    def test_reads_route_to_archived_years(self):
+        self.assertEqual(self.partial, self.history)
+        self.assertEqual(self.ids(), self.history)
+        self.assertEqual([row.id for row in list_transactions(40, 6, db_file=self.test_db)], self.history[:6])
+        self.assertEqual(self.ids(start_date="2020-12-01", end_date="2021-03-01"), self.history[5:7])
+        self.assertEqual(get_yearly_summary(40, 2020, db_file=self.test_db), self.yearly)
+        report_cache.clear()
+        self.assertEqual(get_yearly_summary(40, 2020, db_file=self.test_db), self.yearly)
+        self.assertEqual(verify_rollups(self.test_db), [])
+
+    def test_recent_pages_skip_the_archive(self):
+        conn = get_connection(self.test_db)
+        statements = []
+        conn.set_trace_callback(statements.append)
+        try:
+            list_transactions(40, 4, db_file=self.test_db)
+            self.ids(start_date="2021-02-01", end_date="2021-06-01")
+        finally:
+            conn.set_trace_callback(None)
+        tables = re.findall(r'FROM (transactions\w*)', ' '.join(statements))
+        self.assertEqual(tables, ["transactions", "transactions_2021", "transactions_2021"])
+
+    def test_archived_years_are_closed(self):
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            self.assertEqual(bulk_add_transactions(40, [("Food", 1.0, "late", "2021-05-05 10:00:00")],
+                                                   db_file=self.test_db), 0)
+        self.assertIn("archived year", output.getvalue())
+        conn = get_connection(self.test_db)
+        with self.assertRaises(sqlite3.IntegrityError):
+            conn.execute("UPDATE transactions SET date = '2020-01-01 00:00:00' WHERE user_id = 40")
+        conn.rollback()
+        with self.assertRaises(ValueError):
+            archive.compact_year(datetime.now().year, db_file=self.test_db)
+
+
+class TestSync(unittest.TestCase):
+    """Two local databases exchanging changes"""
+    maxDiff = None
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.a = os.path.join(self.tmp.name, "a.db")
+        self.b = os.path.join(self.tmp.name, "b.db")
+        initialize_database(self.a)
+        with contextlib.redirect_stdout(io.StringIO()):
+            register_user("alice", "secret", db_file=self.a)
+        # b starts as a copy of a, as instances did before sync
+        close_connections()
+        with open(self.a, "rb") as src, open(self.b, "wb") as dst:
+            dst.write(src.read())
+        sync.init_node(self.a)
+        sync.init_node(self.b)
+        self.alice = get_connection(self.a).execute("SELECT id FROM users").fetchone()[0]
+
+    def tearDown(self):
+        close_connections()
+        self.tmp.cleanup()
+
+    def rows(self, db_file):
+        conn = get_connection(db_file)
+        return {table: conn.execute(f"SELECT * FROM {table} ORDER BY id").fetchall()
+                for table in ("users", "budgets", "transactions")}
+
+    def test_changes_flow_both_ways_in_batches(self):
+        quietly(add_transaction, self.alice, 4, 12, "Lunch", db_file=self.a)
+        quietly(add_transaction, self.alice, 1, 3000, "Salary", db_file=self.b)
+        quietly(set_budget, self.alice, 4, 300, 6, 2025, db_file=self.b)
+        quietly(change_password, self.alice, "secret", "changed", db_file=self.b)
+        seqs = [row[0] for row in get_connection(self.b).execute("SELECT seq FROM change_log ORDER BY seq")]
+        self.assertEqual(seqs, sorted(set(seqs)))
+
+        self.assertEqual(sync.sync(self.a, self.b, batch=1), (3, 1))
+        self.assertEqual(self.rows(self.a), self.rows(self.b))
+        self.assertEqual(len(self.rows(self.a)["transactions"]), 2)
+        self.assertIsNotNone(quietly(login_user, "alice", "changed", db_file=self.a))
+        # Everything was seen, so nothing travels again
+        self.assertEqual(sync.sync(self.a, self.b), (0, 0))
+        # Batches are plain data, fit for a network hop
+        batch = sync.changes_since(0, db_file=self.a)
+        self.assertEqual(json.loads(json.dumps(batch)), batch)
+
+    def test_conflicts_resolve_the_same_on_both_sides(self):
+        quietly(add_transaction, self.alice, 4, 10, "Groceries", db_file=self.a)
+        quietly(add_transaction, self.alice, 4, 20, "Snacks", db_file=self.a)
+        sync.sync(self.a, self.b)
+        first, second = [row[0] for row in self.rows(self.a)["transactions"]]
+        # Concurrent edits, with b's clock one ahead of a's at every step:
+        # both update the first row, b deletes the second while a edits it,
+        # both set one budget month and both register one username
+        quietly(update_transaction, first, self.alice, amount=11, db_file=self.a)
+        quietly(update_transaction, first, self.alice, amount=12, db_file=self.b)
+        quietly(update_transaction, first, self.alice, amount=13, db_file=self.b)
+        quietly(update_transaction, second, self.alice, description="Snacks!", db_file=self.a)
+        quietly(delete_transaction, second, self.alice, db_file=self.b)
+        quietly(set_budget, self.alice, 4, 100, 7, 2025, db_file=self.a)
+        quietly(set_budget, self.alice, 4, 200, 7, 2025, db_file=self.b)
+        quietly(register_user, "bob", "x", db_file=self.a)
+        quietly(register_user, "bob", "y", db_file=self.b)
+        bob_a = get_connection(self.a).execute("SELECT id FROM users WHERE username = 'bob'").fetchone()[0]
+        bob_b = get_connection(self.b).execute("SELECT id FROM users WHERE username = 'bob'").fetchone()[0]
+
+        sync.pull(self.a, self.b)
+        sync.pull(self.b, self.a)
+        self.assertEqual(self.rows(self.a), self.rows(self.b))
+        rows = self.rows(self.a)
+        self.assertEqual([(row[0], row[3]) for row in rows["transactions"]], [(first, 1300)])
+        self.assertEqual([row[3] for row in rows["budgets"]], [20000])
+        self.assertEqual({row[0]: row[1] for row in rows["users"]},
+                         {self.alice: "alice", bob_a: f"bob#{bob_a}", bob_b: "bob"})
+        self.assertEqual(verify_rollups(self.a), [])
+        self.assertEqual(verify_rollups(self.b), [])
+
+    def test_peers_must_be_distinct_nodes(self):
+        close_connections()
+        copy = os.path.join(self.tmp.name, "copy.db")
+        with open(self.a, "rb") as src, open(copy, "wb") as dst:
+            dst.write(src.read())
+        with self.assertRaises(ValueError):
+            sync.pull(self.a, copy)
+        sync.init_node(copy)
+        quietly(add_transaction, self.alice, 4, 5, "Tea", db_file=copy)
+        self.assertEqual(sync.pull(self.a, copy), 1)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1,35 +1,189 @@
+import re
 import sqlite3
+from sqlite3 import Error
 from datetime import datetime
-from prettytable import PrettyTable
-from database import create_connection
+from functools import partial
+from itertools import islice
+from categories import category_name, get_catalog, lookup
+from database import after_commit, connection, transaction_partitions, year_range
+from models import Transaction
+import report_cache
+from money import Money
 
 
-def add_transaction(user_id, category_id, amount, description=None):
+def insert_transaction_row(cursor, user_id, category_id, amount, description=None, date=None, touched=None):
+    """Insert a transaction on an open cursor without committing; returns its id.
+
+    The row helpers append the (user_id, date) of each transaction whose
+    amount or category they change to touched, if given, for
+    report_cache.invalidate_transactions() once the write commits.
+    """
+    date = date or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    if touched is not None:
+        touched.append((user_id, date))
+    cursor.execute('''
+    INSERT INTO transactions (user_id, category_id, amount, description, date)
+    VALUES (?, ?, ?, ?, ?)
+    ''', (user_id, category_id, Money.of(amount), description, date))
+    return cursor.lastrowid
+
+
+def insert_transaction_rows(cursor, rows):
+    """Insert (user_id, category_id, cents, description, date) rows without committing.
+
+    The rows are staged in a temp table and copied into transactions by a
+    single INSERT ... SELECT, so the ledger's triggers all run within one
+    statement. FTS5 flushes its pending index changes at the end of every
+    statement, so an executemany straight into transactions would write
+    the search index once per row, several times slower.
+    """
+    cursor.execute('''
+    CREATE TEMP TABLE IF NOT EXISTS staged_transactions (
+        user_id INTEGER, category_id INTEGER, amount INTEGER, description TEXT, date TEXT
+    )
+    ''')
+    cursor.executemany('''
+    INSERT INTO staged_transactions (user_id, category_id, amount, description, date)
+    VALUES (?, ?, ?, ?, ?)
+    ''', rows)
+    cursor.execute('''
+    INSERT INTO transactions (user_id, category_id, amount, description, date)
+    SELECT user_id, category_id, amount, description, date FROM staged_transactions ORDER BY rowid
+    ''')
+    inserted = cursor.rowcount
+    cursor.execute('DELETE FROM staged_transactions')
+    return inserted
+
+
+def update_transaction_row(cursor, transaction_id, user_id, category_id=None, amount=None, description=None,
+                           touched=None):
+    """Update the given fields of a user's transaction without committing.
+
+    Returns True if a row was changed.
+    """
+    updates = []
+    params = []
+
+    if category_id is not None:
+        updates.append("category_id = ?")
+        params.append(category_id)
+
+    if amount is not None:
+        updates.append("amount = ?")
+        params.append(Money.of(amount))
+
+    if description is not None:
+        updates.append("description = ?")
+        params.append(description)
+
+    if not updates:
+        return False
+
+    params.append(transaction_id)
+    params.append(user_id)
+
+    query = f'''
+    UPDATE transactions
+    SET {', '.join(updates)}
+    WHERE id=? AND user_id=?
+    RETURNING date
+    '''
+    cursor.execute(query, params)
+    dates = cursor.fetchall()
+    # A new description alone leaves every report as it was
+    if touched is not None and (category_id is not None or amount is not None):
+        touched.extend((user_id, date) for date, in dates)
+    return bool(dates)
+
+
+def delete_transaction_row(cursor, transaction_id, user_id, touched=None):
+    """Delete a user's transaction without committing; returns True if one was removed"""
+    cursor.execute('DELETE FROM transactions WHERE id=? AND user_id=? RETURNING date',
+                   (transaction_id, user_id))
+    dates = cursor.fetchall()
+    if touched is not None:
+        touched.extend((user_id, date) for date, in dates)
+    return bool(dates)
+
+
+def add_transaction(user_id, category_id, amount, description=None, db_file=None):
     """Add a new transaction"""
-    conn = create_connection()
-    if conn is not None:
-        try:
-            cursor = conn.cursor()
-            date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            cursor.execute('''
-            INSERT INTO transactions (user_id, category_id, amount, description, date)
-            VALUES (?, ?, ?, ?, ?)
-            ''', (user_id, category_id, amount, description, date))
-            conn.commit()
-            print("Transaction added successfully!")
-            return True
-        except Error as e:
-            print(f"Error adding transaction: {e}")
-        finally:
-            conn.close()
+    try:
+        category = lookup(category_id, db_file)
+        if category is None:
+            print("Invalid category ID.")
+            return False
+
+        touched = []
+        with connection(db_file) as conn:
+            insert_transaction_row(conn.cursor(), user_id, category.id, amount, description, touched=touched)
+            after_commit(partial(report_cache.invalidate_transactions, touched, db_file), db_file)
+        print("Transaction added successfully!")
+        return True
+    except Error as e:
+        print(f"Error adding transaction: {e}")
     return False
 
 
-def update_transaction(transaction_id, user_id, category_id=None, amount=None, description=None):
+def bulk_add_transactions(user_id, rows, chunk_size=5000, db_file=None):
+    """Add many transactions from an iterable of rows.
+
+    Each row is (category, amount, description, date) where category is a
+    category id or name and date may be None for now. Rows are consumed
+    lazily and written with executemany, committing every chunk_size rows,
+    or all together with the caller's transaction when nested in a
+    connection() block. Rows with an unknown category are skipped. Returns
+    the number of rows inserted.
+    """
+    inserted = 0
+    skipped = 0
+    rows = iter(rows)
+    try:
+        catalog = get_catalog(db_file)
+        resolved = {}
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        while True:
+            batch = list(islice(rows, chunk_size))
+            if not batch:
+                break
+
+            chunk = []
+            for category, amount, description, date in batch:
+                if category not in resolved:
+                    match = catalog.find(category)
+                    resolved[category] = match.id if match else None
+                category_id = resolved[category]
+                if category_id is None:
+                    skipped += 1
+                    continue
+                chunk.append((user_id, category_id, Money.of(amount).cents, description, date or now))
+
+            # A block per chunk, so each chunk commits on its own
+            with connection(db_file) as conn:
+                insert_transaction_rows(conn.cursor(), chunk)
+                after_commit(partial(report_cache.invalidate_transactions,
+                                     {(user_id, row[4][:7]) for row in chunk}, db_file), db_file)
+            inserted += len(chunk)
+    except Error as e:
+        print(f"Error importing transactions: {e}")
+    if skipped:
+        print(f"Skipped {skipped} rows with an unknown category.")
+    return inserted
+
+
+def update_transaction(transaction_id, user_id, category_id=None, amount=None, description=None, db_file=None):
     """Update an existing transaction"""
-    conn = create_connection()
-    if conn is not None:
-        try:
+    try:
+        if category_id is not None:
+            category = lookup(category_id, db_file)
+            if category is None:
+                print("Invalid category ID.")
+                return False
+            category_id = category.id
+
+        touched = []
+        with connection(db_file) as conn:
             cursor = conn.cursor()
             # First verify the transaction belongs to the user
             cursor.execute('SELECT id FROM transactions WHERE id=? AND user_id=?', (transaction_id, user_id))
@@ -37,51 +191,24 @@ def update_transaction(transaction_id, user_id, category_id=None, amount=None, d
                 print("Transaction not found or doesn't belong to you.")
                 return False
 
-            # Build the update query based on provided fields
-            updates = []
-            params = []
-
-            if category_id is not None:
-                updates.append("category_id = ?")
-                params.append(category_id)
-
-            if amount is not None:
-                updates.append("amount = ?")
-                params.append(amount)
-
-            if description is not None:
-                updates.append("description = ?")
-                params.append(description)
-
-            if not updates:
+            if not update_transaction_row(cursor, transaction_id, user_id, category_id, amount, description,
+                                          touched):
                 print("No fields to update.")
                 return False
+            after_commit(partial(report_cache.invalidate_transactions, touched, db_file), db_file)
 
-            params.append(transaction_id)
-            params.append(user_id)
-
-            query = f'''
-            UPDATE transactions 
-            SET {', '.join(updates)} 
-            WHERE id=? AND user_id=?
-            '''
-
-            cursor.execute(query, params)
-            conn.commit()
-            print("Transaction updated successfully!")
-            return True
-        except Error as e:
-            print(f"Error updating transaction: {e}")
-        finally:
-            conn.close()
+        print("Transaction updated successfully!")
+        return True
+    except Error as e:
+        print(f"Error updating transaction: {e}")
     return False
 
 
-def delete_transaction(transaction_id, user_id):
+def delete_transaction(transaction_id, user_id, db_file=None):
     """Delete a transaction"""
-    conn = create_connection()
-    if conn is not None:
-        try:
+    try:
+        touched = []
+        with connection(db_file) as conn:
             cursor = conn.cursor()
             # Verify the transaction belongs to the user
             cursor.execute('SELECT id FROM transactions WHERE id=? AND user_id=?', (transaction_id, user_id))
@@ -89,73 +216,173 @@ def delete_transaction(transaction_id, user_id):
                 print("Transaction not found or doesn't belong to you.")
                 return False
 
-            cursor.execute('DELETE FROM transactions WHERE id=? AND user_id=?', (transaction_id, user_id))
-            conn.commit()
-            print("Transaction deleted successfully!")
-            return True
-        except Error as e:
-            print(f"Error deleting transaction: {e}")
-        finally:
-            conn.close()
+            delete_transaction_row(cursor, transaction_id, user_id, touched)
+            after_commit(partial(report_cache.invalidate_transactions, touched, db_file), db_file)
+        print("Transaction deleted successfully!")
+        return True
+    except Error as e:
+        print(f"Error deleting transaction: {e}")
     return False
 
 
-def list_categories():
-    """List all available categories"""
-    conn = create_connection()
-    if conn is not None:
-        try:
+def list_categories(db_file=None):
+    """Get all available categories"""
+    try:
+        return list(get_catalog(db_file))
+    except Error as e:
+        print(f"Error listing categories: {e}")
+    return None
+
+
+def get_transactions_page(user_id, limit=50, before=None, category_id=None, min_amount=None,
+                          max_amount=None, start_date=None, end_date=None, db_file=None):
+    """Get one page of a user's transactions, newest first.
+
+    Rows are ordered by (date, id) so ties on date page deterministically.
+    Pass the (date, id) of the last row of the previous page as before to
+    get the next one; the query seeks straight to it instead of skipping
+    rows with OFFSET. Amount bounds are inclusive, dates are [start, end).
+
+    Archived years are read from their own tables, and only those the
+    dates and cursor reach. The ledger is read first, then archived years
+    newest first until the page is full of rows newer than the next one.
+    """
+    conditions = ['user_id=?']
+    params = [user_id]
+    if before is not None:
+        conditions.append('(date, id) < (?, ?)')
+        params.extend(before)
+    if category_id is not None:
+        conditions.append('category_id=?')
+        params.append(category_id)
+    if min_amount is not None:
+        conditions.append('amount >= ?')
+        params.append(Money.of(min_amount))
+    if max_amount is not None:
+        conditions.append('amount <= ?')
+        params.append(Money.of(max_amount))
+    if start_date is not None:
+        conditions.append('date >= ?')
+        params.append(start_date)
+    if end_date is not None:
+        conditions.append('date < ?')
+        params.append(end_date)
+    params.append(limit)
+    # Nothing after the cursor's year can be on the page
+    upper = end_date
+    if before is not None:
+        upper = min(filter(None, (end_date, year_range(int(before[0][:4]))[1])))
+
+    try:
+        with connection(db_file) as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT id, name, type FROM categories ORDER BY type, name')
-            categories = cursor.fetchall()
-
-            if not categories:
-                print("No categories found.")
-                return None
-
-            table = PrettyTable()
-            table.field_names = ["ID", "Category", "Type"]
-            for cat in categories:
-                table.add_row(cat)
-
-            print(table)
-            return categories
-        except Error as e:
-            print(f"Error listing categories: {e}")
-        finally:
-            conn.close()
+            rows = []
+            for table, table_end in transaction_partitions(conn, start_date, upper):
+                if len(rows) == limit and table_end is not None and rows[-1][4] >= table_end:
+                    break
+                cursor.execute(f'''
+                SELECT id, category_id, amount, description, date
+                FROM {table}
+                WHERE {' AND '.join(conditions)}
+                ORDER BY date DESC, id DESC
+                LIMIT ?
+                ''', params)
+                rows.extend(cursor.fetchall())
+                rows.sort(key=lambda row: (row[4], row[0]), reverse=True)
+                del rows[limit:]
+            # Category names come from the cached catalog instead of a join
+            return [Transaction(id, category_name(category_id, db_file), Money(amount), description, date)
+                    for id, category_id, amount, description, date in rows]
+    except Error as e:
+        print(f"Error listing transactions: {e}")
     return None
 
 
-def list_transactions(user_id, limit=10):
-    """List recent transactions for a user"""
-    conn = create_connection()
-    if conn is not None:
-        try:
+def iter_transactions(user_id, page_size=500, db_file=None, **filters):
+    """Yield all of a user's matching transactions, newest first.
+
+    Pages are fetched lazily with get_transactions_page, so walking a full
+    history holds at most one page in memory. Accepts the same filters.
+    """
+    before = None
+    while True:
+        page = get_transactions_page(user_id, page_size, before, db_file=db_file, **filters)
+        if not page:
+            return
+        yield from page
+        if len(page) < page_size:
+            return
+        before = (page[-1].date, page[-1].id)
+
+
+def list_transactions(user_id, limit=10, db_file=None):
+    """Get recent transactions for a user"""
+    return get_transactions_page(user_id, limit, db_file=db_file)
+
+
+def _match_expression(user_id, query, prefix):
+    """Build the FTS5 query for a user's search, or None if query has no words"""
+    # Every word is quoted, so operators and punctuation typed by the user
+    # are searched for as text rather than parsed as FTS5 syntax. Folding
+    # case and accents is left to the index's tokenizer, so the query is
+    # read exactly as the descriptions were.
+    words = [word.replace('"', '""') for word in query.split() if re.search(r'[^\W_]', word)]
+    if not words:
+        return None
+    star = '*' if prefix else ''
+    terms = ' '.join(f'"{word}"{star}' for word in words)
+    return f'user_id:"{int(user_id)}" AND description:({terms})'
+
+
+def search_transactions(user_id, query, limit=20, category_id=None, start_date=None, end_date=None,
+                        prefix=True, db_file=None):
+    """Search a user's transaction descriptions, best match first.
+
+    Every word of query must appear in the description; with prefix, the
+    default, a word also matches longer words it starts, so 'gro' finds
+    'Groceries'. Matching ignores case and accents. Rows are ranked by
+    FTS5's bm25() over the description, then newest first, and SQLite
+    keeps only the best `limit` while it scans the matches. Dates are
+    [start, end). Transactions of archived years are not in the index and
+    are not searched.
+
+    Prefixes of two or three letters are read from their own indexes; a
+    longer prefix merges the index entries of every word it starts, which
+    is slow for words found in a large share of the whole ledger. Pass
+    prefix=False to match whole words only. bm25() weighs each word by how
+    many rows of the whole ledger contain it, which for such words costs
+    more than the search itself; benchmarks/bench_search.py measures it.
+    """
+    expression = _match_expression(user_id, query, prefix)
+    if expression is None:
+        return []
+    conditions = ['transactions_fts MATCH ?', 't.user_id=?']
+    params = [expression, user_id]
+    if category_id is not None:
+        conditions.append('t.category_id=?')
+        params.append(category_id)
+    if start_date is not None:
+        conditions.append('t.date >= ?')
+        params.append(start_date)
+    if end_date is not None:
+        conditions.append('t.date < ?')
+        params.append(end_date)
+
+    try:
+        with connection(db_file) as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-            SELECT t.id, c.name, t.amount, t.description, t.date 
-            FROM transactions t
-            JOIN categories c ON t.category_id = c.id
-            WHERE t.user_id=?
-            ORDER BY t.date DESC
+            # CROSS JOIN keeps the index as the outer loop, so only matches
+            # are looked up in the ledger. The user_id column gets no weight,
+            # as every match has the same one
+            cursor.execute(f'''
+            SELECT t.id, t.category_id, t.amount, t.description, t.date
+            FROM transactions_fts CROSS JOIN transactions t ON t.id = transactions_fts.rowid
+            WHERE {' AND '.join(conditions)}
+            ORDER BY bm25(transactions_fts, 1.0, 0.0), t.date DESC, t.id DESC
             LIMIT ?
-            ''', (user_id, limit))
-            transactions = cursor.fetchall()
-
-            if not transactions:
-                print("No transactions found.")
-                return None
-
-            table = PrettyTable()
-            table.field_names = ["ID", "Category", "Amount", "Description", "Date"]
-            for t in transactions:
-                table.add_row(t)
-
-            print(table)
-            return transactions
-        except Error as e:
-            print(f"Error listing transactions: {e}")
-        finally:
-            conn.close()
+            ''', (*params, limit))
+            return [Transaction(id, category_name(category_id, db_file), Money(amount), description, date)
+                    for id, category_id, amount, description, date in cursor.fetchall()]
+    except Error as e:
+        print(f"Error searching transactions: {e}")
     return None
\ No newline at end of file
@@ -0,0 +1,182 @@
+"""Group commit for transaction writes.
+
+add_transaction() and friends commit once per call, so every write pays
+for its own WAL sync, and writers on different connections queue up on
+SQLite's write lock. A WriteQueue funnels writes from any number of
+threads to one writer thread that owns the only write connection. The
+writer takes the first queued write, collects up to max_batch of them and
+commits the lot in one transaction. With the default max_latency of 0 a
+batch is whatever queued up during the previous commit; a positive
+max_latency holds the first write up to that many seconds for company,
+which only pays off when producers do not wait on each result.
+
+    with WriteQueue('finance.db') as writes:
+        future = writes.add_transaction(user_id, 4, '12.50', 'Lunch')
+        transaction_id = future.result()
+
+Categories are checked against the catalog before a write is queued, as
+transactions.add_transaction() does; a future for an unknown category
+fails with ValueError at once. Each write runs in its own savepoint, so
+one that fails is rolled back and its future gets the exception without
+affecting the rest of the batch.
+Futures resolve only after the batch has committed; if the commit itself
+fails, every write in the batch fails with that error. The cached reports
+that a batch's transaction writes affect are invalidated before its
+futures resolve.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from sqlite3 import Error
+
+import report_cache
+from categories import lookup
+from database import get_connection
+from transactions import delete_transaction_row, insert_transaction_row, update_transaction_row
+
+DEFAULT_MAX_BATCH = 256
+DEFAULT_MAX_LATENCY = 0.0
+
+_STOP = object()
+
+
+def _failed(error):
+    future = Future()
+    future.set_exception(error)
+    return future
+
+
+class WriteQueue:
+    def __init__(self, db_file=None, max_batch=DEFAULT_MAX_BATCH, max_latency=DEFAULT_MAX_LATENCY):
+        self.db_file = db_file
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.batches = 0
+        self.writes = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        # Filled by the row helpers on the writer thread only
+        self._touched = []
+        self._thread = threading.Thread(target=self._run, name='finance-write-queue', daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def submit(self, func, *args):
+        """Queue func(cursor, *args) for the next batch; returns a Future of its result"""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("WriteQueue is closed")
+            self._queue.put((future, func, args))
+        return future
+
+    def _category_id(self, category_id):
+        """The catalog's id for category_id; raises ValueError if it is unknown"""
+        category = lookup(category_id, self.db_file)
+        if category is None:
+            raise ValueError(f"Invalid category ID: {category_id!r}")
+        return category.id
+
+    def add_transaction(self, user_id, category_id, amount, description=None, date=None):
+        """Queue an insert; the future resolves to the new transaction id"""
+        try:
+            category_id = self._category_id(category_id)
+        except (ValueError, Error) as e:
+            return _failed(e)
+        return self.submit(insert_transaction_row, user_id, category_id, amount, description, date,
+                           self._touched)
+
+    def update_transaction(self, transaction_id, user_id, category_id=None, amount=None, description=None):
+        """Queue an update; the future resolves to True if the user's transaction changed"""
+        if category_id is not None:
+            try:
+                category_id = self._category_id(category_id)
+            except (ValueError, Error) as e:
+                return _failed(e)
+        return self.submit(update_transaction_row, transaction_id, user_id, category_id, amount, description,
+                           self._touched)
+
+    def delete_transaction(self, transaction_id, user_id):
+        """Queue a delete; the future resolves to True if the user's transaction was removed"""
+        return self.submit(delete_transaction_row, transaction_id, user_id, self._touched)
+
+    def close(self):
+        """Commit everything already queued, then stop the writer thread"""
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put(_STOP)
+        self._thread.join()
+
+    def _collect(self):
+        """Wait for a write, then gather more until the batch is full or max_latency passes.
+
+        Returns (batch, stopping).
+        """
+        item = self._queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        conn = get_connection(self.db_file)
+        stopping = False
+        while not stopping:
+            batch, stopping = self._collect()
+            if batch:
+                self._commit(conn, batch)
+
+    def _commit(self, conn, batch):
+        batch = [entry for entry in batch if entry[0].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        outcomes = []
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN')
+            for future, func, args in batch:
+                cursor.execute('SAVEPOINT write')
+                try:
+                    outcomes.append((future, func(cursor, *args), None))
+                except Exception as e:
+                    cursor.execute('ROLLBACK TO write')
+                    outcomes.append((future, None, e))
+                cursor.execute('RELEASE write')
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            for future, func, args in batch:
+                future.set_exception(e)
+            return
+        finally:
+            # Rolled-back writes are included, which only costs a recompute
+            touched = self._touched[:]
+            self._touched.clear()
+
+        report_cache.invalidate_transactions(touched, self.db_file)
+        self.batches += 1
+        self.writes += len(batch)
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
\ No newline at end of file